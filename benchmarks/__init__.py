@@ -0,0 +1,6 @@
+"""
+Offline micro-benchmarks for the adapter hot paths.
+
+Every module can be run on its own, e.g. ``python3 -m benchmarks.codec``; ``python3 -m benchmarks.suite``
+runs the ones that need neither root nor a network and stores their results as JSON.
+"""
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Segments of a burst that the TestServer handles while its process is busy, with every one of the
+``CAPTURES``: in a thread of the TestServer, in a dedicated capture process and from a TPACKET_V3 ring.
+A burst of the SUT's segments is injected on an interface (loopback by default) by another process, while
+a thread of the TestServer's process spins on the CPU, as abstraction and the MBT channel would, and every
+segment costs the handler some work. Needs root.
+
+Usage: ``python3 -m benchmarks.burst [iface] [frames] [busy_us]``
+"""
+
+import io
+import logging
+import multiprocessing
+import socket
+import sys
+import time
+from threading import Event, Thread
+from typing import Optional
+
+from benchmarks.capture import SUT_IP, synthetic_stream
+from tcpTester.segmentDecoder import Segment
+from tcpTester.testServer import CAPTURES, TestServer
+
+SETTLE_TIME = 0.5  # in seconds without a new segment after which the burst counts as handled
+
+
+class CountingTestServer(TestServer):
+    """
+    A TestServer that counts the captured segments instead of abstracting them, spending ``busy`` seconds
+    on every segment.
+    """
+
+    def __init__(self, busy: float, **kwargs):
+        self.busy = busy
+        self.received = 0
+        # when the last segment was handled
+        self.last = 0.0
+        super().__init__(**kwargs)
+
+    def _handle_receive_command(self, segment: Segment) -> Optional[str]:
+        deadline = time.perf_counter() + self.busy
+        while time.perf_counter() < deadline:
+            pass
+        self.received += 1
+        self.last = time.perf_counter()
+
+
+def inject(iface: str, frames: list) -> None:
+    injector = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+    injector.bind((iface, 0))
+    for frame in frames:
+        injector.send(frame)
+    injector.close()
+
+
+def spin(stop: Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def burst(capture: str, iface: str, count: int, busy: float) -> dict:
+    """
+    Injects a burst of ``count`` segments and waits until the TestServer has handled the captured ones.
+    """
+    server = CountingTestServer(busy, ts_iface=iface, sut_ip=SUT_IP, mbt_client=io.StringIO(), capture=capture)
+    stop = Event()
+    spinner = Thread(target=spin, args=(stop,), daemon=True)
+    spinner.start()
+
+    start = time.perf_counter()
+    injector = multiprocessing.get_context("spawn").Process(target=inject,
+                                                            args=(iface, synthetic_stream(count, 1.0)))
+    injector.start()
+    injector.join()
+    received = -1
+    while server.received != received:
+        received = server.received
+        time.sleep(SETTLE_TIME)
+    elapsed = time.perf_counter() - start - SETTLE_TIME
+
+    stop.set()
+    spinner.join()
+    result = {"received": received, "ratio": received / count, "seconds": elapsed}
+    if server.capture_process:
+        result.update(server.capture_process.stats())
+    if server.capture_ring:
+        result.update(server.capture_ring.stats())
+    server.close()
+    return result
+
+
+def run(iface: str = "lo", count: int = 5000, busy_us: float = 20.0) -> dict:
+    logging.getLogger("TestServer").setLevel(logging.WARNING)
+    return {capture: burst(capture, iface, count, busy_us / 1e6) for capture in CAPTURES}
+
+
+if __name__ == "__main__":
+    results = run(sys.argv[1] if len(sys.argv) > 1 else "lo",
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 5000,
+                  float(sys.argv[3]) if len(sys.argv) > 3 else 20.0)
+    for name, result in results.items():
+        fields = [f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                  for key, value in result.items()]
+        print(f"{name:8} " + "  ".join(fields))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Capture throughput of the Python ``lfilter`` path versus the kernel BPF filter on a synthetic
+frame stream. The stream is injected on an interface (loopback by default) while two capture
+sockets listen: one unfiltered that dissects and filters every frame with scapy, and one with
+the BPF program from ``tcpTester.bpf`` that only sees the SUT's segments. Needs root.
+
+Usage: ``python3 -m benchmarks.capture [iface] [frames] [match_ratio]``
+"""
+
+import socket
+import struct
+import sys
+import time
+
+from scapy.all import Raw
+from scapy.layers.l2 import Ether
+from scapy.layers.inet import IP, TCP
+
+from tcpTester.bpf import SNAP_LEN, attach_filter, sut_tcp_filter
+from tcpTester.types import MAX_PORT, MIN_PORT
+
+SUT_IP = "198.51.100.7"
+OTHER_IP = "198.51.100.8"
+DST_IP = "192.0.2.200"
+ETHER = Ether(src="02:00:00:00:00:01", dst="02:00:00:00:00:02")
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+SO_RCVBUFFORCE = 33
+
+
+def synthetic_stream(count: int, match_ratio: float) -> list:
+    """
+    Builds ``count`` frames of which roughly ``match_ratio`` are segments from the SUT's port range.
+    """
+    matching = bytes(ETHER / IP(src=SUT_IP, dst=DST_IP) / TCP(sport=MIN_PORT + 1, dport=2000, flags="A") /
+                     Raw(load=b"HelloWorld"))
+    wrong_port = bytes(ETHER / IP(src=SUT_IP, dst=DST_IP) / TCP(sport=443, dport=2000, flags="A"))
+    wrong_host = bytes(ETHER / IP(src=OTHER_IP, dst=DST_IP) / TCP(sport=MIN_PORT + 1, dport=2000, flags="A"))
+    every = max(int(1 / match_ratio), 1) if match_ratio else count + 1
+    return [matching if i % every == 0 else (wrong_port if i % 2 else wrong_host) for i in range(count)]
+
+
+def capture_socket(iface: str) -> socket.socket:
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+    sock.bind((iface, ETH_P_ALL))
+    sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, 1 << 28)
+    return sock
+
+
+def python_filter(frame: bytes) -> bool:
+    pkt = Ether(frame)
+    return TCP in pkt and MIN_PORT <= pkt.sport <= MAX_PORT and pkt[IP].src == SUT_IP
+
+
+def drain(sock: socket.socket, dissect: bool) -> dict:
+    """
+    Reads every queued frame, dissecting and filtering in Python when ``dissect`` is set.
+    """
+    delivered = matched = 0
+    sock.setblocking(False)
+    start = time.process_time()
+    try:
+        while True:
+            frame = sock.recv(SNAP_LEN)
+            delivered += 1
+            if not dissect or python_filter(frame):
+                matched += 1
+    except BlockingIOError:
+        pass
+    cpu = time.process_time() - start
+    _, drops = struct.unpack("II", sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+    return {"delivered": delivered, "matched": matched, "kernel_drops": drops, "cpu_seconds": cpu}
+
+
+def run(iface: str = "lo", count: int = 20000, match_ratio: float = 0.05) -> dict:
+    frames = synthetic_stream(count, match_ratio)
+
+    unfiltered = capture_socket(iface)
+    filtered = capture_socket(iface)
+    attach_filter(filtered, sut_tcp_filter(SUT_IP, MIN_PORT, MAX_PORT))
+    for sock in (unfiltered, filtered):
+        # reading the statistics resets them
+        sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8)
+
+    injector = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+    injector.bind((iface, 0))
+    for frame in frames:
+        injector.send(frame)
+    injector.close()
+
+    results = {"python_filter": drain(unfiltered, dissect=True), "kernel_filter": drain(filtered, dissect=False)}
+    for result in results.values():
+        result["frames_per_second"] = count / result["cpu_seconds"] if result["cpu_seconds"] else float("inf")
+    unfiltered.close()
+    filtered.close()
+    return results
+
+
+if __name__ == "__main__":
+    results = run(sys.argv[1] if len(sys.argv) > 1 else "lo",
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 20000,
+                  float(sys.argv[3]) if len(sys.argv) > 3 else 0.05)
+    for name, result in results.items():
+        fields = [f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                  for key, value in result.items()]
+        print(f"{name:14} " + "  ".join(fields))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Compares the single-pass Torxakis codec in ``tcpTester.types`` with the previous
+slice-and-rejoin parser (kept below as ``legacy_*``) in lines per second.
+The ``*_uncached`` rates run with the codec caches disabled, as the repeated lines always hit them.
+"""
+
+import sys
+import time
+from typing import Callable, List
+
+from tcpTester.types import (
+    ACK,
+    SEQ,
+    CommandType,
+    ConnectParameters,
+    ListenParameters,
+    SendParameters,
+    TCPFlag,
+    TCPPacket,
+    UserCall,
+    UserCallResult,
+    UserCallResultType,
+    resize_codec_caches
+)
+from tcpTester.lruCache import DEFAULT_CACHE_SIZE
+
+TCP_LINES = [
+    'TCPPacket(10001, 11002, SEQ_VALID, ACK_VALID, CONS(SYN, NIL), "")',
+    'TCPPacket(11002, 10001, SEQ_VALID, ACK_VALID, CONS(ACK, CONS(SYN, NIL)), "")',
+    'TCPPacket(10001, 11002, SEQ_VALID, ACK_VALID, CONS(ACK, NIL), "HelloWorld")',
+    'TCPPacket(10001, 11002, SEQ_INVALID, ACK_VALID, CONS(ACK, CONS(FIN, NIL)), "")',
+]
+
+USER_CALL_LINES = ['LISTEN(10500)', 'CONNECT(11500)', 'SEND("HelloWorld")', 'RECEIVE', 'CLOSE']
+
+RESULTS = [UserCallResult(UserCallResultType.SUCCESS), UserCallResult(UserCallResultType.FAILURE),
+           UserCallResult(UserCallResultType.RECEIVE, b"HelloWorld")]
+
+
+def _legacy_from_tcp_flag_list(structure: str) -> List[TCPFlag]:
+    structure = structure.strip()
+    if structure == "NIL":
+        return []
+    structure = structure[5:-1]
+    x = TCPFlag.from_torxakis(structure[0:structure.find(',')])
+    xs = _legacy_from_tcp_flag_list(structure[structure.find(',')+1:])
+    xs.insert(0, x)
+    return xs
+
+
+def _legacy_to_tcp_flag_list(flags: List[TCPFlag]) -> str:
+    if not flags:
+        return "NIL"
+    return f"CONS({flags[0].name}, {_legacy_to_tcp_flag_list(flags[1:])})"
+
+
+def legacy_tcp_from_torxakis(structure: str) -> TCPPacket:
+    structure = structure.strip()
+    tokens = filter(lambda t: t, structure[10:-1].split(','))
+    sport = int(next(tokens))
+    dport = int(next(tokens))
+    seq = SEQ.from_torxakis(next(tokens))
+    ack = ACK.from_torxakis(next(tokens))
+    rest = ','.join(tokens).strip()
+    if rest.startswith("NIL"):
+        tokens = filter(lambda t: t, rest.split(','))
+        flags = _legacy_from_tcp_flag_list(next(tokens))
+        payload = bytes(next(tokens).replace('"', '').strip().encode())
+    else:
+        bracket_index = rest.rindex(')', 0, len(rest) - 1)
+        flags = _legacy_from_tcp_flag_list(rest[0: bracket_index + 1])
+        payload = bytes(rest[bracket_index + 2:].replace('"', '').strip().encode())
+    return TCPPacket(sport, dport, seq, ack, TCPFlag(sum(flags)), payload)
+
+
+def legacy_tcp_to_torxakis(packet: TCPPacket) -> str:
+    flags = _legacy_to_tcp_flag_list(sorted(packet.flags.members(), key=lambda flag: flag.name))
+    payload = '"' + packet.payload.decode() + '"'
+    return f"TCPPacket({packet.sport}, {packet.dport}, {packet.seq.to_torxakis()}, " \
+           f"{packet.ack.to_torxakis()}, {flags}, {payload})"
+
+
+def legacy_user_call_from_torxakis(structure: str) -> UserCall:
+    structure = structure.strip()
+    if structure.startswith("LISTEN"):
+        return UserCall(CommandType["LISTEN"], ListenParameters(int(structure[7:-1])))
+    if structure.startswith("CONNECT"):
+        return UserCall(CommandType["CONNECT"], ConnectParameters(int(structure[8:-1])))
+    if structure.startswith("SEND"):
+        return UserCall(CommandType["SEND"], SendParameters(bytes(structure[5:-1].replace('"', '').encode())))
+    if structure.startswith("RECEIVE"):
+        return UserCall(CommandType["RECEIVE"])
+    if structure.startswith("CLOSE"):
+        return UserCall(CommandType["CLOSE"])
+    raise ValueError(structure)
+
+
+def lines_per_second(func: Callable, lines: List, rounds: int, repeat: int = 5) -> float:
+    """
+    Runs ``func`` over every entry of ``lines`` ``rounds`` times and returns the best throughput of ``repeat`` runs.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for line in lines:
+                func(line)
+        best = min(best, time.perf_counter() - start)
+    return rounds * len(lines) / best
+
+
+def run(rounds: int = 20000) -> dict:
+    packets = [TCPPacket.from_torxakis(line) for line in TCP_LINES]
+    results = {
+        "tcp_from_torxakis": lines_per_second(TCPPacket.from_torxakis, TCP_LINES, rounds),
+        "tcp_from_torxakis_legacy": lines_per_second(legacy_tcp_from_torxakis, TCP_LINES, rounds),
+        "tcp_to_torxakis": lines_per_second(TCPPacket.to_torxakis, packets, rounds),
+        "tcp_to_torxakis_legacy": lines_per_second(legacy_tcp_to_torxakis, packets, rounds),
+        "user_call_from_torxakis": lines_per_second(UserCall.from_torxakis, USER_CALL_LINES, rounds),
+        "user_call_from_torxakis_legacy": lines_per_second(legacy_user_call_from_torxakis, USER_CALL_LINES, rounds),
+        "result_to_torxakis": lines_per_second(UserCallResult.to_torxakis, RESULTS, rounds),
+    }
+    resize_codec_caches(0)
+    try:
+        results.update({
+            "tcp_from_torxakis_uncached": lines_per_second(TCPPacket.from_torxakis, TCP_LINES, rounds),
+            "tcp_to_torxakis_uncached": lines_per_second(TCPPacket.to_torxakis, packets, rounds),
+            "user_call_from_torxakis_uncached": lines_per_second(UserCall.from_torxakis, USER_CALL_LINES, rounds),
+            "result_to_torxakis_uncached": lines_per_second(UserCallResult.to_torxakis, RESULTS, rounds),
+        })
+    finally:
+        resize_codec_caches(DEFAULT_CACHE_SIZE)
+    return results
+
+
+if __name__ == "__main__":
+    for name, rate in run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000).items():
+        print(f"{name:32} {rate:12.0f} lines/s")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compares the raw-bytes decoder in ``tcpTester.segmentDecoder`` with scapy dissection in packets per second.
+Every path turns a captured frame into the flags and payload that the TestServer abstracts:
+
+- ``raw``: ``decode_frame`` with the flags as a bitmask, the TestServer's default.
+- ``scapy``: scapy dissection converted with ``TestServer.segment_from_packet``, the debug mode.
+- ``scapy_sprintf_legacy``: scapy dissection with the ``sprintf("%TCP.flags%")`` lookups used before.
+
+Usage: ``python3 -m benchmarks.decode [rounds]``
+"""
+
+import sys
+from typing import List
+
+from scapy.all import Raw
+from scapy.layers.l2 import Ether
+from scapy.layers.inet import IP, TCP
+
+from benchmarks.codec import lines_per_second
+from tcpTester.segmentDecoder import decode_frame, model_flags
+from tcpTester.testServer import TestServer
+from tcpTester.types import TCPFlag
+
+ETHER = Ether(src="02:00:00:00:00:01", dst="02:00:00:00:00:02")
+SUT = IP(src="198.51.100.7", dst="192.0.2.200")
+_LETTERS = {flag.name[0]: flag for flag in TCPFlag}
+
+FRAMES = [
+    bytes(ETHER / SUT / TCP(sport=10001, dport=11002, seq=1000, flags="S", options=[("MSS", 1460)])),
+    bytes(ETHER / SUT / TCP(sport=10001, dport=11002, seq=1000, ack=5000, flags="SA")),
+    bytes(ETHER / SUT / TCP(sport=10001, dport=11002, seq=1001, ack=5001, flags="A") / Raw(load=b"HelloWorld")),
+    bytes(ETHER / SUT / TCP(sport=10001, dport=11002, seq=1011, ack=5001, flags="FA")),
+]
+
+
+def raw_path(frame: bytes) -> tuple:
+    segment = decode_frame(frame)
+    return model_flags(segment.flags), segment.length, segment.payload
+
+
+def scapy_path(frame: bytes) -> tuple:
+    segment = TestServer.segment_from_packet(Ether(frame))
+    return model_flags(segment.flags), segment.length, segment.payload
+
+
+def scapy_sprintf_legacy_path(frame: bytes) -> tuple:
+    packet = Ether(frame)
+    size = len(packet[Raw].load) if Raw in packet else 0
+    for f in ["F", "S"]:
+        if f in packet.sprintf("%TCP.flags%"):
+            size += 1
+    flags: List[TCPFlag] = list(map(_LETTERS.get, filter(lambda t: t in ["S", "F", "A", "R"],
+                                                         packet.sprintf("%TCP.flags%"))))
+    return TCPFlag(sum(flags)), size, packet[Raw].load if Raw in packet else b''
+
+
+def run(rounds: int = 2000) -> dict:
+    expected = [raw_path(frame) for frame in FRAMES]
+    for path in (scapy_path, scapy_sprintf_legacy_path):
+        assert [path(frame) for frame in FRAMES] == expected, path.__name__
+
+    return {
+        "raw": lines_per_second(raw_path, FRAMES, rounds),
+        "scapy": lines_per_second(scapy_path, FRAMES, rounds // 10 or 1),
+        "scapy_sprintf_legacy": lines_per_second(scapy_sprintf_legacy_path, FRAMES, rounds // 10 or 1),
+    }
+
+
+if __name__ == "__main__":
+    for name, rate in run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000).items():
+        print(f"{name:22} {rate:12.0f} packets/s")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Throughput of the TestServer's per-segment hot paths, offline and without privileges, in operations per
+second:
+
+- ``make_packet`` and ``packet_length``: building and measuring a scapy packet.
+- ``validate_packet_seq`` and ``validate_packet_ack``: the sequence checks of ``Connection``.
+- ``user_call_result_to_torxakis``: encoding the SUT adapter's answers.
+- ``handle_receive``: ``_handle_receive_command`` on a synthetic feed of decoded segments.
+- ``echo_step``: one ``handle_send_command`` whose segment an in-process ``EchoEndpoint`` answers, with the
+  answer decoded and handed to ``handle_receive_command``.
+
+The abstract packets go to a stubbed MBT writer instead of a thread and a socket.
+
+Usage: ``python3 -m benchmarks.hotpaths [rounds]``
+"""
+
+import logging
+import random
+import sys
+from threading import Condition, Lock
+from typing import Dict, List, Tuple
+
+from benchmarks.codec import lines_per_second
+from tcpTester.connection import Connection, ConnectionTable
+from tcpTester.listenProbe import ListenProbe
+from tcpTester.metrics import Metrics
+from tcpTester.segmentDecoder import Segment, decode_frame
+from tcpTester.sendEngine import TCP_FLAG_BITS, SendEngine, flags_to_bits
+from tcpTester.testServer import DEFAULT_MSS, WINDOW_TIMEOUT, TestServer
+from tcpTester.types import ACK, SEQ, TCPFlag, TCPPacket, UserCallResult, UserCallResultType
+
+SUT_IP = "198.51.100.7"
+TS_IP = "192.0.2.200"
+SUT_PORT = 10001
+TS_PORT = 11002
+PAYLOAD = b"HelloWorld"
+
+_SYN = TCP_FLAG_BITS["S"]
+_FIN = TCP_FLAG_BITS["F"]
+_ACK = TCP_FLAG_BITS["A"]
+
+
+class StubWriter:
+    """
+    Stands in for the ``MbtWriter`` of the TestServer and only counts the abstract packets.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.last = ""
+
+    def put(self, line: str) -> None:
+        self.lines += 1
+        self.last = line
+
+    def close(self) -> None:
+        pass
+
+
+class EchoEndpoint:
+    """
+    A minimal TCP endpoint in the place of the SUT: it answers a SYN with a SYN-ACK, data with an ACK that
+    echoes the data and a FIN with a FIN-ACK. The answers are built by a ``SendEngine`` and queued as IP
+    packets, as a capture would deliver them.
+    """
+
+    def __init__(self, ip: str, peer_ip: str):
+        self.engine = SendEngine(peer_ip, src_ip=ip, output=self.output)
+        self.frames: List[bytes] = []
+        # (peer port, own port) -> (own next sequence number, next expected sequence number)
+        self.connections: Dict[Tuple[int, int], Tuple[int, int]] = {}
+
+    def output(self, packet) -> int:
+        self.frames.append(bytes(packet))
+        return len(packet)
+
+    def receive(self, packet) -> int:
+        """
+        Takes an IP packet of the TestServer and queues the answer.
+        """
+        segment = decode_frame(packet, 0)
+        key = (segment.sport, segment.dport)
+        if segment.flags & _SYN:
+            snd_nxt, rcv_nxt = random.randint(1000000, 1999999), segment.seq
+        else:
+            snd_nxt, rcv_nxt = self.connections[key]
+        if not segment.length:
+            return len(packet)
+
+        rcv_nxt = segment.seq + segment.length
+        self.engine.set_ports(segment.dport, segment.sport)
+        if segment.flags & _SYN:
+            flags, payload = _SYN | _ACK, b''
+        elif segment.flags & _FIN:
+            flags, payload = _FIN | _ACK, b''
+        else:
+            flags, payload = _ACK, segment.payload
+        self.engine.send(snd_nxt, rcv_nxt, flags, payload)
+        self.connections[key] = (snd_nxt + len(payload) + bool(flags & (_SYN | _FIN)), rcv_nxt)
+        return len(packet)
+
+    def drain(self) -> List[bytes]:
+        frames, self.frames = self.frames, []
+        return frames
+
+
+class EchoTestServer(TestServer):
+    """
+    A TestServer whose segments go to an ``EchoEndpoint`` instead of a network: it has the state of the send
+    and receive paths, but no sockets, no capture thread, no listen probe and no MBT writer thread.
+    """
+
+    def __init__(self, endpoint: EchoEndpoint):
+        # pylint: disable=super-init-not-called
+        self.sut_ip = SUT_IP
+        self.connections = ConnectionTable()
+        self.lock = Lock()
+        self.window_update = Condition(self.lock)
+        self.metrics = Metrics(enabled=False)
+        self.mss = DEFAULT_MSS
+        self.window_timeout = WINDOW_TIMEOUT
+        self.tun = None
+        self.send_engine = SendEngine(SUT_IP, src_ip=TS_IP, output=endpoint.receive)
+        self.listen_probe = ListenProbe(SUT_IP, timeout=0)
+        self.mbt_writer = StubWriter()
+
+
+def receive_feed(count: int) -> List[Segment]:
+    """
+    Segments of the SUT on one connection: in-order data, duplicates and segments with past or future
+    numbers, so that every branch of the checks is taken.
+    """
+    feed = []
+    seq = 1000
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            feed.append(Segment(SUT_IP, TS_IP, SUT_PORT, TS_PORT, seq, 5001, _ACK, PAYLOAD, 65535))
+            seq += len(PAYLOAD)
+        elif kind == 1:
+            feed.append(Segment(SUT_IP, TS_IP, SUT_PORT, TS_PORT, seq - len(PAYLOAD), 5001, _ACK, PAYLOAD, 65535))
+        elif kind == 2:
+            feed.append(Segment(SUT_IP, TS_IP, SUT_PORT, TS_PORT, seq + 100, 5001, _ACK, b'', 65535))
+        else:
+            feed.append(Segment(SUT_IP, TS_IP, SUT_PORT, TS_PORT, seq, 4000, _ACK, b'', 65535))
+    return feed
+
+
+def handle_receive(rounds: int) -> float:
+    server = EchoTestServer(EchoEndpoint(SUT_IP, TS_IP))
+    feed = receive_feed(64)
+    key = (TS_IP, TS_PORT, SUT_IP, SUT_PORT)
+
+    def receive(segment: Segment) -> None:
+        if segment is feed[0]:
+            # every round starts on a fresh connection
+            connection = server.connections.open(key)
+            connection.seq = 5001
+            connection.ack = 1000
+        server.handle_receive_command(segment)
+
+    rate = lines_per_second(receive, feed, rounds)
+    assert server.mbt_writer.lines, "no abstract packet was written"
+    return rate
+
+
+def echo_step(rounds: int) -> float:
+    endpoint = EchoEndpoint(SUT_IP, TS_IP)
+    server = EchoTestServer(endpoint)
+    commands = [TCPPacket(TS_PORT, SUT_PORT, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.SYN, b''),
+                TCPPacket(TS_PORT, SUT_PORT, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK, b''),
+                TCPPacket(TS_PORT, SUT_PORT, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK, PAYLOAD),
+                TCPPacket(TS_PORT, SUT_PORT, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK, PAYLOAD),
+                TCPPacket(TS_PORT, SUT_PORT, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK | TCPFlag.FIN, b'')]
+
+    def step(command: TCPPacket) -> None:
+        if command is commands[0]:
+            server.reset()
+        server.handle_send_command(command)
+        for frame in endpoint.drain():
+            server.handle_receive_command(decode_frame(frame, 0))
+
+    rate = lines_per_second(step, commands, rounds)
+    assert "SEQ_VALID, ACK_VALID, CONS(ACK, CONS(FIN, NIL))" in server.mbt_writer.last, server.mbt_writer.last
+    return rate
+
+
+def run(rounds: int = 2000) -> dict:
+    logging.getLogger("Connection").setLevel(logging.WARNING)
+    logging.getLogger("TestServer").setLevel(logging.WARNING)
+
+    server = EchoTestServer(EchoEndpoint(SUT_IP, TS_IP))
+    connection = Connection((TS_IP, TS_PORT, SUT_IP, SUT_PORT))
+    connection.ack = 1000
+    packets = [server.make_packet(connection, PAYLOAD, flags="A"), server.make_packet(connection, flags="S"),
+               server.make_packet(connection, flags="FA")]
+    sequence_numbers = [(1000, 10), (990, 10), (1100, 0), (900, 0)]
+    ack_numbers = [connection.seq, connection.seq + 1, connection.seq - 1]
+    results = [UserCallResult(UserCallResultType.SUCCESS),
+               UserCallResult(UserCallResultType.FAILURE),
+               UserCallResult(UserCallResultType.RECEIVE, PAYLOAD)]
+
+    return {
+        "make_packet": lines_per_second(lambda flags: server.make_packet(connection, PAYLOAD, flags=flags),
+                                        ["A", "S", "FA"], rounds // 10 or 1),
+        "packet_length": lines_per_second(TestServer.packet_length, packets, rounds // 10 or 1),
+        "flags_to_bits": lines_per_second(flags_to_bits, ["A", "S", "FA"], rounds),
+        "validate_packet_seq": lines_per_second(lambda numbers: connection.validate_packet_seq(*numbers),
+                                                sequence_numbers, rounds),
+        "validate_packet_ack": lines_per_second(connection.validate_packet_ack, ack_numbers, rounds),
+        "user_call_result_to_torxakis": lines_per_second(UserCallResult.to_torxakis, results, rounds),
+        "handle_receive": handle_receive(rounds // 10 or 1),
+        "echo_step": echo_step(rounds // 10 or 1),
+    }
+
+
+if __name__ == "__main__":
+    for name, rate in run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000).items():
+        print(f"{name:30} {rate:12.0f} ops/s")
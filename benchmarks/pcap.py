@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Offline abstraction of a synthetic pcap file with ``tcpTester.pcapAnalysis``: the vectorized computation
+versus replaying every connection segment by segment through ``Connection``, in segments per second.
+The synthetic connections interleave handshakes and data with duplicate, past and future segments of the
+SUT and segments that the TestServer sent with invalid numbers, and both computations must agree on them.
+
+Usage: ``python3 -m benchmarks.pcap [connections] [segments_per_connection] [anomalies]``
+"""
+
+import logging
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from tcpTester.pcapAnalysis import abstract, load_pcap, statistics
+from tcpTester.types import MIN_PORT
+
+SUT_IP = "198.51.100.7"
+TS_NETWORK = "192.0.2."
+
+_PCAP_HEADER = struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+_RECORD = struct.Struct("<IIII")
+_ETHER = bytes.fromhex("020000000002 020000000001 0800")
+_IP = struct.Struct("!BBHHHBBH4s4s")
+_TCP = struct.Struct("!HHIIBBHHH")
+_FLAGS = {"F": 0x01, "S": 0x02, "R": 0x04, "A": 0x10}
+
+
+def _frame(src: str, dst: str, sport: int, dport: int, seq: int, ack: int, flags: str, payload: bytes) -> bytes:
+    tcp = _TCP.pack(sport, dport, seq, ack, 5 << 4, sum(_FLAGS[f] for f in flags), 65535, 0, 0) + payload
+    ip = _IP.pack(0x45, 0, 20 + len(tcp), 0, 0, 64, 6, 0, bytes(map(int, src.split("."))),
+                  bytes(map(int, dst.split("."))))
+    return _ETHER + ip + tcp
+
+
+def _connection(number: int, segments: int, anomalies: float, rng: random.Random) -> list:
+    """
+    Builds the segments of one connection that the SUT opens, in order. A fraction ``anomalies`` of the
+    segments after the handshake are duplicate, past or future segments or invalid TestServer segments.
+    """
+    ts_ip = TS_NETWORK + str(1 + number % 250)
+    ts_port = 20000 + number // 250
+    sut_port = MIN_PORT + rng.randrange(2000)
+    sut_seq = rng.randrange(1000000, 2000000)
+    ts_seq = rng.randrange(3000000, 5000000)
+
+    def sut(seq: int, ack: int, flags: str, payload: bytes = b"") -> bytes:
+        return _frame(SUT_IP, ts_ip, sut_port, ts_port, seq, ack, flags, payload)
+
+    def ts(seq: int, ack: int, flags: str, payload: bytes = b"") -> bytes:
+        return _frame(ts_ip, SUT_IP, ts_port, sut_port, seq, ack, flags, payload)
+
+    frames = []
+    if rng.random() < 0.05:
+        # not intended for the TestServer, no connection yet
+        frames.append(sut(sut_seq - 100, 0, "A"))
+    frames += [sut(sut_seq, 0, "S"), ts(ts_seq, sut_seq + 1, "SA"), sut(sut_seq + 1, ts_seq + 1, "A")]
+    sut_seq += 1
+    ts_seq += 1
+    while len(frames) < segments:
+        payload = os.urandom(rng.randrange(1, 64))
+        if rng.random() < anomalies:
+            kind = rng.random()
+            if kind < 0.25:
+                frames.append(sut(sut_seq - len(payload), ts_seq, "A", payload))  # duplicate
+            elif kind < 0.40:
+                frames.append(sut(sut_seq - 5000, ts_seq, "A", payload))  # past
+            elif kind < 0.55:
+                frames.append(sut(sut_seq + 5000, ts_seq + 7, "A", payload))  # future
+            else:
+                frames.append(ts(rng.randrange(3000000, 6000000), sut_seq, "A", payload))  # SEQ_INVALID
+        elif rng.random() < 0.5:
+            frames.append(sut(sut_seq, ts_seq, "A", payload))
+            sut_seq += len(payload)
+        else:
+            frames.append(ts(ts_seq, sut_seq, "A", payload))
+            ts_seq += len(payload)
+    frames += [sut(sut_seq, ts_seq, "FA"), ts(ts_seq, sut_seq + 1, "FA"), sut(sut_seq + 1, ts_seq + 1, "A")]
+    return frames
+
+
+def write_pcap(path: str, connections: int, segments: int, anomalies: float, seed: int = 1) -> int:
+    """
+    Writes a pcap file with interleaved synthetic connections.
+
+    :return: The number of packets in the file.
+    """
+    rng = random.Random(seed)
+    pending = [_connection(number, segments, anomalies, rng) for number in range(connections)]
+    positions = [0] * connections
+    active = list(range(connections))
+    count = 0
+    with open(path, "wb") as file:
+        file.write(_PCAP_HEADER)
+        while active:
+            slot = rng.randrange(len(active))
+            number = active[slot]
+            frame = pending[number][positions[number]]
+            positions[number] += 1
+            if positions[number] == len(pending[number]):
+                active[slot] = active[-1]
+                active.pop()
+            file.write(_RECORD.pack(count // 1000000, count % 1000000, len(frame), len(frame)) + frame)
+            count += 1
+    return count
+
+
+def run(connections: int = 2000, segments: int = 100, anomalies: float = 0.02) -> dict:
+    logging.getLogger("Connection").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "capture.pcap")
+        count = write_pcap(path, connections, segments, anomalies)
+
+        start = time.perf_counter()
+        capture = load_pcap(path)
+        loaded = time.perf_counter()
+        vectorized = abstract(capture, SUT_IP)
+        abstracted = time.perf_counter()
+        replayed = abstract(capture, SUT_IP, vectorized=False)
+        finished = time.perf_counter()
+
+        for field in ("rows", "seq_class", "ack_class"):
+            assert np.array_equal(getattr(vectorized, field), getattr(replayed, field)), field
+        assert vectorized.dropped == replayed.dropped
+
+        stats = statistics(capture, vectorized)
+        return {
+            "packets": count,
+            "load": count / (loaded - start),
+            "vectorized": count / (abstracted - loaded),
+            "replay": count / (finished - abstracted),
+            "replayed_segments": stats["replayed_segments"],
+            "seq": stats["seq"],
+            "ack": stats["ack"],
+        }
+
+
+if __name__ == "__main__":
+    results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+                  float(sys.argv[3]) if len(sys.argv) > 3 else 0.02)
+    for name, result in results.items():
+        print(f"{name:18} {result:12.0f} segments/s" if isinstance(result, float) else f"{name:18} {result}")
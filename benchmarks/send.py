@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Per-segment send latency of scapy's ``send()`` (the previous ``TestServer.send`` path)
+versus the persistent raw socket of ``SendEngine``. Needs root for the raw sockets.
+
+Usage: ``python3 -m benchmarks.send [dst_ip] [count]``; segments go to port 9 of ``dst_ip``.
+"""
+
+import sys
+import time
+
+from scapy.all import Raw, send
+from scapy.layers.inet import IP, TCP
+
+from tcpTester.sendEngine import SendEngine, flags_to_bits
+
+SPORT = 10555
+DPORT = 9
+PAYLOAD = b"HelloWorld"
+
+
+def scapy_latency(dst_ip: str, count: int) -> float:
+    start = time.perf_counter()
+    for seq in range(count):
+        pkt = IP(dst=dst_ip) / TCP(sport=SPORT, dport=DPORT, seq=seq, ack=1, flags="A") / Raw(load=PAYLOAD)
+        send(pkt, verbose=False)
+    return (time.perf_counter() - start) / count
+
+
+def engine_latency(dst_ip: str, count: int) -> float:
+    engine = SendEngine(dst_ip)
+    engine.set_ports(SPORT, DPORT)
+    flags = flags_to_bits("A")
+    start = time.perf_counter()
+    for seq in range(count):
+        engine.send(seq, 1, flags, PAYLOAD)
+    elapsed = time.perf_counter() - start
+    engine.close()
+    return elapsed / count
+
+
+def run(dst_ip: str = "127.0.0.1", count: int = 1000) -> dict:
+    return {
+        "scapy_send_us": scapy_latency(dst_ip, max(count // 10, 1)) * 1e6,
+        "send_engine_us": engine_latency(dst_ip, count) * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    results = run(sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1",
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    for name, latency in results.items():
+        print(f"{name:20} {latency:10.1f} us/segment")
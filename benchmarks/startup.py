@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Time-to-ready of the entry points, in seconds: from starting ``testServerMain.py`` or ``sutMain.py`` in a
+new interpreter until its MBT port accepts a connection, including the test server's pre-warming of the
+route and the ARP entry of the SUT on the loopback device. ``scapy_import_s`` is the time a new interpreter
+needs for the scapy layers, which neither entry point imports before a session needs them.
+
+Every measurement is the best of ``repeat`` runs. Neither root nor a network is needed: the MBT connection
+is closed as soon as it is accepted and the process is terminated.
+
+Usage: ``python3 -m benchmarks.startup [repeat]``
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READY_TIMEOUT = 30.0  # in seconds
+POLL_INTERVAL = 0.005  # in seconds
+
+TEST_SERVER_CONFIG = """
+[logging]
+console=WARNING
+file_logging=False
+
+[mbt]
+port={port}
+
+[test_server]
+iface=lo
+transport=iface
+
+[sut]
+ip=127.0.0.1
+"""
+
+SUT_CONFIG = """
+[logging]
+console=WARNING
+file_logging=False
+
+[mbt]
+port={port}
+
+[test_server]
+ip=127.0.0.1
+"""
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def time_to_ready(script: str, config: str) -> float:
+    """
+    Starts an entry point with the given config and measures how long its MBT port takes to accept a
+    connection.
+    """
+    port = free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "config.ini")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(config.format(port=port))
+
+        # The working directory takes the log files.
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, script), path], cwd=directory,
+                                   env={**os.environ, "PYTHONPATH": ROOT},
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    with socket.create_connection(("127.0.0.1", port), timeout=POLL_INTERVAL):
+                        return time.perf_counter() - start
+                except OSError:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"{script} exited with {process.returncode}") from None
+                    if time.perf_counter() - start > READY_TIMEOUT:
+                        raise RuntimeError(f"{script} was not ready after {READY_TIMEOUT} s") from None
+                    time.sleep(POLL_INTERVAL)
+        finally:
+            process.kill()
+            process.wait()
+
+
+def scapy_import() -> float:
+    code = "import time; start = time.perf_counter(); import tcpTester.scapyLayers; " \
+           "print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True,
+                            env={**os.environ, "PYTHONPATH": ROOT}).stdout
+    return float(output)
+
+
+def run(repeat: int = 5) -> dict:
+    return {
+        "test_server_ready_s": min(time_to_ready("testServerMain.py", TEST_SERVER_CONFIG) for _ in range(repeat)),
+        "sut_ready_s": min(time_to_ready("sutMain.py", SUT_CONFIG) for _ in range(repeat)),
+        "scapy_import_s": min(scapy_import() for _ in range(repeat)),
+    }
+
+
+if __name__ == "__main__":
+    for name, seconds in run(int(sys.argv[1]) if len(sys.argv) > 1 else 5).items():
+        print(f"{name:30} {seconds * 1000:10.1f} ms")
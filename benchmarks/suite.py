@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Runs the offline benchmarks (``codec``, ``decode``, ``hotpaths``, ``pcap`` and ``startup``) and stores their
+results as JSON, together with the Python version, the platform and the git commit, so that runs can be
+compared. With a baseline, every throughput that dropped and every duration (a result ending in ``_s``)
+that grew by more than the tolerance is reported as a regression and the exit code is 1. ``send``,
+``capture``, ``burst`` and ``tpacket`` need root and an interface and are not part of the suite.
+
+Usage: ``python3 -m benchmarks.suite [--output results.json] [--baseline previous.json] [--tolerance 0.2]``
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from benchmarks import codec, decode, hotpaths, pcap, startup
+
+BENCHMARKS: Dict[str, Callable[[], dict]] = {
+    "codec": codec.run,
+    "decode": decode.run,
+    "hotpaths": hotpaths.run,
+    "pcap": pcap.run,
+    "startup": startup.run,
+}
+DEFAULT_TOLERANCE = 0.2  # relative drop of a throughput (or growth of a duration) that counts as a regression
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: List[str]) -> dict:
+    """
+    Runs the given benchmarks.
+
+    :return: The environment of the run and the results of every benchmark.
+    """
+    results = {}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = BENCHMARKS[name]()
+    return {
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": git_commit(),
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Compares the throughputs and the durations (the float results ending in ``_s``) of two runs.
+
+    :return: A description of every throughput that dropped and every duration that grew by more than
+             ``tolerance``.
+    """
+    regressions = []
+    for name, results in current["results"].items():
+        for key, value in results.items():
+            previous = baseline["results"].get(name, {}).get(key)
+            if not isinstance(value, float) or not isinstance(previous, float) or not previous:
+                continue
+            change = f"({value / previous - 1:+.0%})"
+            if key.endswith("_s"):
+                if value > previous * (1 + tolerance):
+                    regressions.append(f"{name}.{key}: {value * 1000:.1f} ms, was {previous * 1000:.1f} ms {change}")
+            elif value < previous * (1 - tolerance):
+                regressions.append(f"{name}.{key}: {value:.0f}/s, was {previous:.0f}/s {change}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the offline benchmarks.")
+    parser.add_argument("--output", help="file to store the results in, as JSON")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="relative drop of a throughput (or growth of a duration) that counts as a regression")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="benchmarks to run")
+    args = parser.parse_args()
+
+    report = run(args.only)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            found = compare(report, json.load(file), args.tolerance)
+        for regression in found:
+            print(f"Regression: {regression}", file=sys.stderr)
+        sys.exit(1 if found else 0)
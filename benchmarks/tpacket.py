@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Frame rate and CPU use of the TestServer's capture backends on a veth pair: the scapy decoder's
+``AsyncSniffer``, the raw decoder's capture thread with one ``recv`` per frame and the ``mmap`` capture
+from a TPACKET_V3 ring, which reads whole blocks of frames and hands them over in batches. A burst of
+the SUT's segments is injected on one end of the pair by another process and captured on the other end.
+
+``frames_per_second`` is the number of handled segments over the time from the start of the burst until the
+last one was handled, ``cpu_us_per_frame`` the CPU time of the TestServer's process per handled segment.
+Needs root, the veth pair is created for the run and removed afterwards.
+
+Usage: ``python3 -m benchmarks.tpacket [frames]``
+"""
+
+import io
+import logging
+import multiprocessing
+import subprocess
+import sys
+import time
+
+from benchmarks.burst import SETTLE_TIME, CountingTestServer, inject
+from benchmarks.capture import SUT_IP, synthetic_stream
+
+VETH = "tcpt-bench0"
+VETH_PEER = "tcpt-bench1"
+# decoder and capture of every backend
+BACKENDS = {
+    "scapy": ("scapy", "thread"),
+    "thread": ("raw", "thread"),
+    "mmap": ("raw", "mmap"),
+}
+
+
+def create_veth() -> None:
+    subprocess.run(["ip", "link", "add", VETH, "type", "veth", "peer", "name", VETH_PEER], check=True)
+    for name in (VETH, VETH_PEER):
+        subprocess.run(["ip", "link", "set", name, "up"], check=True)
+
+
+def delete_veth() -> None:
+    subprocess.run(["ip", "link", "del", VETH], check=False, stderr=subprocess.DEVNULL)
+
+
+def measure(decoder: str, capture: str, frames: list) -> dict:
+    """
+    Injects the frames on one end of the pair and captures them on the other with the given backend.
+    """
+    server = CountingTestServer(0.0, ts_iface=VETH_PEER, sut_ip=SUT_IP, mbt_client=io.StringIO(),
+                                decoder=decoder, capture=capture)
+    injector = multiprocessing.get_context("spawn").Process(target=inject, args=(VETH, frames))
+    cpu = time.process_time()
+    start = time.perf_counter()
+    injector.start()
+    injector.join()
+    received = -1
+    while server.received != received:
+        received = server.received
+        time.sleep(SETTLE_TIME)
+    cpu = time.process_time() - cpu
+    elapsed = server.last - start
+    server.close()
+    return {
+        "received": received,
+        "ratio": received / len(frames),
+        "frames_per_second": received / elapsed if received else 0.0,
+        "cpu_us_per_frame": cpu / received * 1e6 if received else 0.0,
+    }
+
+
+def run(count: int = 20000) -> dict:
+    logging.getLogger("TestServer").setLevel(logging.WARNING)
+    frames = synthetic_stream(count, 1.0)
+    delete_veth()
+    create_veth()
+    try:
+        return {name: measure(decoder, capture, frames) for name, (decoder, capture) in BACKENDS.items()}
+    finally:
+        delete_veth()
+
+
+if __name__ == "__main__":
+    results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    for name, result in results.items():
+        fields = [f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                  for key, value in result.items()]
+        print(f"{name:8} " + "  ".join(fields))
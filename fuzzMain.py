@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# pylint: disable=duplicate-code
+
+import json
+import sys
+import time
+
+import configparser
+import logging
+from termcolor import colored
+
+from tcpTester import set_up_logging
+from tcpTester.fuzzDriver import DEFAULT_RULES, OUTPUT_TIMEOUT, FuzzDriver, PacketQueue
+from tcpTester.sut import SUT
+from tcpTester.testServer import TestServer
+from tcpTester.types import MAX_PORT, MIN_PORT
+
+LOG_PREFIX = "./fuzz"
+
+# Loggers that log every segment and user call, which would slow down the walks.
+PER_STEP_LOGGERS = ["TestServer", "Connection", "ConnectionTable", "ListenProbe", "SUT"]
+
+
+def parse_rules(text: str):
+    """
+    Parses the weights of the rules, e.g. ``send:4,receive:4,noise:2,close:1``.
+    """
+    rules = {}
+    for item in text.split(","):
+        rule, _, weight = item.partition(":")
+        if rule.strip() not in DEFAULT_RULES:
+            raise ValueError(f"Unknown rule {rule}, use one of {list(DEFAULT_RULES)}")
+        rules[rule.strip()] = float(weight)
+    return rules
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(colored("Please provide one config file via CLI!", "red"))
+        sys.exit(-1)
+
+    config = configparser.ConfigParser()
+    config.read(sys.argv[1])
+
+    for section in ["logging", "test_server", "sut", "fuzz"]:
+        if section not in config:
+            print(colored(f"Config file does no contain {section} settings!", "red"))
+            sys.exit(-1)
+
+    try:
+        set_up_logging(LOG_PREFIX,
+                       console_level=config["logging"]["console"],
+                       enable_file_logging=config["logging"].getboolean("file_logging"))
+    except KeyError as exc:
+        print(colored("Config file does no contain logging settings!", "red"))
+        sys.exit(-1)
+    for name in PER_STEP_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    if config["test_server"].get("transport", fallback="iface") != "tun":
+        print(colored("The fuzz driver runs the SUT in the same process, it needs transport=tun!", "red"))
+        sys.exit(-1)
+
+    try:
+        ts_iface = config["test_server"]["iface"]
+        tun_ip = config["test_server"]["tun_ip"]
+        sut_ip = config["sut"]["ip"]
+    except KeyError as exc:
+        print(colored(f"Config file does no contain the {exc} setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        steps = config["fuzz"].getint("steps", fallback=10000)
+        duration = config["fuzz"].getfloat("duration", fallback=None)
+        timeout = config["fuzz"].getfloat("timeout", fallback=OUTPUT_TIMEOUT)
+        seed = config["fuzz"].getint("seed", fallback=None)
+        rules = parse_rules(config["fuzz"]["rules"]) if config["fuzz"].get("rules") else None
+    except ValueError as exc:
+        print(colored(f"Config file contains an invalid fuzz setting: {exc}", "red"))
+        sys.exit(-1)
+
+    packets = PacketQueue()
+    try:
+        ts = TestServer(ts_iface=ts_iface,
+                        sut_ip=sut_ip,
+                        mbt_client=packets,
+                        kernel_filter=config["test_server"].getboolean("kernel_filter", fallback=True),
+                        port_range=(MIN_PORT, MAX_PORT),
+                        transport="tun",
+                        tun_ip=tun_ip)
+        sut = SUT(tun_ip, port_range=(MIN_PORT + 1, MAX_PORT - 1))
+    except OSError as err:
+        print(colored(f"Cannot start the fuzz driver: {err}", "red"))
+        sys.exit(-1)
+
+    driver = FuzzDriver(ts, packets, sut, rules, timeout, seed)
+    start = time.monotonic()
+    try:
+        violation = driver.run(steps, duration)
+    except KeyboardInterrupt:
+        violation = None
+    elapsed = time.monotonic() - start
+    sut.reset()
+    sut.close_listening_socket()
+    driver.close()
+    ts.close()
+
+    print(json.dumps({
+        "verdict": "FAIL" if violation else "PASS",
+        "violation": str(violation) if violation else None,
+        "steps": driver.steps,
+        "connections": driver.connections,
+        "duration": round(elapsed, 3),
+        "steps_per_minute": round(driver.steps / elapsed * 60) if elapsed else 0,
+        "rules": dict(driver.applied),
+        "trace": list(driver.trace) if violation else [],
+    }, indent=2))
+    sys.exit(1 if violation else 0)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# pylint: disable=duplicate-code
+
+import os
+import sys
+
+import configparser
+from pathlib import Path
+from termcolor import colored
+
+from tcpTester import set_up_logging
+from tcpTester.orchestrator import CAMPAIGN_TIMEOUT, STARTUP_TIMEOUT, Orchestrator
+from tcpTester.types import MAX_PORT, MIN_PORT
+
+LOG_PREFIX = "./orchestrator"
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(colored("Please provide one config file via CLI!", "red"))
+        sys.exit(-1)
+
+    config = configparser.ConfigParser()
+    config.read(sys.argv[1])
+
+    for section in ["logging", "orchestrator", "test_server", "sut"]:
+        if section not in config:
+            print(colored(f"Config file does not contain {section} settings!", "red"))
+            sys.exit(-1)
+
+    try:
+        set_up_logging(LOG_PREFIX,
+                       console_level=config["logging"]["console"],
+                       enable_file_logging=bool(config["logging"]["file_logging"]))
+    except KeyError as exc:
+        print(colored("Config file does not contain logging settings!", "red"))
+        sys.exit(-1)
+
+    for section, option in [("test_server", "iface"), ("test_server", "ip"), ("test_server", "mbt_port"),
+                            ("sut", "ip"), ("sut", "mbt_port")]:
+        if option not in config[section]:
+            print(colored(f"Config file does not contain {section} {option} setting!", "red"))
+            sys.exit(-1)
+
+    try:
+        orchestrator_config = config["orchestrator"]
+        orchestrator = Orchestrator(
+            config,
+            shards=orchestrator_config.getint("shards", fallback=os.cpu_count() or 1),
+            campaigns=orchestrator_config.getint("campaigns", fallback=1),
+            steps=orchestrator_config.getint("steps", fallback=100),
+            model=Path(orchestrator_config.get("model", fallback="torxakisTcpTester/Tcp.txs")),
+            output_dir=Path(orchestrator_config.get("output", fallback="campaigns")),
+            torxakis=orchestrator_config.get("torxakis", fallback="torxakis"),
+            port_range=(orchestrator_config.getint("min_port", fallback=MIN_PORT),
+                        orchestrator_config.getint("max_port", fallback=MAX_PORT)),
+            startup_timeout=orchestrator_config.getfloat("startup_timeout", fallback=STARTUP_TIMEOUT),
+            campaign_timeout=orchestrator_config.getfloat("campaign_timeout", fallback=CAMPAIGN_TIMEOUT))
+    except ValueError as exc:
+        print(colored(f"Config file contains an invalid orchestrator setting: {exc}", "red"))
+        sys.exit(-1)
+
+    try:
+        results = orchestrator.run()
+    except (OSError, ValueError) as err:
+        print(colored(f"Orchestration failed: {err}", "red"))
+        sys.exit(-2)
+
+    sys.exit(0 if results and all(result.verdict == "PASS" for result in results) else 1)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# pylint: disable=duplicate-code
+"""
+Abstracts the SUT's segments in a pcap file offline, as the TestServer would have done it live.
+
+Usage: ``python3 pcapAnalysisMain.py test_server.ini capture.pcap [packets.txt]``
+
+The SUT's address and port range are read from the TestServer's config. The statistics are printed
+as JSON, the abstract packets are written to the optional output file, one Torxakis line per packet.
+"""
+
+import json
+import sys
+import time
+
+import configparser
+import logging
+from termcolor import colored
+
+from tcpTester.types import MAX_PORT, MIN_PORT
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(colored("Please provide a config file and a pcap file via CLI!", "red"))
+        sys.exit(-1)
+
+    try:
+        from tcpTester.pcapAnalysis import abstract, abstract_packets, load_pcap, statistics
+    except ImportError as exc:
+        print(colored(f"The pcap analysis requires numpy: {exc}", "red"))
+        sys.exit(-1)
+
+    config = configparser.ConfigParser()
+    config.read(sys.argv[1])
+
+    try:
+        sut_ip = config["sut"]["ip"]
+        port_range = (config.getint("mbt", "min_port", fallback=MIN_PORT),
+                      config.getint("mbt", "max_port", fallback=MAX_PORT))
+    except KeyError:
+        print(colored("Config file does not contain sut ip setting!", "red"))
+        sys.exit(-1)
+
+    # the replay of invalid segments would log every one of them
+    logging.getLogger("Connection").setLevel(logging.WARNING)
+
+    try:
+        start = time.perf_counter()
+        capture = load_pcap(sys.argv[2])
+        loaded = time.perf_counter()
+        abstraction = abstract(capture, sut_ip, port_range)
+        abstracted = time.perf_counter()
+    except (OSError, ValueError) as err:
+        print(colored(f"Could not analyse {sys.argv[2]}: {err}", "red"))
+        sys.exit(-2)
+
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], "w", encoding="utf-8") as output:
+            for packet in abstract_packets(capture, abstraction):
+                output.write(packet.to_torxakis() + "\n")
+
+    result = statistics(capture, abstraction)
+    result["seconds"] = {"load": round(loaded - start, 3), "abstract": round(abstracted - loaded, 3)}
+    print(json.dumps(result, indent=2))
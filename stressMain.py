@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# pylint: disable=duplicate-code
+
+import json
+import sys
+import time
+from typing import List
+
+import configparser
+import logging
+from termcolor import colored
+
+from tcpTester import set_up_logging
+from tcpTester.loadGenerator import (DEFAULT_CONNECTIONS, DEFAULT_MAX_PAYLOAD, DEFAULT_RATE, SETTLE_TIME,
+                                     ConnectionSink, LoadGenerator, ResponseCounter, parse_mix)
+from tcpTester.metrics import Metrics
+from tcpTester.captureRing import DEFAULT_RING_SIZE
+from tcpTester.testServer import CAPTURES, DEFAULT_MSS, TRANSPORTS, TestServer
+
+LOG_PREFIX = "./stress"
+
+# Loggers that log every segment, which would slow down the load generation.
+PER_SEGMENT_LOGGERS = ["TestServer", "Connection", "ConnectionTable"]
+
+
+def parse_ports(text: str) -> List[int]:
+    """
+    Parses a list of ports, e.g. ``10000,10002`` or ``10000-10003``.
+    """
+    ports = []
+    for item in text.split(","):
+        first, _, last = item.partition("-")
+        ports.extend(range(int(first), int(last or first) + 1))
+    return ports
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(colored("Please provide one config file via CLI!", "red"))
+        sys.exit(-1)
+
+    config = configparser.ConfigParser()
+    config.read(sys.argv[1])
+
+    for section in ["logging", "test_server", "sut", "stress"]:
+        if section not in config:
+            print(colored(f"Config file does no contain {section} settings!", "red"))
+            sys.exit(-1)
+
+    try:
+        set_up_logging(LOG_PREFIX,
+                       console_level=config["logging"]["console"],
+                       enable_file_logging=config["logging"].getboolean("file_logging"))
+    except KeyError as exc:
+        print(colored("Config file does no contain logging settings!", "red"))
+        sys.exit(-1)
+    for name in PER_SEGMENT_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    try:
+        ts_iface = config["test_server"]["iface"]
+        sut_ip = config["sut"]["ip"]
+        sut_ports = parse_ports(config["stress"]["sut_ports"])
+    except KeyError as exc:
+        print(colored(f"Config file does no contain the {exc} setting!", "red"))
+        sys.exit(-1)
+    except ValueError as exc:
+        print(colored("Config file contains an invalid stress sut_ports setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        rate = config["stress"].getfloat("rate", fallback=DEFAULT_RATE)
+        duration = config["stress"].getfloat("duration", fallback=10.0)
+        connections = config["stress"].getint("connections", fallback=DEFAULT_CONNECTIONS)
+        max_payload = config["stress"].getint("max_payload", fallback=DEFAULT_MAX_PAYLOAD)
+        mix = parse_mix(config["stress"]["mix"]) if config["stress"].get("mix") else None
+        serve = config["stress"].getboolean("serve", fallback=False)
+        seed = config["stress"].getint("seed", fallback=None)
+        mss = config["test_server"].getint("mss", fallback=DEFAULT_MSS)
+        capture_ring_size = config["test_server"].getint("capture_ring_size", fallback=DEFAULT_RING_SIZE)
+    except ValueError as exc:
+        print(colored(f"Config file contains an invalid stress setting: {exc}", "red"))
+        sys.exit(-1)
+
+    transport = config["test_server"].get("transport", fallback="iface")
+    if transport not in TRANSPORTS:
+        print(colored(f"Config file contains an invalid test server transport, use one of {TRANSPORTS}!", "red"))
+        sys.exit(-1)
+
+    capture = config["test_server"].get("capture", fallback="thread")
+    if capture not in CAPTURES:
+        print(colored(f"Config file contains an invalid test server capture, use one of {CAPTURES}!", "red"))
+        sys.exit(-1)
+
+    counter = ResponseCounter()
+    metrics = Metrics(enabled=False)
+    try:
+        ts = TestServer(ts_iface=ts_iface,
+                        sut_ip=sut_ip,
+                        mbt_client=counter,
+                        kernel_filter=config["test_server"].getboolean("kernel_filter", fallback=True),
+                        ready_timeout=0,
+                        port_range=(min(sut_ports), max(sut_ports)),
+                        transport=transport,
+                        tun_ip=config["test_server"].get("tun_ip"),
+                        metrics=metrics,
+                        mss=mss,
+                        capture=capture,
+                        capture_ring_size=capture_ring_size)
+        # With the tun transport the SUT's stack is the local one, an application has to accept the connections.
+        sink = ConnectionSink(sut_ip, sut_ports) if serve else None
+    except OSError as err:
+        print(colored(f"Cannot start the stress run: {err}", "red"))
+        sys.exit(-1)
+
+    generator = LoadGenerator(ts, sut_ports, rate, connections, mix, max_payload, seed)
+    start = time.monotonic()
+    try:
+        generator.run(duration)
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.monotonic() - start
+    generator.close()
+    time.sleep(SETTLE_TIME)
+    backend = ts.capture_process or ts.capture_ring
+    capture_stats = backend.stats() if backend else None
+    ts.close()
+    if sink:
+        sink.close()
+
+    sent = sum(generator.sent.values())
+    print(json.dumps({
+        "duration": round(elapsed, 3),
+        "sent": sent,
+        "sent_per_second": round(sent / elapsed, 1) if elapsed else 0.0,
+        "sent_by_action": dict(generator.sent),
+        "received": counter.total,
+        "received_by_category": dict(counter.categories.most_common()),
+        "received_invalid": dict(counter.invalid),
+        "capture": capture_stats,
+    }, indent=2))
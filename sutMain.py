@@ -2,49 +2,206 @@
 # pylint: disable=duplicate-code
 
 import sys
+import signal
 import socket
+import asyncio
+import contextlib
+import time
+from typing import Dict, Optional, TextIO, Tuple
 
 import configparser
 import logging
 from termcolor import colored
 
 from tcpTester import set_up_logging
-from tcpTester.sut import SUT
-from tcpTester.types import UserCall
+from tcpTester.asyncSut import AsyncSUT
+from tcpTester.metrics import DEFAULT_REPORT_INTERVAL, Metrics, MetricsReporter
+from tcpTester.portAllocator import SOCKET_POOL_SIZE, TIME_WAIT, PortAllocator
+from tcpTester.receiveBuffer import RECEIVE_BUFFER_SIZE
+from tcpTester.sut import DEFAULT_TIMEOUTS, MAX_READ_SIZE, SUT
+from tcpTester.types import MAX_PORT, MIN_PORT, CommandType, UserCall, codec_cache_report
+from tcpTester.utils import split_port_range
 
 LOG_PREFIX = "./sut"
 
-def runner(ts_ip: str, mbt_port: int):
+def serve_sync_session(sut: SUT, mbt_file_client: TextIO, metrics: Metrics) -> None:
+    """
+    Answers the user calls of Torxakis until it closes the MBT connection.
+    """
+    while True:
+        raw = mbt_file_client.readline()
+        start = time.monotonic_ns()
+        logging.getLogger("SUTMain").info("Got input: %s", raw)
+        if not raw:
+            break
+
+        if not raw.strip():
+            continue
+
+        parsing = time.monotonic_ns()
+        user_call = UserCall.from_torxakis(raw)
+        metrics.record("sut.parse", parsing)
+        result = sut.handle_user_call(user_call)
+        if result is None:
+            continue
+        handled = time.monotonic_ns()
+        resp = result.to_torxakis()
+        encoded = metrics.record("sut.encode", handled)
+        logging.getLogger("SUTMain").info("Sending response: %s", resp)
+        mbt_file_client.write(resp + "\n")
+        mbt_file_client.flush()
+        metrics.record("sut.reply", encoded)
+        metrics.record("sut.step", start)
+        # While Torxakis prepares the next step.
+        sut.socket_pool.refill()
+
+def runner(ts_ip: str,
+           mbt_port: int,
+           port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+           metrics: Optional[Metrics] = None,
+           receive_max: int = MAX_READ_SIZE,
+           receive_buffer: int = RECEIVE_BUFFER_SIZE,
+           socket_pool: int = SOCKET_POOL_SIZE,
+           time_wait: float = TIME_WAIT,
+           timeouts: Optional[Dict[CommandType, float]] = None,
+           daemon: bool = False):
+    """
+    Serves one Torxakis session, or with ``daemon`` one session after the other. The SUT is only created
+    for the first session, the next ones reuse its socket pool and its ports in TIME_WAIT.
+    """
+    metrics = metrics or Metrics(enabled=False)
+    sut = None
     try:
         mbt_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         mbt_server.bind(("", mbt_port))
         mbt_server.listen(1)
 
-        (mbt_client, _) = mbt_server.accept()
-        mbt_file_client = mbt_client.makefile('wr')
-        sut = SUT(ts_ip)
+        while True:
+            logging.getLogger("SUTMain").info("Waiting for the MBT connection on port %s", mbt_port)
+            (mbt_client, _) = mbt_server.accept()
+            mbt_file_client = mbt_client.makefile('wr')
+            if sut is None:
+                sut = SUT(ts_ip, port_range, metrics, receive_max, receive_buffer, socket_pool, time_wait, timeouts,
+                          cancel_on=mbt_client)
+            else:
+                sut.start_session(mbt_client)
+
+            try:
+                serve_sync_session(sut, mbt_file_client, metrics)
+            except OSError as os_err:
+                if not daemon:
+                    raise
+                logging.getLogger("SUTMain").warning("Connection to the TestRunner failed - OSError: %s",
+                                                     os_err.strerror)
+            sut.end_session()
+            logging.getLogger("SUTMain").info("Session ended, %s", codec_cache_report())
+            mbt_file_client.close()
+            mbt_client.close()
+            if not daemon:
+                break
 
+    except OSError as os_err:
+        logging.getLogger("SUTMain").error("Connection to the TestRunner failed - OSError: %s", os_err.strerror)
+        sys.exit(-1)
+    except Exception as err:
+        logging.getLogger("SUTMain").error("Unexpected error: %s", err)
+        sys.exit(-2)
+
+
+async def serve_session(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, sut: AsyncSUT):
+    metrics = sut.metrics
+    # The next line is read while a user call is pending, it abandons the user call.
+    next_line = asyncio.ensure_future(reader.readline())
+    try:
         while True:
-            raw = mbt_file_client.readline()
-            logging.getLogger("SUTMain").info("Got input: %s", raw)
+            raw = (await next_line).decode()
+            start = time.monotonic_ns()
+            sut.logger.info("Got input: %s", raw)
             if not raw:
                 break
+            next_line = asyncio.ensure_future(reader.readline())
 
             if not raw.strip():
                 continue
 
+            parsing = time.monotonic_ns()
             user_call = UserCall.from_torxakis(raw)
-            resp = sut.handle_user_call(user_call).to_torxakis()
-            logging.getLogger("SUTMain").info("Sending response: %s", resp)
-            mbt_file_client.write(resp + "\n")
-            mbt_file_client.flush()
+            metrics.record("sut.parse", parsing)
+            call = asyncio.ensure_future(sut.handle_user_call(user_call))
+            await asyncio.wait((call, next_line), return_when=asyncio.FIRST_COMPLETED)
+            if not call.done():
+                call.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await call
+                sut.logger.info("%s abandoned, the next user call arrived", user_call.command_type.name)
+                continue
+            result = call.result()
+            handled = time.monotonic_ns()
+            resp = result.to_torxakis()
+            encoded = metrics.record("sut.encode", handled)
+            sut.logger.info("Sending response: %s", resp)
+            writer.write((resp + "\n").encode())
+            await writer.drain()
+            metrics.record("sut.reply", encoded)
+            metrics.record("sut.step", start)
+            # While Torxakis prepares the next step.
+            sut.socket_pool.refill()
 
     except OSError as os_err:
-        logging.getLogger("SUTMain").error("Connection to the TestRunner failed - OSError: %s", os_err.strerror)
-        sys.exit(-1)
+        sut.logger.error("Connection to the TestRunner failed - OSError: %s", os_err.strerror)
     except Exception as err:
-        logging.getLogger("SUTMain").error("Unexpected error: %s", err)
-        sys.exit(-2)
+        sut.logger.error("Unexpected error: %s", err)
+    finally:
+        next_line.cancel()
+        sut.close()
+        writer.close()
+
+
+async def async_runner(ts_ip: str,
+                       mbt_port: int,
+                       sessions: int,
+                       port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+                       metrics: Optional[Metrics] = None,
+                       receive_max: int = MAX_READ_SIZE,
+                       receive_buffer: int = RECEIVE_BUFFER_SIZE,
+                       socket_pool: int = SOCKET_POOL_SIZE,
+                       time_wait: float = TIME_WAIT,
+                       timeouts: Optional[Dict[CommandType, float]] = None):
+    """
+    Serves up to ``sessions`` concurrent Torxakis connections on one event loop.
+    Every session gets its own SUT instance and its own slice of the port range,
+    the sessions record into the same metrics.
+    """
+    free_port_ranges = split_port_range(*port_range, sessions)
+    # The sessions that use a slice one after the other share its allocator, which knows the ports in TIME_WAIT.
+    allocators = {slice_range: PortAllocator(slice_range, time_wait) for slice_range in free_port_ranges}
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if not free_port_ranges:
+            logging.getLogger("SUTMain").warning("Rejecting connection, all %s sessions are in use", sessions)
+            writer.close()
+            return
+
+        port_range = free_port_ranges.pop(0)
+        name = f"SUT[{port_range[0]}-{port_range[1]}]"
+        logging.getLogger("SUTMain").info("Starting session %s", name)
+        try:
+            sut = AsyncSUT(ts_ip, port_range, name, metrics, receive_max, receive_buffer, socket_pool,
+                           allocators[port_range], timeouts)
+            await serve_session(reader, writer, sut)
+        finally:
+            logging.getLogger("SUTMain").info("Session %s ended, %s", name, codec_cache_report())
+            free_port_ranges.append(port_range)
+
+    try:
+        server = await asyncio.start_server(on_connect, port=mbt_port)
+    except OSError as os_err:
+        logging.getLogger("SUTMain").error("Cannot listen for the TestRunner - OSError: %s", os_err.strerror)
+        sys.exit(-1)
+
+    logging.getLogger("SUTMain").info("Waiting for the MBT connection on port %s", mbt_port)
+    async with server:
+        await server.serve_forever()
 
 
 if __name__ == "__main__":
@@ -85,4 +242,63 @@ if __name__ == "__main__":
         print(colored("Config file does no contain test server ip setting!", "red"))
         sys.exit(-1)
 
-    runner(ts_ip, mbt_port)
+    try:
+        sessions = config["mbt"].getint("sessions", fallback=1)
+    except ValueError as exc:
+        print(colored("Config file contains an invalid mbt sessions setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        daemon = config["mbt"].getboolean("daemon", fallback=False)
+    except ValueError as exc:
+        print(colored("Config file contains an invalid mbt daemon setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        port_range = (config["mbt"].getint("min_port", fallback=MIN_PORT),
+                      config["mbt"].getint("max_port", fallback=MAX_PORT))
+    except ValueError as exc:
+        print(colored("Config file contains an invalid mbt port range setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        receive_max = config.getint("sut", "receive_max", fallback=MAX_READ_SIZE)
+        receive_buffer = config.getint("sut", "receive_buffer", fallback=RECEIVE_BUFFER_SIZE)
+        socket_pool = config.getint("sut", "socket_pool", fallback=SOCKET_POOL_SIZE)
+        time_wait = config.getfloat("sut", "time_wait", fallback=TIME_WAIT)
+        timeouts = {command: config.getfloat("sut", f"{command.name.lower()}_timeout", fallback=timeout)
+                    for command, timeout in DEFAULT_TIMEOUTS.items()}
+    except ValueError as exc:
+        print(colored("Config file contains an invalid sut setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        metrics_port = config.get("metrics", "port", fallback="")
+        metrics = Metrics(enabled=config.getboolean("metrics", "enabled", fallback=False))
+        reporter = MetricsReporter(metrics,
+                                   path=config.get("metrics", "file", fallback="") or None,
+                                   interval=config.getfloat("metrics", "interval", fallback=DEFAULT_REPORT_INTERVAL),
+                                   port=int(metrics_port) if metrics_port else None)
+    except ValueError as exc:
+        print(colored("Config file contains an invalid metrics setting!", "red"))
+        sys.exit(-1)
+
+    if metrics.enabled:
+        try:
+            reporter.start()
+        except OSError as err:
+            print(colored(f"Cannot serve the metrics: {err}", "red"))
+            sys.exit(-1)
+        # Exit through SystemExit on SIGTERM, so that the final metrics are written.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        if sessions > 1:
+            asyncio.run(async_runner(ts_ip, mbt_port, sessions, port_range, metrics, receive_max, receive_buffer,
+                                     socket_pool, time_wait, timeouts))
+        else:
+            runner(ts_ip, mbt_port, port_range, metrics, receive_max, receive_buffer, socket_pool, time_wait,
+                   timeouts, daemon)
+    finally:
+        if metrics.enabled:
+            reporter.stop()
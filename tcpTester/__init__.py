@@ -1,3 +1,12 @@
-from .testServer import TestServer
-from .sut import SUT
+import importlib
+
 from .utils import set_up_logging
+
+# Imported on first access, so that an entry point only pays for the modules it uses (scapy in particular).
+_LAZY = {"TestServer": ".testServer", "SUT": ".sut"}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import socket
+import time
+from typing import Dict, Optional, Tuple, cast
+
+from tcpTester.metrics import Metrics
+from tcpTester.portAllocator import SOCKET_POOL_SIZE, PortAllocator, SocketPool
+from tcpTester.receiveBuffer import RECEIVE_BUFFER_SIZE, ReceiveBuffer
+from tcpTester.sut import DEFAULT_TIMEOUTS, MAX_READ_SIZE, USER_CALL_STAGES
+from tcpTester.types import (
+    MAX_PORT,
+    MIN_PORT,
+    CommandType,
+    ConnectParameters,
+    ListenParameters,
+    ReceiveParameters,
+    SendParameters,
+    UserCall,
+    UserCallResult,
+    UserCallResultType
+)
+
+
+class AsyncSUT:
+    """
+    asyncio implementation of the System Under Test (SUT).
+
+    Several instances can serve their own Torxakis sessions on one event loop; a pending accept,
+    connect or receive only suspends the session that issued it.
+    """
+
+    def __init__(self,
+                 ts_ip: str,
+                 port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+                 name: str = "SUT",
+                 metrics: Optional[Metrics] = None,
+                 receive_max: int = MAX_READ_SIZE,
+                 receive_buffer: int = RECEIVE_BUFFER_SIZE,
+                 socket_pool: int = SOCKET_POOL_SIZE,
+                 ports: Optional[PortAllocator] = None,
+                 timeouts: Optional[Dict[CommandType, float]] = None):
+        """
+        Initializes class variables.
+
+        :param ts_ip: The IP address of the test server.
+        :param port_range: The inclusive range of local ports used for active opens.
+        :param name: The name of the session, used for logging.
+        :param metrics: Records the latencies of the user calls.
+        :param receive_max: The maximum payload of a RECEIVE without an expected length.
+        :param receive_buffer: The initial size of the receive buffer.
+        :param socket_pool: The number of sockets that are bound ahead of a CONNECT.
+        :param ports: The allocator of the local ports for active opens, shared by the sessions that use the
+                      same port range one after the other so that ports in TIME_WAIT are not reused.
+        :param timeouts: The maximum duration of the user calls, see ``DEFAULT_TIMEOUTS``.
+        """
+        self.name = name
+        self.logger.info("SUT started with ports %s-%s", *port_range)
+
+        self.ts_ip = ts_ip
+        self.port_range = port_range
+        self.metrics = metrics or Metrics(enabled=False)
+        self.receive_max = receive_max
+        # Bytes received on the current connection that no RECEIVE returned yet.
+        self.receive_buffer = ReceiveBuffer(receive_buffer)
+
+        # Socket for communicating with another TCP endpoint.
+        self.client_socket: Optional[socket.socket] = None
+        # Local port of the client socket if it was opened by a CONNECT.
+        self.client_port: Optional[int] = None
+        # Socket for connecting with another TCP endpoint.
+        self.socket: Optional[socket.socket] = None
+
+        self.listen_port = -1
+
+        self.ports = ports or PortAllocator(port_range)
+        self.socket_pool = SocketPool(self.ports, socket_pool, 0.0)
+        self.socket_pool.refill()
+
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the SUT
+
+        :return: The logger for the SUT
+        """
+        return logging.getLogger(self.name)
+
+    async def handle_user_call(self, user_call: UserCall) -> UserCallResult:
+        start = time.monotonic_ns()
+        result = await self.dispatch_user_call(user_call)
+        self.metrics.record(USER_CALL_STAGES[user_call.command_type], start)
+        return result
+
+    async def dispatch_user_call(self, user_call: UserCall) -> UserCallResult:
+        if user_call.command_type == CommandType["LISTEN"]:
+            return await self.handle_listen_call(cast(ListenParameters, user_call.command_parameters))
+        if user_call.command_type == CommandType["CONNECT"]:
+            return await self.handle_connect_call(cast(ConnectParameters, user_call.command_parameters))
+        if user_call.command_type == CommandType["SEND"]:
+            return await self.handle_send_call(cast(SendParameters, user_call.command_parameters))
+        if user_call.command_type == CommandType["RECEIVE"]:
+            return await self.handle_receive_call(cast(Optional[ReceiveParameters], user_call.command_parameters))
+        if user_call.command_type == CommandType["CLOSE"]:
+            return self.handle_close_call()
+
+        return UserCallResult(UserCallResultType.FAILURE)
+
+    def reset(self):
+        """
+        Resets the sockets used to connect to and communicate with another TCP endpoint.
+        """
+        if self.client_socket:
+            self.client_socket.close()
+        self.client_socket = None
+        if self.client_port:
+            self.ports.release(self.client_port)
+            self.client_port = None
+        self.receive_buffer.clear()
+
+    def close_listening_socket(self):
+        """
+        Closes the listening socket and releases its port.
+        """
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+        if self.listen_port != -1:
+            self.ports.release(self.listen_port)
+            self.listen_port = -1
+
+    def close(self):
+        """
+        Closes all sockets of the session and releases their ports.
+        """
+        self.reset()
+        self.close_listening_socket()
+        self.socket_pool.close()
+
+    async def handle_connect_call(self, parameters: ConnectParameters):
+        """
+        Establishes a new connection with another TCP endpoint.
+        """
+        self.logger.info("Attempting to connect to %s", parameters.dst_port)
+
+        self.reset()
+        try:
+            self.client_socket, self.client_port = self.socket_pool.take_bound()
+            self.logger.info("bind successful")
+            await asyncio.wait_for(asyncio.get_running_loop().sock_connect(self.client_socket,
+                                                                           (self.ts_ip, parameters.dst_port)),
+                                   self.timeouts[CommandType.CONNECT])
+
+        except Exception:
+            return UserCallResult(status=UserCallResultType.FAILURE)
+
+        self.logger.info("connection successful")
+
+        return UserCallResult(status=UserCallResultType.SUCCESS)
+
+    async def handle_listen_call(self, parameters: ListenParameters):
+        """
+        Passively listens for an incoming connection request from another TCP endpoint.
+        """
+
+        # clear any previous sockets
+        self.reset()
+
+        self.logger.info("starting socket on %s", parameters.src_port)
+        try:
+
+            if self.listen_port != parameters.src_port or not self.socket:
+                self.close_listening_socket()
+                self.listen_port = parameters.src_port
+                self.ports.reserve(self.listen_port)
+                self.socket_pool.discard(self.listen_port)
+                listening = self.socket_pool.take_unbound()
+                try:
+                    listening.bind(("", self.listen_port))
+                    listening.listen(1)
+                except OSError:
+                    listening.close()
+                    raise
+                self.socket = listening
+
+            self.logger.info("bind and listen successful")
+
+            (self.client_socket, _) = await asyncio.wait_for(asyncio.get_running_loop().sock_accept(self.socket),
+                                                             self.timeouts[CommandType.LISTEN])
+            self.client_socket.setblocking(False)
+
+            self.logger.info("received client connect")
+
+        except Exception:
+            return UserCallResult(status=UserCallResultType.FAILURE)
+
+        return UserCallResult(status=UserCallResultType.SUCCESS)
+
+    async def handle_send_call(self, parameters: SendParameters):
+        """
+        Sends a given payload to the TCP endpoint with which the SUT is connected.
+        """
+        self.logger.info("sending packet to client")
+        if not self.client_socket:
+            return UserCallResult(status=UserCallResultType.FAILURE)
+
+        try:
+            await asyncio.wait_for(asyncio.get_running_loop().sock_sendall(self.client_socket, parameters.payload),
+                                   self.timeouts[CommandType.SEND])
+        except Exception:
+            return UserCallResult(status=UserCallResultType.FAILURE)
+
+        self.logger.info("sending completed")
+
+        return UserCallResult(status=UserCallResultType.SUCCESS)
+
+    async def handle_receive_call(self, parameters: Optional[ReceiveParameters] = None):
+        """
+        Receives data from the TCP endpoint with which the SUT is connected: everything that is available,
+        up to ``receive_max`` bytes, or, if an expected length is given, exactly that many bytes.
+        A RECEIVE that ends at the end of the stream returns the bytes received until then.
+        """
+        self.logger.info("receiving packet from client")
+        if not self.client_socket:
+            return UserCallResult(status=UserCallResultType.FAILURE)
+
+        expected = parameters.length if parameters else 0
+        self.receive_buffer.reserve(expected)
+        try:
+            await asyncio.wait_for(self.fill_receive_buffer(expected or 1), self.timeouts[CommandType.RECEIVE])
+        except Exception:
+            return UserCallResult(status=UserCallResultType.FAILURE)
+
+        payload = self.receive_buffer.take(expected or self.receive_max)
+        self.logger.info("receive completed")
+        return UserCallResult(status=UserCallResultType.RECEIVE, payload=payload)
+
+    async def fill_receive_buffer(self, length: int) -> None:
+        """
+        Reads from the connection until ``length`` bytes are buffered or the stream ends.
+        """
+        loop = asyncio.get_running_loop()
+        while len(self.receive_buffer) < length:
+            size = await loop.sock_recv_into(self.client_socket, self.receive_buffer.free())
+            if not size:
+                return
+            self.receive_buffer.commit(size)
+
+    def handle_close_call(self):
+        """
+        Disconnects the connection between the SUT and the other TCP endpoint.
+        """
+
+        self.logger.info("disconnecting from client")
+        if self.client_socket:
+            try:
+                self.client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.client_socket.close()
+            self.reset()
+            self.logger.info("disconnect completed")
+            return UserCallResult(status=UserCallResultType.SUCCESS)
+
+        self.logger.info("disconnect failed")
+        return UserCallResult(status=UserCallResultType.FAILURE)
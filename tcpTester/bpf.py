@@ -0,0 +1,95 @@
+import ctypes
+import socket
+import struct
+from typing import List, Tuple
+
+# Values from linux/filter.h
+SO_ATTACH_FILTER = getattr(socket, "SO_ATTACH_FILTER", 26)
+
+BPF_LD, BPF_LDX, BPF_JMP, BPF_RET = 0x00, 0x01, 0x05, 0x06
+BPF_W, BPF_H, BPF_B = 0x00, 0x08, 0x10
+BPF_ABS, BPF_IND, BPF_MSH = 0x20, 0x40, 0xa0
+BPF_JEQ, BPF_JGT, BPF_JGE, BPF_JSET = 0x10, 0x20, 0x30, 0x40
+BPF_K = 0x00
+
+ETH_HEADER_LEN = 14  # in bytes
+ETH_P_IP = 0x0800
+SNAP_LEN = 0x40000  # in bytes, accept whole frames
+
+# code, jump if true, jump if false, constant
+Instruction = Tuple[int, int, int, int]
+
+_DROP = -1
+
+
+def _resolve(program: List[Tuple[int, int, int, int]]) -> List[Instruction]:
+    """
+    Replaces jumps to ``_DROP`` with the offset to the final ``ret #0`` instruction.
+    """
+    drop = len(program)
+    resolved = []
+    for index, (code, jt, jf, k) in enumerate(program):
+        jt = drop - index - 1 if jt == _DROP else jt
+        jf = drop - index - 1 if jf == _DROP else jf
+        resolved.append((code, jt, jf, k))
+    resolved.append((BPF_RET | BPF_K, 0, 0, 0))
+    return resolved
+
+
+def sut_tcp_filter(sut_ip: str, min_port: int, max_port: int, link_offset: int = ETH_HEADER_LEN) -> List[Instruction]:
+    """
+    Builds a classic BPF program that accepts only IPv4 TCP segments sent by the SUT
+    from a source port within ``[min_port, max_port]``.
+
+    :param sut_ip: The IP address of the SUT.
+    :param min_port: The lowest accepted source port.
+    :param max_port: The highest accepted source port.
+    :param link_offset: The size of the link layer header, 14 for Ethernet and 0 for raw IP.
+
+    :return: The instructions of the program.
+    """
+    address = struct.unpack("!I", socket.inet_aton(sut_ip))[0]
+    program = []
+    if link_offset:
+        program += [
+            (BPF_LD | BPF_H | BPF_ABS, 0, 0, link_offset - 2),       # ethertype
+            (BPF_JMP | BPF_JEQ | BPF_K, 0, _DROP, ETH_P_IP),
+        ]
+    program += [
+        (BPF_LD | BPF_B | BPF_ABS, 0, 0, link_offset + 9),            # protocol
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, _DROP, socket.IPPROTO_TCP),
+        (BPF_LD | BPF_W | BPF_ABS, 0, 0, link_offset + 12),           # source address
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, _DROP, address),
+        (BPF_LD | BPF_H | BPF_ABS, 0, 0, link_offset + 6),            # fragment offset
+        (BPF_JMP | BPF_JSET | BPF_K, _DROP, 0, 0x1fff),
+        (BPF_LDX | BPF_B | BPF_MSH, 0, 0, link_offset),               # X = IP header length
+        (BPF_LD | BPF_H | BPF_IND, 0, 0, link_offset),                # source port
+        (BPF_JMP | BPF_JGE | BPF_K, 0, _DROP, min_port),
+        (BPF_JMP | BPF_JGT | BPF_K, _DROP, 0, max_port),
+        (BPF_RET | BPF_K, 0, 0, SNAP_LEN),
+    ]
+    return _resolve(program)
+
+
+def attach_filter(sock: socket.socket, program: List[Instruction]) -> None:
+    """
+    Attaches a classic BPF program to a socket, so that the kernel drops non-matching frames
+    before they are copied to userspace. Frames queued before the filter was attached are discarded.
+
+    :param sock: The capture socket.
+    :param program: The instructions of the program.
+    """
+    instructions = b"".join(struct.pack("HBBI", *instruction) for instruction in program)
+    buffer = ctypes.create_string_buffer(instructions)
+    fprog = struct.pack("HL", len(program), ctypes.addressof(buffer))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    blocking = sock.getblocking()
+    sock.setblocking(False)
+    try:
+        while True:
+            sock.recv(SNAP_LEN)
+    except BlockingIOError:
+        pass
+    finally:
+        sock.setblocking(blocking)
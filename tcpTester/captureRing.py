@@ -0,0 +1,332 @@
+import multiprocessing
+import os
+import select
+import socket
+import struct
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import DupFd
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.synchronize import Event
+from typing import Callable, Dict, Optional, Tuple
+
+from tcpTester.bpf import ETH_HEADER_LEN, attach_filter, sut_tcp_filter
+
+DEFAULT_RING_SIZE = 4 * 1024 * 1024  # in bytes
+MAX_FRAME = 0x10000 + ETH_HEADER_LEN  # in bytes, a maximal IP packet in an Ethernet frame
+POLL_INTERVAL = 0.2  # in seconds, how often the worker checks whether it should stop
+WAKE_TIMEOUT = 0.01  # in seconds, the longest a reader sleeps if it misses a wake-up
+START_TIMEOUT = 10.0  # in seconds, how long the capture process may take to open its socket
+STATISTICS_INTERVAL = 1024  # frames between two reads of the kernel's drop counter
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+SO_RCVBUFFORCE = 33
+
+# Header of the ring: the positions and the counters are written by one side only, the reader sets the waiting
+# flag before it sleeps and the worker clears it when it wakes the reader up.
+_WRITE, _READ, _CAPTURED, _DROPPED, _KERNEL_DROPS, _WAITING = (offset * 8 for offset in range(6))
+HEADER_LEN = 64  # in bytes
+_COUNTER = struct.Struct("=Q")
+# Every record is a frame length and the frame, padded to 8 bytes.
+_RECORD = struct.Struct("=I4x")
+_WRAP = 0xffffffff
+_TPACKET_STATS = struct.Struct("=II")
+
+
+def _padded(size: int) -> int:
+    return (_RECORD.size + size + 7) & ~7
+
+
+class CaptureRing:
+    """
+    A ring buffer of captured frames in shared memory, written by one process and read by another.
+
+    The capture worker receives every frame straight into a free record and publishes it by advancing the
+    write position; the reader decodes the frames in place and releases them by advancing the read position.
+    Each position is only written by one side. A frame that does not fit into the free space is dropped and
+    counted, so a slow reader never stalls the capture.
+    """
+
+    def __init__(self, size: int = DEFAULT_RING_SIZE, name: Optional[str] = None):
+        """
+        Creates a new ring, or attaches to the ring of another process.
+
+        :param size: The size of the frame area, at least twice the maximal frame.
+        :param name: The name of the shared memory of an existing ring.
+        """
+        if name is None:
+            size = max(size, 2 * _padded(MAX_FRAME)) & ~7
+            self.memory = SharedMemory(create=True, size=HEADER_LEN + size)
+            self.memory.buf[:HEADER_LEN] = bytes(HEADER_LEN)
+        else:
+            self.memory = SharedMemory(name=name)
+        self.owner = name is None
+        self.size = size
+        self.view = self.memory.buf
+        self.frames = self.view[HEADER_LEN:HEADER_LEN + size]
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def counter(self, field: int) -> int:
+        return _COUNTER.unpack_from(self.view, field)[0]
+
+    def set_counter(self, field: int, value: int) -> None:
+        _COUNTER.pack_into(self.view, field, value)
+
+    def reserve(self) -> Optional[memoryview]:
+        """
+        Returns the free record for the next frame, as the worker receives into it, or None if the ring is
+        full. Skips the end of the frame area if the record would not fit before it.
+        """
+        write = self.counter(_WRITE)
+        free = self.size - (write - self.counter(_READ))
+        offset = write % self.size
+        needed = _padded(MAX_FRAME)
+        if self.size - offset < needed:
+            if free < self.size - offset + needed:
+                return None
+            _RECORD.pack_into(self.frames, offset, _WRAP)
+            write += self.size - offset
+            self.set_counter(_WRITE, write)
+            offset = 0
+        elif free < needed:
+            return None
+        return self.frames[offset + _RECORD.size:offset + _RECORD.size + MAX_FRAME]
+
+    def commit(self, size: int) -> bool:
+        """
+        Publishes a frame of ``size`` bytes in the reserved record.
+
+        :return: Whether the reader waits for frames and has to be woken up.
+        """
+        write = self.counter(_WRITE)
+        _RECORD.pack_into(self.frames, write % self.size, size)
+        self.set_counter(_WRITE, write + _padded(size))
+        self.set_counter(_CAPTURED, self.counter(_CAPTURED) + 1)
+        if self.counter(_WAITING):
+            self.set_counter(_WAITING, 0)
+            return True
+        return False
+
+    def drain(self, handle: Callable[[memoryview], None]) -> int:
+        """
+        Hands every published frame to ``handle`` without copying it and releases it afterwards.
+
+        :return: The number of frames.
+        """
+        count = 0
+        read = self.counter(_READ)
+        write = self.counter(_WRITE)
+        while read != write:
+            offset = read % self.size
+            size = _RECORD.unpack_from(self.frames, offset)[0]
+            if size == _WRAP:
+                read += self.size - offset
+                continue
+            handle(self.frames[offset + _RECORD.size:offset + _RECORD.size + size])
+            read += _padded(size)
+            count += 1
+            self.set_counter(_READ, read)
+            if read == write:
+                write = self.counter(_WRITE)
+        self.set_counter(_READ, read)
+        return count
+
+    def empty(self) -> bool:
+        return self.counter(_READ) == self.counter(_WRITE)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the captured frames, the frames dropped because the ring was full, the frames the kernel
+        dropped before the worker read them and the frames that wait for the reader.
+        """
+        return {
+            "captured": self.counter(_CAPTURED),
+            "dropped": self.counter(_DROPPED),
+            "kernel_drops": self.counter(_KERNEL_DROPS),
+            "pending_bytes": self.counter(_WRITE) - self.counter(_READ),
+        }
+
+    def close(self) -> None:
+        """
+        Detaches from the shared memory, the creating side also removes it.
+        """
+        self.frames.release()
+        self.view = self.frames = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _open_socket(iface: str,
+                 sut_ip: str,
+                 port_range: Tuple[int, int],
+                 kernel_filter: bool,
+                 buffer_size: int) -> socket.socket:
+    capture_socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+    # A socket buffer as large as the ring absorbs bursts while the worker waits for the CPU.
+    try:
+        capture_socket.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, buffer_size)
+    except OSError:
+        # limited to net.core.rmem_max without CAP_NET_ADMIN
+        capture_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+    capture_socket.bind((iface, ETH_P_ALL))
+    if kernel_filter:
+        try:
+            attach_filter(capture_socket, sut_tcp_filter(sut_ip, *port_range))
+        except OSError:
+            # the reader filters in Python as well
+            pass
+    capture_socket.settimeout(POLL_INTERVAL)
+    return capture_socket
+
+
+def capture_worker(ring_name: str,
+                   ring_size: int,
+                   source: Tuple,
+                   wake: Connection,
+                   ready: Event,
+                   stop: Event) -> None:
+    """
+    The capture process: receives frames into the ring until ``stop`` is set. Sets ``ready`` once it captures.
+
+    :param source: ``("iface", iface, sut_ip, port_range, kernel_filter)`` to capture on an interface, or
+                   ``("tun", DupFd(fd))`` to read the TUN device of the TestServer.
+    """
+    ring = CaptureRing(ring_size, ring_name)
+    scratch = memoryview(bytearray(MAX_FRAME))
+    capture_socket = None
+    tun_fd = -1
+
+    def receive(buffer: memoryview) -> int:
+        if capture_socket:
+            try:
+                size, address = capture_socket.recvfrom_into(buffer)
+            except socket.timeout:
+                return 0
+            return 0 if address[2] == socket.PACKET_OUTGOING else size
+        readable, _, _ = select.select([tun_fd], [], [], POLL_INTERVAL)
+        return os.readv(tun_fd, [buffer]) if readable else 0
+
+    frames = 0
+    try:
+        if source[0] == "iface":
+            capture_socket = _open_socket(*source[1:], ring_size)
+        else:
+            tun_fd = source[1].detach()
+        ready.set()
+        while not stop.is_set():
+            record = ring.reserve()
+            size = receive(scratch if record is None else record)
+            if not size:
+                continue
+            if record is None:
+                ring.set_counter(_DROPPED, ring.counter(_DROPPED) + 1)
+            elif ring.commit(size):
+                wake.send_bytes(b"")
+            frames += 1
+            if capture_socket and frames % STATISTICS_INTERVAL == 0:
+                _add_kernel_drops(ring, capture_socket)
+    except (OSError, EOFError):
+        # the TestServer closed the device or exited
+        pass
+    finally:
+        if capture_socket:
+            _add_kernel_drops(ring, capture_socket)
+            capture_socket.close()
+        elif tun_fd >= 0:
+            os.close(tun_fd)
+        record = None
+        scratch.release()
+        ring.close()
+
+
+def _add_kernel_drops(ring: CaptureRing, capture_socket: socket.socket) -> None:
+    # reading the statistics resets them
+    _, drops = _TPACKET_STATS.unpack(capture_socket.getsockopt(SOL_PACKET, PACKET_STATISTICS, _TPACKET_STATS.size))
+    ring.set_counter(_KERNEL_DROPS, ring.counter(_KERNEL_DROPS) + drops)
+
+
+class CaptureProcess:
+    """
+    Captures frames in a dedicated process, so that the capture keeps up with bursts while the TestServer's
+    process is busy with abstraction, the send path and the MBT channel. The frames are read from a
+    ``CaptureRing`` in shared memory.
+    """
+
+    def __init__(self, source: Tuple, ring_size: int = DEFAULT_RING_SIZE):
+        """
+        Creates the ring and starts the capture process, returns once it captures.
+
+        :param source: Where to capture, see ``capture_worker``. The fd of a TUN device is passed to the
+                       process, which reads it from then on.
+        :param ring_size: The size of the ring, in bytes.
+        """
+        self.ring = CaptureRing(ring_size)
+        context = multiprocessing.get_context("spawn")
+        self.stop_event = context.Event()
+        ready = context.Event()
+        self.wake, wake_sender = context.Pipe(duplex=False)
+        if source[0] == "tun":
+            source = ("tun", DupFd(source[1]))
+        self.process = context.Process(target=capture_worker,
+                                       args=(self.ring.name, self.ring.size, source, wake_sender, ready,
+                                             self.stop_event),
+                                       name="CaptureProcess",
+                                       daemon=True)
+        self.process.start()
+        wake_sender.close()
+        # Frames that arrive before the capture socket is open would be missed.
+        deadline = time.monotonic() + START_TIMEOUT
+        while not ready.wait(WAKE_TIMEOUT):
+            if not self.process.is_alive() or time.monotonic() >= deadline:
+                self.close()
+                raise OSError("The capture process did not start")
+
+    def drain(self, handle: Callable[[memoryview], None], timeout: float) -> int:
+        """
+        Hands the captured frames to ``handle``, waits up to ``timeout`` for frames if there are none.
+
+        :return: The number of frames.
+        """
+        count = self.ring.drain(handle)
+        if count:
+            return count
+        self.ring.set_counter(_WAITING, 1)
+        if self.ring.empty():
+            # a missed wake-up only delays the frames by WAKE_TIMEOUT
+            if self.wake.poll(min(timeout, WAKE_TIMEOUT)):
+                while self.wake.poll(0):
+                    self.wake.recv_bytes()
+        self.ring.set_counter(_WAITING, 0)
+        return self.ring.drain(handle)
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stats(self) -> Dict[str, int]:
+        return self.ring.stats()
+
+    def report(self) -> str:
+        """
+        Summarizes the captured and dropped frames.
+        """
+        stats = self.stats()
+        return f"{stats['captured']} frames captured, {stats['dropped']} dropped by the ring, " \
+               f"{stats['kernel_drops']} by the kernel"
+
+    def close(self) -> None:
+        """
+        Stops the capture process and removes the ring.
+        """
+        self.stop_event.set()
+        self.process.join(POLL_INTERVAL * 5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.wake.close()
+        self.ring.close()
@@ -0,0 +1,250 @@
+import logging
+import time
+from collections import OrderedDict
+from random import randint
+from typing import Iterator, Optional, Tuple
+
+DEFAULT_MAX_CONNECTIONS = 4096
+DEFAULT_IDLE_TIMEOUT = 300  # in seconds
+DEFAULT_PEER_MSS = 536  # in bytes, the maximum segment size of a peer that does not send the option (RFC 9293)
+
+# (TestServer ip, TestServer port, SUT ip, SUT port)
+ConnectionKey = Tuple[str, int, str, int]
+
+
+class Connection:
+    """
+    Sequence state of one TCP connection for which the TestServer stubs the communication partner.
+    Ports are seen from the TestServer, i.e. ``sport`` is the TestServer's port and ``dport`` the SUT's.
+    """
+
+    def __init__(self, key: ConnectionKey):
+        """
+        Initializes class variables.
+        """
+        self.key = key
+        self.sport = key[1]
+        self.dport = key[3]
+        self.seq = randint(3000000, 4999999)
+        self.ack = -1
+        self.last_activity = time.monotonic()
+
+        # Send state of the SUT's side: its maximum segment size, and the highest acknowledgement number and
+        # the receive window of its latest segment, None until the SUT sent one.
+        self.peer_mss = DEFAULT_PEER_MSS
+        self.peer_ack: Optional[int] = None
+        self.peer_window: Optional[int] = None
+        # Sequence numbers of a payload that is sent in several segments, the SUT's acknowledgements
+        # within it are not reported to the model.
+        self.segmented: Optional[Tuple[int, int]] = None
+        # Sequence numbers that acknowledge the TestServer's fin (F) and the SUT's fin, None until it was sent,
+        # and whether the other side acknowledged it.
+        self.fin_seq: Optional[int] = None
+        self.peer_fin_seq: Optional[int] = None
+        self.fin_acked = False
+        self.peer_fin_acked = False
+        # Whether the connection was reset or both fins were acknowledged. A closed connection stays in the
+        # table, so that late segments of the SUT are still abstracted, until its ports are reused.
+        self.closed = False
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for connections.
+
+        :return: The logger for connections.
+        """
+        return logging.getLogger("Connection")
+
+    def update_sequence_num(self, length: int) -> None:
+        """
+        Updates the sequence number after a segment of a given length was sent.
+        """
+        self.seq += length
+
+    def update_ack_num(self, seq: int, length: int) -> None:
+        """
+        Updates the acknowledgement number after a segment was received from the SUT.
+        """
+        self.ack = seq + length
+
+    def acknowledge_fin(self, ack: int) -> None:
+        """
+        Notes that the SUT acknowledged ``ack``, which may cover the TestServer's fin.
+        """
+        if self.fin_seq is not None and ack >= self.fin_seq:
+            self.fin_acked = True
+
+    def acknowledge_peer_fin(self, ack: int) -> None:
+        """
+        Notes that the TestServer acknowledged ``ack``, which may cover the SUT's fin.
+        """
+        if self.peer_fin_seq is not None and ack >= self.peer_fin_seq:
+            self.peer_fin_acked = True
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether both sides sent a fin and acknowledged the fin of the other side.
+        """
+        return self.fin_acked and self.peer_fin_acked
+
+    def update_window(self, ack: int, window: int) -> None:
+        """
+        Updates the SUT's acknowledgement number and receive window after it sent a segment with the ACK flag.
+        """
+        if self.peer_ack is None or ack >= self.peer_ack:
+            self.peer_ack = ack
+            self.peer_window = window
+
+    def usable_window(self, seq: int) -> Optional[int]:
+        """
+        Returns how many bytes starting at ``seq`` the SUT's receive window allows, None if it is unknown.
+        """
+        if self.peer_ack is None or self.peer_window is None:
+            return None
+        return self.peer_ack + self.peer_window - seq
+
+    def absorbs(self, ack: int) -> bool:
+        """
+        Whether an acknowledgement of the SUT only covers part of a segmented payload. Ends the segmented
+        payload once the SUT acknowledges all of it.
+        """
+        if not self.segmented:
+            return False
+        start, end = self.segmented
+        if ack >= end:
+            self.segmented = None
+            return False
+        return ack > start
+
+    def validate_packet_seq(self, seq: int, length: int) -> bool:
+        """
+        Validates the sequence number of a segment received from the SUT.
+
+        :param seq: The sequence number of the segment.
+        :param length: The length of the segment, see ``Segment.length``.
+        """
+        if self.ack == -1:
+            # first packet received in a new connection
+            # thus have no previous knowledge about the other
+            # party's seq value
+            return True
+
+        if seq > self.ack:
+            self.logger.info("Received future packet with seq %s != %s", seq, self.ack)
+            return False
+
+        if seq < self.ack:
+            if seq + length == self.ack:
+                # duplicate packet
+                self.logger.info("Got duplicate packet %s != %s", seq, self.ack)
+                return True
+            self.logger.info("Received past packet with seq %s != %s", seq, self.ack)
+            return False
+
+        return True
+
+    def validate_packet_ack(self, ack: int) -> bool:
+        """
+        Validates the acknowledgement number of a segment received from the SUT.
+        """
+        if self.ack == -1:
+            # first packet received in a new connection
+            # so the other party does not know our seq
+            return True
+
+        if ack > self.seq:
+            self.logger.info("Received packet with future ack %s != %s", ack, self.seq)
+            return False
+
+        if ack < self.seq:
+            self.logger.info("Received packet with past ack %s != %s", ack, self.seq)
+            return False
+        return True
+
+
+class ConnectionTable:
+    """
+    Connections of a TestServer keyed by their 4-tuple.
+
+    Entries are kept in order of their last activity, so lookups, insertions and
+    evictions of idle or surplus connections are all O(1) per entry.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        """
+        Initializes class variables.
+
+        :param max_connections: The maximum number of connections, the least recently active ones are evicted.
+        :param idle_timeout: The time after which an inactive connection is evicted.
+        """
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connections: "OrderedDict[ConnectionKey, Connection]" = OrderedDict()
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the ConnectionTable.
+
+        :return: The logger for the ConnectionTable.
+        """
+        return logging.getLogger("ConnectionTable")
+
+    def get(self, key: ConnectionKey) -> Optional[Connection]:
+        """
+        Looks up a connection and marks it as active.
+
+        :return: The connection, or None if there is no connection with the given 4-tuple.
+        """
+        connection = self.connections.get(key)
+        if connection:
+            connection.last_activity = time.monotonic()
+            self.connections.move_to_end(key)
+        return connection
+
+    def open(self, key: ConnectionKey) -> Connection:
+        """
+        Creates a new connection, replacing any previous connection with the same 4-tuple.
+        """
+        self.evict()
+        connection = Connection(key)
+        self.connections.pop(key, None)
+        self.connections[key] = connection
+        return connection
+
+    def is_open(self, key: ConnectionKey) -> bool:
+        """
+        Whether there is a connection with the given 4-tuple that is not closed, without marking it as active.
+        """
+        connection = self.connections.get(key)
+        return connection is not None and not connection.closed
+
+    def evict(self) -> None:
+        """
+        Removes the connections that were idle for too long, and the least recently
+        active ones if the table is full.
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        while self.connections:
+            key, connection = next(iter(self.connections.items()))
+            if connection.last_activity > deadline and len(self.connections) < self.max_connections:
+                break
+            self.logger.info("Evicting connection %s", key)
+            del self.connections[key]
+
+    def clear(self) -> None:
+        """
+        Removes all connections.
+        """
+        self.connections.clear()
+
+    def __contains__(self, key: ConnectionKey) -> bool:
+        return key in self.connections
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def __iter__(self) -> Iterator[Connection]:
+        return iter(self.connections.values())
@@ -0,0 +1,346 @@
+import logging
+import random
+import string
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from queue import Empty, Queue
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from tcpTester.sut import SUT
+from tcpTester.testServer import TestServer
+from tcpTester.types import (ACK, MAX_PORT, MIN_PORT, SEQ, TCPFlag, TCPPacket, UserCall, UserCallResult,
+                             UserCallResultType)
+
+# Ports that the guards of the model accept (isListenUserCall, isConnectUserCall, isSyn).
+MODEL_PORTS = (MIN_PORT + 1, MAX_PORT - 1)
+MAX_PAYLOAD = 50  # as isValidPayload in the model
+OUTPUT_TIMEOUT = 2.0  # in seconds, how long an output of the SUT is awaited
+NOISE_SETTLE = 0.02  # in seconds, how long the SUT's answers to an out-of-window segment are collected
+TRACE_LENGTH = 50  # steps kept for the report of a violation
+
+SEND = "send"
+RECEIVE = "receive"
+NOISE = "noise"
+CLOSE = "close"
+DEFAULT_RULES = {SEND: 4, RECEIVE: 4, NOISE: 2, CLOSE: 1}
+
+Expectation = Tuple[str, Callable[[TCPPacket], bool]]
+
+
+class OracleViolation(Exception):
+    """
+    The SUT produced an output that the model does not allow, or none where one is required.
+    """
+
+
+# The packets and guards of Tcp.txs.
+def syn(sport: int, dport: int) -> TCPPacket:
+    return TCPPacket(sport, dport, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.SYN, b'')
+
+
+def synack(sport: int, dport: int) -> TCPPacket:
+    return TCPPacket(sport, dport, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK | TCPFlag.SYN, b'')
+
+
+def ack(sport: int, dport: int, payload: bytes = b'') -> TCPPacket:
+    return TCPPacket(sport, dport, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK, payload)
+
+
+def finack(sport: int, dport: int) -> TCPPacket:
+    return TCPPacket(sport, dport, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK | TCPFlag.FIN, b'')
+
+
+def is_syn(packet: TCPPacket) -> bool:
+    return packet == syn(packet.sport, packet.dport) and MODEL_PORTS[0] <= packet.sport <= MODEL_PORTS[1]
+
+
+def is_packet(expected: TCPPacket) -> Expectation:
+    """
+    Expects exactly the given packet.
+    """
+    return expected.to_torxakis(), lambda packet: packet == expected
+
+
+class PacketQueue:
+    """
+    Stands in for the MBT channel of the TestServer and queues the abstract packets of the SUT.
+    """
+
+    def __init__(self):
+        """
+        Initializes class variables.
+        """
+        self.queue: Queue = Queue()
+
+    def write(self, lines: str) -> int:
+        for line in lines.splitlines():
+            self.queue.put(TCPPacket.from_torxakis(line))
+        return len(lines)
+
+    def flush(self) -> None:
+        pass
+
+
+class FuzzDriver:
+    """
+    Runs random walks through the model of Tcp.txs without Torxakis: a TestServer and a SUT in the same
+    process take the place of the MBT channels and every output of the SUT is checked by an oracle of the
+    model's rules.
+
+    Every walk opens a connection passively (LISTEN) or actively (CONNECT), sends and receives valid
+    payloads, and closes it from the SUT's or the test server's side first. Between these steps it sends
+    out-of-window segments with random flags and payloads, beyond the model, that the SUT may only answer
+    with an acknowledgement and that must leave the connection intact.
+    """
+
+    def __init__(self,
+                 test_server: TestServer,
+                 packets: PacketQueue,
+                 sut: SUT,
+                 rules: Optional[Dict[str, float]] = None,
+                 timeout: float = OUTPUT_TIMEOUT,
+                 seed: Optional[int] = None):
+        """
+        Initializes class variables.
+
+        :param test_server: The TestServer, it must write to ``packets``.
+        :param packets: The abstract packets of the SUT.
+        :param sut: The SUT adapter, on the host whose TCP stack is tested.
+        :param rules: The weights of the steps on an established connection, see ``DEFAULT_RULES``.
+        :param timeout: How long an output of the SUT is awaited.
+        :param seed: The seed of the random choices.
+        """
+        self.test_server = test_server
+        self.packets = packets
+        self.sut = sut
+        rules = rules or DEFAULT_RULES
+        self.rules = [rule for rule in DEFAULT_RULES if rules.get(rule, 0) > 0]
+        self.weights = [rules[rule] for rule in self.rules]
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.user = ThreadPoolExecutor(max_workers=1, thread_name_prefix="FuzzUser")
+        self.pending: Optional[Future] = None
+
+        self.steps = 0
+        self.connections = 0
+        self.applied: Counter = Counter()
+        self.trace: Deque[str] = deque(maxlen=TRACE_LENGTH)
+        # The test server's next port, cycled through the model's ports so that no 4-tuple is in TIME_WAIT.
+        self.next_port = self.random.randint(*MODEL_PORTS)
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the FuzzDriver.
+
+        :return: The logger for the FuzzDriver.
+        """
+        return logging.getLogger("FuzzDriver")
+
+    def record(self, channel: str, value: str) -> None:
+        self.steps += 1
+        self.trace.append(f"{channel} {value}")
+
+    def port(self) -> int:
+        port = self.next_port
+        self.next_port = port + 1 if port < MODEL_PORTS[1] else MODEL_PORTS[0]
+        return port
+
+    def payload(self) -> bytes:
+        return "".join(self.random.choices(string.ascii_letters, k=self.random.randint(1, MAX_PAYLOAD))).encode()
+
+    def send(self, packet: TCPPacket) -> None:
+        """
+        InSutNet: sends a packet from the test server.
+        """
+        self.record("InSutNet", packet.to_torxakis())
+        self.test_server.handle_send_command(packet)
+
+    def call(self, user_call: str) -> None:
+        """
+        InSutUser: starts a user call of the SUT, its result is checked with ``expect_user``.
+        """
+        self.record("InSutUser", user_call)
+        self.pending = self.user.submit(self.sut.handle_user_call, UserCall.from_torxakis(user_call))
+
+    def expect_user(self, expected: UserCallResult) -> None:
+        """
+        OutSutUser: checks the result of the pending user call.
+        """
+        future, self.pending = self.pending, None
+        try:
+            result = future.result(self.timeout)
+        except FutureTimeoutError as exc:
+            raise OracleViolation(f"No result of the user call, expected {expected.to_torxakis()}") from exc
+        self.record("OutSutUser", result.to_torxakis() if result else "None")
+        if result != expected:
+            raise OracleViolation(f"Expected {expected.to_torxakis()}")
+
+    def expect_net(self, *expected: Expectation) -> List[TCPPacket]:
+        """
+        OutSutNet: waits for packets of the SUT that match the expectations, in any order.
+
+        :return: The matching packets, in the order of the expectations.
+        """
+        remaining = list(enumerate(expected))
+        matched: List[Optional[TCPPacket]] = [None] * len(expected)
+        deadline = time.monotonic() + self.timeout
+        while remaining:
+            try:
+                packet = self.packets.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except Empty as exc:
+                missing = ", ".join(name for _, (name, _) in remaining)
+                raise OracleViolation(f"No output of the SUT, expected {missing}") from exc
+            self.record("OutSutNet", packet.to_torxakis())
+            for position, (index, (_, predicate)) in enumerate(remaining):
+                if predicate(packet):
+                    matched[index] = packet
+                    del remaining[position]
+                    break
+            else:
+                raise OracleViolation("Unexpected output of the SUT")
+        return matched
+
+    def expect_quiet(self, tolerated: Callable[[TCPPacket], bool], duration: float) -> None:
+        """
+        Checks that the SUT only sends tolerated packets for a while.
+        """
+        deadline = time.monotonic() + duration
+        while True:
+            try:
+                packet = self.packets.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except Empty:
+                return
+            self.record("OutSutNet", packet.to_torxakis())
+            if not tolerated(packet):
+                raise OracleViolation("Unexpected answer to an out-of-window segment")
+
+    def passive_open(self) -> Tuple[int, int]:
+        """
+        sutPassiveOpen: LISTEN, the test server's SYN, the SUT's SYN-ACK and the test server's ACK.
+
+        :return: The SUT's and the test server's port.
+        """
+        lport = self.random.randint(*MODEL_PORTS)
+        ts_port = self.port()
+        self.call(f"LISTEN({lport})")
+        self.send(syn(ts_port, lport))
+        self.expect_net(is_packet(synack(lport, ts_port)))
+        self.send(ack(ts_port, lport))
+        self.expect_user(UserCallResult(UserCallResultType.SUCCESS))
+        return lport, ts_port
+
+    def active_open(self) -> Tuple[int, int]:
+        """
+        sutActiveOpen: CONNECT, the SUT's SYN, the test server's SYN-ACK and the SUT's ACK.
+
+        :return: The SUT's and the test server's port.
+        """
+        cport = self.port()
+        self.call(f"CONNECT({cport})")
+        sent = self.expect_net((f"syn(?, {cport})", lambda packet: is_syn(packet) and packet.dport == cport))
+        sut_port = sent[0].sport
+        self.send(synack(cport, sut_port))
+        self.expect_net(is_packet(ack(sut_port, cport)))
+        self.expect_user(UserCallResult(UserCallResultType.SUCCESS))
+        return sut_port, cport
+
+    def send_payload(self, sut_port: int, ts_port: int) -> None:
+        """
+        sutSendPayload: SEND, the SUT's data and the test server's ACK.
+        """
+        payload = self.payload()
+        self.call(f'SEND("{payload.decode()}")')
+        self.expect_net(is_packet(ack(sut_port, ts_port, payload)))
+        self.expect_user(UserCallResult(UserCallResultType.SUCCESS))
+        self.send(ack(ts_port, sut_port))
+
+    def receive_payload(self, sut_port: int, ts_port: int) -> None:
+        """
+        sutReceivePayload: the test server's data, the SUT's ACK and RECEIVE.
+        """
+        payload = self.payload()
+        self.send(ack(ts_port, sut_port, payload))
+        self.expect_net(is_packet(ack(sut_port, ts_port)))
+        self.call("RECEIVE")
+        self.expect_user(UserCallResult(UserCallResultType.RECEIVE, payload))
+
+    def send_noise(self, sut_port: int, ts_port: int) -> None:
+        """
+        Sends a segment outside of the SUT's receive window. It must not be delivered, and it may only be
+        answered with an acknowledgement of the current state (RFC 793, RFC 5961).
+        """
+        flags = TCPFlag.from_bits(self.random.getrandbits(8))
+        ack_status = self.random.choice([ACK.ACK_VALID, ACK.ACK_INVALID])
+        payload = self.payload() if self.random.random() < 0.5 else b''
+        self.send(TCPPacket(ts_port, sut_port, SEQ.SEQ_INVALID, ack_status, flags, payload))
+        self.expect_quiet(lambda packet: packet == ack(sut_port, ts_port), NOISE_SETTLE)
+
+    def close_connection(self, sut_port: int, ts_port: int) -> None:
+        """
+        sutPassiveActiveClose: tsCloseEnd and sutCloseEnd, with either side closing first.
+        """
+        if self.random.random() < 0.5:
+            self.call("CLOSE")
+            self.expect_net(is_packet(finack(sut_port, ts_port)))
+            self.expect_user(UserCallResult(UserCallResultType.SUCCESS))
+            self.send(ack(ts_port, sut_port))
+            self.send(finack(ts_port, sut_port))
+            self.expect_net(is_packet(ack(sut_port, ts_port)))
+        else:
+            self.send(finack(ts_port, sut_port))
+            self.expect_net(is_packet(ack(sut_port, ts_port)))
+            self.call("CLOSE")
+            self.expect_net(is_packet(finack(sut_port, ts_port)))
+            self.expect_user(UserCallResult(UserCallResultType.SUCCESS))
+            self.send(ack(ts_port, sut_port))
+
+    def walk(self) -> None:
+        """
+        One iteration of tcpBehavior: opens a connection, applies random rules and closes it.
+        """
+        self.test_server.reset()
+        self.connections += 1
+        if self.random.random() < 0.5:
+            self.applied["passive_open"] += 1
+            sut_port, ts_port = self.passive_open()
+        else:
+            self.applied["active_open"] += 1
+            sut_port, ts_port = self.active_open()
+
+        while True:
+            rule = self.random.choices(self.rules, self.weights)[0]
+            self.applied[rule] += 1
+            if rule == CLOSE:
+                self.close_connection(sut_port, ts_port)
+                return
+            if rule == SEND:
+                self.send_payload(sut_port, ts_port)
+            elif rule == RECEIVE:
+                self.receive_payload(sut_port, ts_port)
+            else:
+                self.send_noise(sut_port, ts_port)
+
+    def run(self, steps: int, duration: Optional[float] = None) -> Optional[OracleViolation]:
+        """
+        Walks through the model until ``steps`` steps are taken, ``duration`` seconds passed or the
+        oracle finds a violation.
+
+        :return: The violation, None if the SUT conformed to the model.
+        """
+        deadline = time.monotonic() + duration if duration else None
+        while self.steps < steps and (not deadline or time.monotonic() < deadline):
+            try:
+                self.walk()
+            except OracleViolation as violation:
+                self.logger.error("Violation after %s steps: %s", self.steps, violation)
+                return violation
+        return None
+
+    def close(self) -> None:
+        """
+        Waits for a pending user call and stops the thread of the user calls.
+        """
+        self.user.shutdown(wait=True)
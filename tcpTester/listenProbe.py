@@ -0,0 +1,129 @@
+import logging
+import time
+from random import randint
+from threading import Condition
+from typing import List, Optional
+
+from tcpTester.sendEngine import SendEngine, TCP_FLAG_BITS
+
+READY_TIMEOUT = 2.0  # in seconds
+READY_PROBE_INTERVAL = 0.05  # in seconds
+PROBE_PORT = 60999  # outside of the model's port range
+
+_SYN = TCP_FLAG_BITS["S"]
+_ACK = TCP_FLAG_BITS["A"]
+_RST = TCP_FLAG_BITS["R"]
+
+
+class ListenProbe:
+    """
+    Determines whether the SUT listens on a port by sending SYN probes from a dedicated port.
+
+    The SUT answers a probe with a SYN-ACK once it listens and with a RST before that. The sniffer
+    hands these answers to ``handle_reply``, which wakes up ``wait_until_listening``.
+    """
+
+    def __init__(self,
+                 sut_ip: str,
+                 iface: Optional[str] = None,
+                 timeout: float = READY_TIMEOUT,
+                 interval: float = READY_PROBE_INTERVAL,
+                 port: int = PROBE_PORT,
+                 engine: Optional[SendEngine] = None):
+        """
+        Initializes class variables.
+
+        :param sut_ip: The IP address of the SUT.
+        :param iface: Optional interface to send the probes on.
+        :param timeout: The maximum time to wait for the SUT, 0 disables probing.
+        :param interval: The time between two probes.
+        :param port: The source port of the probes.
+        :param engine: Optional send engine for the probes, by default one on a raw socket.
+        """
+        self.timeout = timeout
+        self.interval = interval
+        self.port = port
+        self.engine = None
+        if timeout > 0:
+            self.engine = engine or SendEngine(sut_ip, iface)
+
+        self.condition = Condition()
+        self.target: Optional[int] = None
+        self.ready = False
+        # Time spent waiting for the SUT, one entry per wait.
+        self.delays: List[float] = []
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the ListenProbe.
+
+        :return: The logger for the ListenProbe.
+        """
+        return logging.getLogger("ListenProbe")
+
+    def wait_until_listening(self, dport: int) -> bool:
+        """
+        Probes a port of the SUT until it accepts connections or the timeout expires.
+
+        :param dport: The port of the SUT.
+
+        :return: Whether the SUT listens on the port.
+        """
+        if not self.engine:
+            return True
+
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self.condition:
+            self.target = dport
+            self.ready = False
+            while True:
+                self.engine.set_ports(self.port, dport)
+                self.engine.send(randint(3000000, 4999999), 0, _SYN)
+
+                remaining = deadline - time.monotonic()
+                self.condition.wait_for(lambda: self.ready, timeout=max(min(self.interval, remaining), 0))
+                if self.ready or time.monotonic() >= deadline:
+                    break
+            self.target = None
+            ready = self.ready
+
+        delay = time.monotonic() - start
+        self.delays.append(delay)
+        if ready:
+            self.logger.info("SUT listens on port %s after %.1f ms", dport, delay * 1000)
+        else:
+            self.logger.warning("SUT did not listen on port %s within %.1f ms", dport, delay * 1000)
+        return ready
+
+    def handle_reply(self, sport: int, ack: int, flags: int) -> None:
+        """
+        Handles a segment that the SUT sent to the probe port.
+
+        :param sport: The source port of the segment.
+        :param ack: The acknowledgement number of the segment.
+        :param flags: The flags byte of the segment.
+        """
+        if not self.engine:
+            return
+
+        with self.condition:
+            if flags & _SYN and flags & _ACK:
+                # Tear down the half-open connection of the probe.
+                self.engine.set_ports(self.port, sport)
+                self.engine.send(ack, 0, _RST)
+                if sport == self.target:
+                    self.ready = True
+                    self.condition.notify_all()
+
+    def report(self) -> str:
+        """
+        Summarizes the time spent waiting for the SUT.
+        """
+        if not self.delays:
+            return "no waits for the SUT"
+        return f"{len(self.delays)} waits for the SUT, " \
+               f"mean {sum(self.delays) / len(self.delays) * 1000:.1f} ms, " \
+               f"max {max(self.delays) * 1000:.1f} ms, " \
+               f"total {sum(self.delays):.2f} s"
@@ -0,0 +1,301 @@
+import logging
+import random
+import selectors
+import socket
+import string
+import time
+from collections import Counter
+from threading import Event, Thread
+from typing import Dict, List, Optional, Tuple
+
+from tcpTester.testServer import TestServer
+from tcpTester.types import ACK, SEQ, TCPFlag, TCPPacket
+
+HANDSHAKE = "handshake"
+DATA = "data"
+MALFORMED = "malformed"
+CLOSE = "close"
+ACTIONS = [HANDSHAKE, DATA, MALFORMED, CLOSE]
+DEFAULT_MIX = {HANDSHAKE: 1, DATA: 6, MALFORMED: 2, CLOSE: 1}
+
+DEFAULT_RATE = 1000.0  # in segments per second
+DEFAULT_CONNECTIONS = 256
+DEFAULT_MAX_PAYLOAD = 50  # in bytes, as isValidPayload in the model
+TS_PORTS = (20000, 59999)  # the TestServer's ports of the generated connections
+SETTLE_TIME = 0.5  # in seconds, how long the SUT's last answers are awaited after a run
+
+# Flag combinations that the model never sends on an established connection.
+_MALFORMED_FLAGS = [
+    TCPFlag(0),
+    TCPFlag.FIN,
+    TCPFlag.SYN | TCPFlag.FIN,
+    TCPFlag.SYN | TCPFlag.RST,
+    TCPFlag.SYN | TCPFlag.ACK | TCPFlag.FIN,
+    TCPFlag.RST | TCPFlag.ACK | TCPFlag.FIN,
+    TCPFlag.SYN | TCPFlag.FIN | TCPFlag.RST | TCPFlag.ACK,
+]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """
+    Parses the weights of the actions, e.g. ``handshake:1,data:6,malformed:2,close:1``.
+    """
+    mix = {}
+    for item in text.split(","):
+        action, _, weight = item.partition(":")
+        if action.strip() not in ACTIONS:
+            raise ValueError(f"Unknown action {action}, use one of {ACTIONS}")
+        mix[action.strip()] = float(weight)
+    return mix
+
+
+class RateLimiter:
+    """
+    Paces a loop to a fixed rate. Every call of ``wait`` returns at the next slot; a loop that fell behind
+    catches up with at most ``burst`` calls in a row that do not wait.
+    """
+
+    def __init__(self, rate: float, burst: int = 16):
+        """
+        Initializes class variables.
+
+        :param rate: The number of calls per second.
+        :param burst: The maximum number of slots that are caught up without waiting.
+        """
+        self.interval = 1 / rate
+        self.burst = burst
+        self.next = time.monotonic()
+
+    def wait(self) -> None:
+        now = time.monotonic()
+        if self.next > now:
+            time.sleep(self.next - now)
+        elif now - self.next > self.burst * self.interval:
+            self.next = now - self.burst * self.interval
+        self.next += self.interval
+
+
+class ResponseCounter:
+    """
+    Stands in for the MBT channel of the TestServer and counts the abstract packets of the SUT by category:
+    their flags, whether they carry a payload and the validity of their numbers.
+    """
+
+    def __init__(self):
+        """
+        Initializes class variables.
+        """
+        self.categories: Counter = Counter()
+        self.invalid: Counter = Counter()
+        self.total = 0
+
+    def write(self, lines: str) -> int:
+        for line in lines.splitlines():
+            packet = TCPPacket.from_torxakis(line)
+            category = "+".join(flag.name for flag in packet.flags.members()) or "NONE"
+            if packet.payload:
+                category += "+DATA"
+            self.categories[category] += 1
+            if packet.seq == SEQ.SEQ_INVALID:
+                self.invalid[SEQ.SEQ_INVALID.name] += 1
+            if packet.ack == ACK.ACK_INVALID:
+                self.invalid[ACK.ACK_INVALID.name] += 1
+            self.total += 1
+        return len(lines)
+
+    def flush(self) -> None:
+        pass
+
+
+class LoadGenerator:
+    """
+    Stresses the SUT's TCP stack through a TestServer: opens many connections from distinct ports of the
+    TestServer and sends a weighted mix of handshakes, data segments, malformed segments with invalid numbers
+    or flag combinations, and closes, paced to a fixed rate.
+
+    Every segment is a TCPPacket that is sent with ``TestServer.handle_send_command``, so the sequence state
+    of the connections and the randomisation of invalid numbers are the TestServer's. The TestServer must
+    report to a ``ResponseCounter`` and should not wait for the SUT to listen (``ready_timeout=0``).
+    """
+
+    def __init__(self,
+                 test_server: TestServer,
+                 sut_ports: List[int],
+                 rate: float = DEFAULT_RATE,
+                 connections: int = DEFAULT_CONNECTIONS,
+                 mix: Optional[Dict[str, float]] = None,
+                 max_payload: int = DEFAULT_MAX_PAYLOAD,
+                 seed: Optional[int] = None):
+        """
+        Initializes class variables.
+
+        :param test_server: The TestServer that sends the segments and abstracts the SUT's responses.
+        :param sut_ports: The ports of the SUT that accept connections.
+        :param rate: The number of segments per second.
+        :param connections: The maximum number of open connections, the oldest one is reset beyond it.
+        :param mix: The weights of the actions, see ``DEFAULT_MIX``.
+        :param max_payload: The maximum payload of a data or malformed segment.
+        :param seed: The seed of the random choices.
+        """
+        self.test_server = test_server
+        self.sut_ports = sut_ports
+        self.rate = rate
+        self.connections = connections
+        mix = mix or DEFAULT_MIX
+        self.actions = [action for action in ACTIONS if mix.get(action, 0) > 0]
+        self.weights = [mix[action] for action in self.actions]
+        self.max_payload = max_payload
+        self.random = random.Random(seed)
+
+        # (TestServer port, SUT port) of the open connections, oldest first, and whether the handshake was
+        # completed with an ACK.
+        self.flows: Dict[Tuple[int, int], bool] = {}
+        self.next_port = TS_PORTS[0]
+        self.sent: Counter = Counter()
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the LoadGenerator.
+
+        :return: The logger for the LoadGenerator.
+        """
+        return logging.getLogger("LoadGenerator")
+
+    def payload(self) -> bytes:
+        return "".join(self.random.choices(string.ascii_letters, k=self.random.randint(1, self.max_payload))).encode()
+
+    def send(self, flow: Tuple[int, int], seq: SEQ, ack: ACK, flags: TCPFlag, payload: bytes = b'') -> None:
+        self.test_server.handle_send_command(TCPPacket(flow[0], flow[1], seq, ack, flags, payload))
+
+    def open_flow(self) -> None:
+        if len(self.flows) >= self.connections:
+            self.close_flow(next(iter(self.flows)), reset=True)
+        while True:
+            flow = (self.next_port, self.random.choice(self.sut_ports))
+            self.next_port = self.next_port + 1 if self.next_port < TS_PORTS[1] else TS_PORTS[0]
+            if flow not in self.flows:
+                break
+        self.flows[flow] = False
+        self.send(flow, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.SYN)
+
+    def close_flow(self, flow: Tuple[int, int], reset: bool) -> None:
+        if reset:
+            self.send(flow, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.RST)
+        else:
+            self.send(flow, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.FIN | TCPFlag.ACK)
+        # The TestServer keeps the connection to abstract the SUT's answer, until it is evicted.
+        del self.flows[flow]
+
+    def established(self, flow: Tuple[int, int]) -> bool:
+        """
+        Whether the SUT answered the SYN of a flow. A flow whose connection the SUT closed since is forgotten.
+        """
+        with self.test_server.lock:
+            connection = self.test_server.connections.get(self.test_server.connection_key(*flow))
+        if connection and connection.closed:
+            del self.flows[flow]
+            return False
+        return bool(connection) and connection.ack != -1
+
+    def step(self, action: str) -> str:
+        """
+        Sends one segment for an action.
+
+        :return: What was sent, the action or the handshake's ACK.
+        """
+        if action == HANDSHAKE or not self.flows:
+            self.open_flow()
+            return HANDSHAKE
+
+        flow = self.random.choice(list(self.flows))
+        if action == MALFORMED:
+            flags = self.random.choice(_MALFORMED_FLAGS)
+            seq = self.random.choice([SEQ.SEQ_VALID, SEQ.SEQ_INVALID])
+            ack = self.random.choice([ACK.ACK_VALID, ACK.ACK_INVALID])
+            self.send(flow, seq, ack, flags, self.payload() if self.random.random() < 0.5 else b'')
+            if seq == SEQ.SEQ_VALID and TCPFlag.RST in flags:
+                # The TestServer closes the connection on a RST with a valid sequence number, as in close_flow.
+                del self.flows[flow]
+            return MALFORMED
+
+        if not self.established(flow):
+            # The SUT did not answer the SYN (yet), the segment would be out of the connection.
+            return "unanswered"
+
+        if not self.flows[flow]:
+            self.send(flow, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK)
+            self.flows[flow] = True
+            return "handshake_ack"
+
+        if action == CLOSE:
+            self.close_flow(flow, reset=self.random.random() < 0.5)
+            return CLOSE
+
+        self.send(flow, SEQ.SEQ_VALID, ACK.ACK_VALID, TCPFlag.ACK, self.payload())
+        return DATA
+
+    def run(self, duration: float) -> None:
+        """
+        Sends segments at the configured rate for ``duration`` seconds.
+        """
+        limiter = RateLimiter(self.rate)
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            limiter.wait()
+            self.sent[self.step(self.random.choices(self.actions, self.weights)[0])] += 1
+
+    def close(self) -> None:
+        """
+        Resets the open connections.
+        """
+        self.logger.info("Resetting %s open connections", len(self.flows))
+        for flow in list(self.flows):
+            self.close_flow(flow, reset=True)
+
+
+class ConnectionSink:
+    """
+    Accepts connections on ports of the local host and discards what they receive, a listening application
+    for a SUT on the same host as the TestServer (the tun transport).
+    """
+
+    def __init__(self, ip: str, ports: List[int]):
+        """
+        Opens the listening sockets and starts the thread that serves them.
+        """
+        self.selector = selectors.DefaultSelector()
+        self.stop_event = Event()
+        for port in ports:
+            listening = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listening.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listening.bind((ip, port))
+            listening.listen(socket.SOMAXCONN)
+            listening.setblocking(False)
+            self.selector.register(listening, selectors.EVENT_READ, True)
+        self.thread = Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self) -> None:
+        while not self.stop_event.is_set():
+            for key, _ in self.selector.select(0.2):
+                sock = key.fileobj
+                try:
+                    if key.data:
+                        connection, _ = sock.accept()
+                        connection.setblocking(False)
+                        self.selector.register(connection, selectors.EVENT_READ, False)
+                    elif not sock.recv(65536):
+                        self.selector.unregister(sock)
+                        sock.close()
+                except OSError:
+                    if not key.data:
+                        self.selector.unregister(sock)
+                        sock.close()
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.thread.join()
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+DEFAULT_CACHE_SIZE = 4096  # entries
+
+
+class LruCache:
+    """
+    A bounded mapping that evicts the least recently used entry when it is full, and counts its hits,
+    misses and evictions.
+
+    Entries are kept in order of their last use, as in ``ConnectionTable``. The cache takes no lock: a lookup
+    that races with an eviction in another thread is a miss, and the counters may miss an update.
+    Values must be immutable, as every hit returns the same object.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Initializes class variables.
+
+        :param max_size: The maximum number of entries, 0 disables the cache.
+        """
+        self.max_size = max_size
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Looks up an entry and marks it as recently used.
+
+        :return: The value, or None if the key is not cached.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            # evicted by another thread in between
+            pass
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Adds an entry, evicting the least recently used one if the cache is full.
+        """
+        if not self.max_size:
+            return
+        self.entries[key] = value
+        while len(self.entries) > self.max_size:
+            try:
+                self.entries.popitem(last=False)
+            except KeyError:
+                break
+            self.evictions += 1
+
+    def resize(self, max_size: int) -> None:
+        """
+        Changes the maximum number of entries, evicting the least recently used ones beyond it.
+        """
+        self.max_size = max_size
+        while len(self.entries) > max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries and resets the counters.
+        """
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the size, the counters and the hit ratio of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def report(self) -> str:
+        """
+        Summarizes the hits, misses and evictions of the cache.
+        """
+        stats = self.stats()
+        return f"{stats['hits']} hits ({stats['hit_ratio']:.0%}), {stats['misses']} misses, " \
+               f"{stats['evictions']} evictions"
@@ -0,0 +1,143 @@
+import logging
+import time
+from queue import Empty, Full, Queue
+from threading import Thread
+from typing import List, Optional, TextIO, Tuple
+
+from tcpTester.metrics import Metrics
+
+MBT_QUEUE_SIZE = 1024  # abstract packets that may wait for the MBT channel
+MAX_BATCH = 64  # abstract packets that are written with a single flush
+BACKPRESSURE_LOG_INTERVAL = 100  # waits for a full queue between two warnings
+CLOSED_CHECK_INTERVAL = 0.1  # in seconds, how often a wait for a full queue checks whether the writer was closed
+
+
+class MbtWriter:
+    """
+    Writes lines to the MBT channel from a dedicated thread, so that the thread that captures and abstracts
+    segments never waits for Torxakis to read.
+
+    Lines are passed through a bounded queue. The writer thread takes every line that is ready, up to
+    ``MAX_BATCH``, and flushes once per batch. When the queue is full, ``put`` waits for the writer: this
+    back-pressure is counted, logged and recorded as the ``ts.backpressure`` stage.
+    """
+
+    def __init__(self, client: TextIO, max_pending: int = MBT_QUEUE_SIZE, metrics: Optional[Metrics] = None):
+        """
+        Initializes class variables and starts the writer thread.
+
+        :param client: The MBT channel.
+        :param max_pending: The maximum number of lines that wait to be written.
+        :param metrics: Records the time lines wait in the queue and the time to write a batch.
+        """
+        self.client = client
+        self.queue: Queue = Queue(max_pending)
+        self.metrics = metrics or Metrics(enabled=False)
+        self.lines = 0
+        self.batches = 0
+        self.waits = 0
+        self.failed = False
+        self.closed = False
+        self.thread = Thread(target=self.write_loop, name="MbtWriter", daemon=True)
+        self.thread.start()
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the MbtWriter.
+
+        :return: The logger for the MbtWriter.
+        """
+        return logging.getLogger("MbtWriter")
+
+    def put(self, line: str) -> None:
+        """
+        Queues a line for the MBT channel, waits while the queue is full.
+
+        :param line: The line without its line break.
+        """
+        if self.closed:
+            # a late segment after the session ended
+            return
+        item = (line, time.monotonic_ns())
+        try:
+            self.queue.put_nowait(item)
+            return
+        except Full:
+            pass
+
+        self.waits += 1
+        if self.waits % BACKPRESSURE_LOG_INTERVAL == 1:
+            self.logger.warning("The MBT channel is slow, %s lines are pending (waited %s times)",
+                                self.queue.qsize(), self.waits)
+        start = time.monotonic_ns()
+        # The writer thread stops once it is closed, so a wait for it would never end.
+        while not self.closed:
+            try:
+                self.queue.put(item, timeout=CLOSED_CHECK_INTERVAL)
+                break
+            except Full:
+                pass
+        self.metrics.record("ts.backpressure", start)
+
+    def write_loop(self) -> None:
+        """
+        Writes the queued lines in batches until ``close`` is called.
+        """
+        while True:
+            batch: List[Optional[Tuple[str, int]]] = [self.queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            items = [item for item in batch if item is not None]
+            if items and not self.failed:
+                self.write(items)
+            if len(items) < len(batch):
+                return
+
+    def write(self, items: List[Tuple[str, int]]) -> None:
+        """
+        Writes a batch of lines and flushes the channel once.
+        """
+        start = time.monotonic_ns()
+        for _, queued in items:
+            self.metrics.record("ts.queue", queued)
+        try:
+            self.client.write("".join(line + "\n" for line, _ in items))
+            self.client.flush()
+        except (OSError, ValueError) as err:
+            # Keep draining the queue, so that the capture thread does not block on a dead channel.
+            self.logger.error("Could not write to the MBT channel: %s", err)
+            self.failed = True
+            return
+        self.metrics.record("ts.forward", start)
+        self.lines += len(items)
+        self.batches += 1
+
+    def close(self) -> None:
+        """
+        Writes the pending lines and stops the writer thread. Lines that are put while it stops are dropped.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        dropped = 0
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+            dropped += 1
+        if dropped:
+            self.logger.info("Dropped %s lines that arrived after the MBT channel was closed", dropped)
+
+    def report(self) -> str:
+        """
+        Summarizes the lines written and the waits for the MBT channel.
+        """
+        return f"{self.lines} lines in {self.batches} flushes, {self.waits} waits for the MBT channel"
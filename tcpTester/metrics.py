@@ -0,0 +1,278 @@
+import json
+import logging
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread, local
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_REPORT_INTERVAL = 10.0  # in seconds
+PERCENTILES = [50, 90, 99, 99.9]
+
+# Buckets per power of two, the relative error of a recorded duration is at most 1 / SUB_BUCKETS.
+_SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+_BUCKETS = 64 * SUB_BUCKETS
+_NO_MIN = 1 << 63
+
+
+class LatencyHistogram:
+    """
+    Counts of durations in nanoseconds in log-linear buckets: durations below ``2 * SUB_BUCKETS`` have
+    their own bucket, every larger power of two is split into ``SUB_BUCKETS`` buckets of equal width.
+    """
+
+    def __init__(self):
+        """
+        Initializes class variables.
+        """
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = _NO_MIN
+        self.max = 0
+
+    @staticmethod
+    def bucket(duration: int) -> int:
+        """
+        Returns the index of the bucket of a duration.
+        """
+        shift = max(duration.bit_length() - _SUB_BUCKET_BITS - 1, 0)
+        return (shift << _SUB_BUCKET_BITS) + (duration >> shift)
+
+    @staticmethod
+    def bucket_bounds(index: int) -> Tuple[int, int]:
+        """
+        Returns the inclusive lower and the exclusive upper bound of a bucket.
+        """
+        shift = max((index >> _SUB_BUCKET_BITS) - 1, 0)
+        mantissa = index - (shift << _SUB_BUCKET_BITS)
+        return mantissa << shift, (mantissa + 1) << shift
+
+    def record(self, duration: int) -> None:
+        """
+        Records a duration in nanoseconds. Called on the hot paths of the adapters, so the bucket is
+        computed inline as in ``bucket`` and comparisons are used instead of the min and max builtins.
+        """
+        # pylint: disable=consider-using-max-builtin,consider-using-min-builtin
+        shift = duration.bit_length() - _SUB_BUCKET_BITS - 1
+        if shift < 0:
+            shift = 0
+        self.counts[(shift << _SUB_BUCKET_BITS) + (duration >> shift)] += 1
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """
+        Adds the durations recorded by another histogram.
+        """
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> int:
+        """
+        Returns an upper bound of the given percentile of the recorded durations, in nanoseconds.
+        """
+        if not self.count:
+            return 0
+        rank = max(percentile / 100 * self.count, 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_bounds(index)[1] - 1, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Returns the count and the mean, minimum, maximum and percentiles of the durations in microseconds.
+        """
+        summary = {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1000 if self.count else 0.0,
+            "min_us": self.min / 1000 if self.count else 0.0,
+            "max_us": self.max / 1000,
+        }
+        for percentile in PERCENTILES:
+            summary[f"p{percentile:g}_us"] = self.percentile(percentile) / 1000
+        return summary
+
+
+class Metrics:
+    """
+    Latency histograms of the stages of the adapters, keyed by stage name.
+
+    A stage is timed by taking ``time.monotonic_ns()`` when it starts and calling ``record`` when it ends,
+    which returns the end time so that consecutive stages can be chained without taking extra timestamps.
+    Every thread records into its own histograms, so recording takes no lock; they are merged when a
+    snapshot is taken. A disabled instance only takes the end time.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Initializes class variables.
+
+        :param enabled: Whether durations are recorded.
+        """
+        self.enabled = enabled
+        self.local = local()
+        self.histograms: List[Tuple[str, LatencyHistogram]] = []
+        self.lock = Lock()
+
+    def record(self, stage: str, start: int) -> int:
+        """
+        Records the duration of a stage that started at ``start``.
+
+        :param stage: The name of the stage.
+        :param start: The start of the stage, from ``time.monotonic_ns()``.
+
+        :return: The end of the stage.
+        """
+        end = time.monotonic_ns()
+        if self.enabled:
+            histogram = self.local.__dict__.get(stage)
+            if histogram is None:
+                histogram = self.add_histogram(stage)
+            histogram.record(end - start)
+        return end
+
+    def add_histogram(self, stage: str) -> LatencyHistogram:
+        """
+        Creates the histogram of a stage for the calling thread.
+        """
+        histogram = LatencyHistogram()
+        setattr(self.local, stage, histogram)
+        with self.lock:
+            self.histograms.append((stage, histogram))
+        return histogram
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the summaries of all stages, see ``LatencyHistogram.summary``.
+        Durations that are recorded while the snapshot is taken may be left out.
+        """
+        merged: Dict[str, LatencyHistogram] = {}
+        with self.lock:
+            histograms = list(self.histograms)
+        for stage, histogram in histograms:
+            merged.setdefault(stage, LatencyHistogram()).merge(histogram)
+        return {stage: histogram.summary() for stage, histogram in sorted(merged.items())}
+
+    def reset(self) -> None:
+        """
+        Removes all recorded durations.
+        """
+        with self.lock:
+            self.histograms = []
+            self.local = local()
+
+
+class MetricsReporter:
+    """
+    Periodically writes the percentiles of a Metrics instance to a JSON file and/or serves them as
+    JSON on a local HTTP endpoint.
+    """
+
+    def __init__(self,
+                 metrics: Metrics,
+                 path: Optional[str] = None,
+                 interval: float = DEFAULT_REPORT_INTERVAL,
+                 port: Optional[int] = None):
+        """
+        Initializes class variables.
+
+        :param metrics: The metrics to report.
+        :param path: The file the report is written to, None to not write a file.
+        :param interval: The time between two writes of the file, in seconds.
+        :param port: The port on 127.0.0.1 that serves the report, None to not serve it.
+        """
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.port = port
+        self.stop_event = Event()
+        self.threads: List[Thread] = []
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the MetricsReporter.
+
+        :return: The logger for the MetricsReporter.
+        """
+        return logging.getLogger("MetricsReporter")
+
+    def report(self) -> str:
+        """
+        Returns the current report as JSON.
+        """
+        return json.dumps({"time": time.time(), "stages": self.metrics.snapshot()}, indent=2)
+
+    def write(self) -> None:
+        """
+        Writes the current report to the file, replacing the previous report atomically.
+        """
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(self.report())
+        os.replace(temporary, self.path)
+
+    def start(self) -> None:
+        """
+        Starts writing the file and serving the endpoint in background threads.
+        """
+        if self.path:
+            self.threads.append(Thread(target=self.write_periodically, daemon=True))
+        if self.port is not None:
+            reporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):  # pylint: disable=invalid-name
+                    body = reporter.report().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                    reporter.logger.debug(format, *args)
+
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            self.threads.append(Thread(target=self.server.serve_forever, daemon=True))
+            self.logger.info("Serving metrics on http://127.0.0.1:%s/", self.server.server_address[1])
+
+        for thread in self.threads:
+            thread.start()
+
+    def write_periodically(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError as err:
+                self.logger.warning("Could not write metrics to %s: %s", self.path, err)
+
+    def stop(self) -> None:
+        """
+        Stops the background threads and writes the final report.
+        """
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.path:
+            try:
+                self.write()
+            except OSError as err:
+                self.logger.warning("Could not write metrics to %s: %s", self.path, err)
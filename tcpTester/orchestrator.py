@@ -0,0 +1,404 @@
+import configparser
+import ipaddress
+import json
+import logging
+import queue
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from threading import Event, Thread
+from typing import Dict, List, Tuple
+
+from tcpTester.types import MAX_PORT, MIN_PORT
+from tcpTester.utils import split_port_range
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+TEST_SERVER_MAIN = REPO_DIR / "testServerMain.py"
+SUT_MAIN = REPO_DIR / "sutMain.py"
+
+STARTUP_TIMEOUT = 10.0  # in seconds
+CAMPAIGN_TIMEOUT = 600.0  # in seconds
+STOP_TIMEOUT = 5.0  # in seconds
+
+# Logged by both adapters once their MBT socket accepts connections.
+_READY_RE = re.compile(r"Waiting for the MBT connection on port")
+_VERDICT_RE = re.compile(r"\b(PASS|FAIL)\b")
+
+# Guards of the model that bound the ports of the SUT and of the TestServer, e.g. "(lport(c) > 10000)".
+_LOWER_BOUND_RE = re.compile(r"(\((?:lport|cport|sport)\(\w+\)\s*>\s*)\d+")
+_UPPER_BOUND_RE = re.compile(r"(\((?:lport|cport|sport)\(\w+\)\s*<\s*)\d+")
+_NET_CHANNEL_RE = re.compile(r"(CHAN\s+(?:IN|OUT)\s+(?:InSutNet|OutSutNet)\s+HOST\s+)\"[^\"]*\"(\s+PORT\s+)\d+")
+_USER_CHANNEL_RE = re.compile(r"(CHAN\s+(?:IN|OUT)\s+(?:InSutUser|OutSutUser)\s+HOST\s+)\"[^\"]*\"(\s+PORT\s+)\d+")
+
+
+@dataclass
+class Shard:
+    """
+    A slice of the port range together with the MBT ports of its adapter pair.
+    """
+    index: int
+    port_range: Tuple[int, int]
+    test_server_port: int
+    sut_port: int
+
+
+@dataclass
+class CampaignResult:
+    """
+    The outcome of one Torxakis test campaign.
+    """
+    campaign: int
+    shard: int
+    port_range: Tuple[int, int]
+    verdict: str
+    duration: float
+    log_dir: str
+
+
+def shard_model(model: str, shard: Shard, test_server_host: str, sut_host: str) -> str:
+    """
+    Restricts a Torxakis model to the ports of a shard and points its channels to the shard's adapters.
+
+    :param model: The source of the model, see ``torxakisTcpTester/Tcp.txs``.
+    :param shard: The shard.
+    :param test_server_host: The host that Torxakis reaches the TestServer on.
+    :param sut_host: The host that Torxakis reaches the SUT on.
+
+    :return: The source of the model for the shard.
+    """
+    min_port, max_port = shard.port_range
+    # The guards of the model are strict inequalities.
+    model, lower = _LOWER_BOUND_RE.subn(rf"\g<1>{min_port - 1}", model)
+    model, upper = _UPPER_BOUND_RE.subn(rf"\g<1>{max_port + 1}", model)
+    model, net = _NET_CHANNEL_RE.subn(rf'\g<1>"{test_server_host}"\g<2>{shard.test_server_port}', model)
+    model, user = _USER_CHANNEL_RE.subn(rf'\g<1>"{sut_host}"\g<2>{shard.sut_port}', model)
+
+    if not lower or lower != upper or net != 2 or user != 2:
+        raise ValueError("The model does not contain the expected port guards and channel definitions")
+    return model
+
+
+def verdict_of(output: str) -> str:
+    """
+    Extracts the verdict of the last test run from the output of Torxakis.
+
+    :return: PASS, FAIL or ERROR if Torxakis did not report a verdict.
+    """
+    verdicts = _VERDICT_RE.findall(output)
+    return verdicts[-1] if verdicts else "ERROR"
+
+
+class Adapter:
+    """
+    A testServerMain.py or sutMain.py process of a shard.
+    """
+
+    def __init__(self, name: str, command: List[str], cwd: Path, log_file: Path):
+        """
+        Starts the process, its console output is copied to a log file.
+
+        :param name: The name of the adapter, used for logging.
+        :param command: The command that starts the adapter.
+        :param cwd: The working directory of the adapter.
+        :param log_file: The file that receives the console output of the adapter.
+        """
+        self.name = name
+        self.ready = Event()
+        self.log_file = log_file
+        self.process = subprocess.Popen(command,
+                                        cwd=cwd,
+                                        stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        text=True)
+        self.reader = Thread(target=self.copy_output, daemon=True)
+        self.reader.start()
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the Adapter.
+
+        :return: The logger for the Adapter.
+        """
+        return logging.getLogger("Orchestrator")
+
+    def copy_output(self) -> None:
+        """
+        Copies the console output of the adapter to its log file and notices when it is ready.
+        """
+        with open(self.log_file, "w", encoding="utf-8") as log:
+            for line in self.process.stdout:
+                log.write(line)
+                log.flush()
+                if not self.ready.is_set() and _READY_RE.search(line):
+                    self.ready.set()
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        """
+        Waits until the adapter accepts the MBT connection.
+
+        :return: Whether the adapter is ready, False if it did not start or exited early.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.ready.wait(0.1):
+            if self.process.poll() is not None or time.monotonic() >= deadline:
+                self.logger.warning("%s did not start, see %s", self.name, self.log_file)
+                return False
+        return True
+
+    def stop(self) -> None:
+        """
+        Stops the adapter if it did not exit by itself.
+        """
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.reader.join()
+
+
+class Orchestrator:
+    """
+    Runs Torxakis test campaigns in parallel on disjoint slices of the port range.
+
+    Every shard has its own TestServer and SUT adapter pair, listening on their own MBT ports, and its own
+    copy of the model that only uses the shard's ports. A worker per shard runs campaigns from a shared
+    queue one after the other, so the campaigns are spread over the shards as they finish.
+    """
+
+    def __init__(self,
+                 config: configparser.ConfigParser,
+                 shards: int,
+                 campaigns: int,
+                 steps: int,
+                 model: Path,
+                 output_dir: Path,
+                 torxakis: str = "torxakis",
+                 port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+                 startup_timeout: float = STARTUP_TIMEOUT,
+                 campaign_timeout: float = CAMPAIGN_TIMEOUT):
+        """
+        Initializes class variables.
+
+        :param config: The settings of the adapters, with the test_server and sut sections of an orchestrator config.
+        :param shards: The number of adapter pairs that run in parallel.
+        :param campaigns: The total number of test campaigns.
+        :param steps: The number of test steps per campaign.
+        :param model: The Torxakis model.
+        :param output_dir: The directory that receives the logs, the per shard files and the summary.
+        :param torxakis: The command that starts Torxakis.
+        :param port_range: The inclusive port range that is split between the shards.
+        :param startup_timeout: The maximum time to wait for the adapters of a campaign to start.
+        :param campaign_timeout: The maximum duration of a campaign.
+        """
+        self.config = config
+        self.campaigns = campaigns
+        self.steps = steps
+        self.model = model
+        self.output_dir = output_dir
+        self.torxakis = shlex.split(torxakis)
+        self.startup_timeout = startup_timeout
+        self.campaign_timeout = campaign_timeout
+
+        test_server_port = config["test_server"].getint("mbt_port")
+        sut_port = config["sut"].getint("mbt_port")
+        self.shards = [Shard(index, shard_range, test_server_port + index, sut_port + index)
+                       for index, shard_range in enumerate(split_port_range(*port_range, shards))]
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the Orchestrator.
+
+        :return: The logger for the Orchestrator.
+        """
+        return logging.getLogger("Orchestrator")
+
+    def shard_dir(self, shard: Shard) -> Path:
+        return self.output_dir / f"shard-{shard.index}"
+
+    def prepare_shard(self, shard: Shard) -> None:
+        """
+        Writes the adapter configs and the model of a shard to its directory.
+        """
+        shard_dir = self.shard_dir(shard)
+        shard_dir.mkdir(parents=True, exist_ok=True)
+
+        test_server = self.config["test_server"]
+        sut = self.config["sut"]
+        mbt = {"min_port": str(shard.port_range[0]), "max_port": str(shard.port_range[1])}
+        adapter_options = {key: value for key, value in test_server.items() if key not in ("ip", "mbt_port")}
+        sut_options = {key: value for key, value in sut.items() if key not in ("ip", "mbt_port", "command")}
+        ts_ip = test_server["ip"]
+        if test_server.get("transport") == "tun":
+            # Every shard gets its own TUN device and test server address.
+            ts_ip = str(ipaddress.IPv4Address(test_server["tun_ip"]) + shard.index)
+            adapter_options["iface"] = f"{test_server['iface']}{shard.index}"
+            adapter_options["tun_ip"] = ts_ip
+        # The adapters run in the campaign's log directory, the shards cannot share a metrics port.
+        metrics = {key: value for key, value in self.config["metrics"].items() if key not in ("file", "port")} \
+            if "metrics" in self.config else {"enabled": "False"}
+
+        test_server_config = configparser.ConfigParser()
+        test_server_config.read_dict({
+            "logging": self.config["logging"],
+            "mbt": {"port": str(shard.test_server_port), **mbt},
+            "test_server": adapter_options,
+            "sut": {"ip": sut["ip"]},
+            "metrics": {**metrics, "file": "test_server_metrics.json"},
+        })
+        with open(shard_dir / "test_server.ini", "w", encoding="utf-8") as file:
+            test_server_config.write(file)
+
+        sut_config = configparser.ConfigParser()
+        sut_config.read_dict({
+            "logging": self.config["logging"],
+            "mbt": {"port": str(shard.sut_port), "sessions": "1", **mbt},
+            "test_server": {"ip": ts_ip},
+            "sut": sut_options,
+            "metrics": {**metrics, "file": "sut_metrics.json"},
+        })
+        with open(shard_dir / "sut.ini", "w", encoding="utf-8") as file:
+            sut_config.write(file)
+
+        # newline="" keeps the line endings of the model.
+        with open(self.model, encoding="utf-8", newline="") as file:
+            model = shard_model(file.read(), shard, test_server_host="localhost", sut_host=sut["ip"])
+        with open(shard_dir / self.model.name, "w", encoding="utf-8", newline="") as file:
+            file.write(model)
+        torxakis_config = self.model.parent / ".torxakis.yaml"
+        if torxakis_config.exists():
+            shutil.copy(torxakis_config, shard_dir)
+
+    def run_campaign(self, shard: Shard, campaign: int) -> CampaignResult:
+        """
+        Starts the adapters of a shard, runs one Torxakis test campaign against them and stops them again.
+        """
+        shard_dir = self.shard_dir(shard)
+        log_dir = shard_dir / f"campaign-{campaign}"
+        log_dir.mkdir(parents=True, exist_ok=True)
+        self.logger.info("Starting campaign %s on shard %s (ports %s-%s)", campaign, shard.index, *shard.port_range)
+
+        start = time.monotonic()
+        sut_command = shlex.split(self.config["sut"].get("command", "")) + \
+            [sys.executable, str(SUT_MAIN), str((shard_dir / "sut.ini").resolve())]
+        adapters = [Adapter(f"SUT of shard {shard.index}", sut_command, log_dir, log_dir / "sut.log")]
+        try:
+            adapters.append(Adapter(f"TestServer of shard {shard.index}",
+                                    [sys.executable, str(TEST_SERVER_MAIN),
+                                     str((shard_dir / "test_server.ini").resolve())],
+                                    log_dir,
+                                    log_dir / "test_server.log"))
+
+            if all(adapter.wait_until_ready(self.startup_timeout) for adapter in adapters):
+                verdict = self.run_torxakis(shard_dir, log_dir / "torxakis.log")
+            else:
+                verdict = "ERROR"
+        finally:
+            for adapter in adapters:
+                adapter.stop()
+
+        duration = time.monotonic() - start
+        self.logger.info("Campaign %s on shard %s: %s after %.1f s", campaign, shard.index, verdict, duration)
+        return CampaignResult(campaign, shard.index, shard.port_range, verdict, duration, str(log_dir))
+
+    def run_torxakis(self, shard_dir: Path, log_file: Path) -> str:
+        """
+        Runs Torxakis on the model of a shard.
+
+        :return: The verdict of the campaign, TIMEOUT if it did not finish in time.
+        """
+        commands = f"tester Tcp Sut\ntest {self.steps}\nquit\n"
+        with open(log_file, "w", encoding="utf-8") as log:
+            try:
+                process = subprocess.run(self.torxakis + [self.model.name],
+                                         cwd=shard_dir,
+                                         input=commands,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT,
+                                         text=True,
+                                         timeout=self.campaign_timeout,
+                                         check=False)
+            except subprocess.TimeoutExpired as err:
+                log.write(err.output or "")
+                return "TIMEOUT"
+            except OSError as err:
+                self.logger.error("Could not start Torxakis: %s", err)
+                return "ERROR"
+            log.write(process.stdout)
+        return verdict_of(process.stdout)
+
+    def run_shard(self, shard: Shard, campaigns: "queue.Queue[int]") -> List[CampaignResult]:
+        """
+        Runs campaigns on a shard until the queue is empty.
+        """
+        results = []
+        while True:
+            try:
+                campaign = campaigns.get_nowait()
+            except queue.Empty:
+                return results
+            results.append(self.run_campaign(shard, campaign))
+
+    def run(self) -> List[CampaignResult]:
+        """
+        Runs all campaigns and merges their verdicts and logs in the output directory.
+
+        :return: The results of the campaigns, ordered by campaign.
+        """
+        for shard in self.shards:
+            self.prepare_shard(shard)
+
+        campaigns: "queue.Queue[int]" = queue.Queue()
+        for campaign in range(self.campaigns):
+            campaigns.put(campaign)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+            futures = [executor.submit(self.run_shard, shard, campaigns) for shard in self.shards]
+            results = sorted((result for future in futures for result in future.result()),
+                             key=lambda result: result.campaign)
+
+        self.merge(results, time.monotonic() - start)
+        return results
+
+    def merge(self, results: List[CampaignResult], duration: float) -> None:
+        """
+        Writes the verdicts of all campaigns to summary.json and their logs to campaigns.log.
+        """
+        verdicts: Dict[str, int] = {}
+        for result in results:
+            verdicts[result.verdict] = verdicts.get(result.verdict, 0) + 1
+
+        summary = {
+            "shards": [asdict(shard) for shard in self.shards],
+            "campaigns": [asdict(result) for result in results],
+            "verdicts": verdicts,
+            "duration": duration,
+            "campaigns_per_hour": len(results) / duration * 3600 if duration else 0.0,
+        }
+        with open(self.output_dir / "summary.json", "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2)
+
+        with open(self.output_dir / "campaigns.log", "w", encoding="utf-8") as merged:
+            for result in results:
+                for name in ("torxakis", "test_server", "sut"):
+                    log_file = Path(result.log_dir) / f"{name}.log"
+                    if not log_file.exists():
+                        continue
+                    prefix = f"[campaign {result.campaign} shard {result.shard} {name}] "
+                    with open(log_file, encoding="utf-8", errors="replace") as log:
+                        merged.writelines(prefix + line for line in log)
+
+        self.logger.info("%s campaigns in %.1f s: %s", len(results), duration,
+                         ", ".join(f"{count} {verdict}" for verdict, count in sorted(verdicts.items())))
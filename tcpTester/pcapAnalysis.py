@@ -0,0 +1,695 @@
+import mmap
+import socket
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from tcpTester.connection import Connection
+from tcpTester.segmentDecoder import model_flags
+from tcpTester.sendEngine import TCP_FLAG_BITS
+from tcpTester.types import ACK, SEQ, MAX_PORT, MIN_PORT, TCPPacket
+
+_PCAP_HEADER_LEN = 24  # in bytes
+_RECORD_HEADER_LEN = 16  # in bytes
+_RECORD_BLOCK = 1 << 26  # in bytes, how much of a pcap file is walked at once
+_RECORD_WALKS = 1024  # how many walks a block is split into, unless their chunks would be shorter than the window
+_SYNC_WINDOW = 1 << 11  # in bytes, where a walk looks for the first record of its chunk
+# in bytes, the captured length up to which a record header is plausible if the snapshot length is shorter
+_MAX_RECORD_LEN = 0x40000
+_MAX_FRACTION = 10 ** 9  # the fraction of a second of a timestamp in nanoseconds or microseconds
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": "<",
+    b"\x4d\x3c\xb2\xa1": "<",
+    b"\xa1\xb2\xc3\xd4": ">",
+    b"\xa1\xb2\x3c\x4d": ">",
+}
+
+# Link type -> (size of the link layer header, offset of the ethertype in it or None if there is none)
+LINK_TYPES = {
+    1: (14, 12),    # Ethernet
+    12: (0, None),  # raw IP
+    101: (0, None),  # raw IP
+    113: (16, 14),  # Linux cooked capture
+    228: (0, None),  # raw IPv4
+    276: (20, 0),   # Linux cooked capture v2
+}
+
+_ETHERTYPE_IPV4 = 0x0800
+_FRAGMENTED = 0x3fff
+_FIN = TCP_FLAG_BITS["F"]
+_SYN = TCP_FLAG_BITS["S"]
+
+# Classes of the sequence number of a SUT segment, see ``Connection.validate_packet_seq``.
+SEQ_FIRST, SEQ_IN_ORDER, SEQ_DUPLICATE, SEQ_PAST, SEQ_FUTURE = range(5)
+SEQ_CLASSES = ["first", "in_order", "duplicate", "past", "future"]
+# Classes of the acknowledgement number of a SUT segment, see ``Connection.validate_packet_ack``.
+# The acknowledgement number is unknown if the TestServer did not send a segment on the connection yet.
+ACK_FIRST, ACK_CURRENT, ACK_PAST, ACK_FUTURE, ACK_UNKNOWN = range(5)
+ACK_CLASSES = ["first", "current", "past", "future", "unknown"]
+
+_SEQ_VALID_CLASSES = [SEQ_FIRST, SEQ_IN_ORDER, SEQ_DUPLICATE]
+_ACK_VALID_CLASSES = [ACK_FIRST, ACK_CURRENT]
+
+# Spacing between the values of two connections in grouped running maxima,
+# larger than any sequence number plus segment length.
+_GROUP_STRIDE = 1 << 40
+
+# Maximum number of rounds of the vectorized abstraction, see ``abstract``.
+MAX_ROUNDS = 16
+
+
+@dataclass
+class Capture:
+    """
+    The IPv4 TCP segments of a pcap file as one array per header field, in capture order.
+    """
+    data: np.ndarray
+    packets: int
+    index: np.ndarray
+    src: np.ndarray
+    dst: np.ndarray
+    sport: np.ndarray
+    dport: np.ndarray
+    seq: np.ndarray
+    ack: np.ndarray
+    flags: np.ndarray
+    payload_offset: np.ndarray
+    payload_len: np.ndarray
+    captured_len: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def length(self) -> np.ndarray:
+        """
+        The length of the segments in sequence numbers, counting the fin (F) and syn (S) flags.
+        """
+        return self.payload_len + (self.flags & _FIN) + ((self.flags & _SYN) >> 1)
+
+    def payload(self, row: int) -> bytes:
+        """
+        Returns the captured payload of a segment, which is shorter than its length if the capture was truncated.
+        """
+        start = self.payload_offset[row]
+        return self.data[start:start + self.captured_len[row]].tobytes()
+
+
+@dataclass
+class Abstraction:
+    """
+    The abstraction of the segments that the SUT sent in a capture, as the TestServer computes it.
+    ``rows`` are the rows of these segments in the ``Capture`` in capture order, the other arrays
+    hold one entry per row.
+    """
+    rows: np.ndarray
+    seq_class: np.ndarray
+    ack_class: np.ndarray
+    connections: int
+    dropped: int
+    test_server_segments: int
+    replayed_connections: int
+    replayed_segments: int
+
+    @property
+    def seq_valid(self) -> np.ndarray:
+        return np.isin(self.seq_class, _SEQ_VALID_CLASSES)
+
+    @property
+    def ack_valid(self) -> np.ndarray:
+        return np.isin(self.ack_class, _ACK_VALID_CLASSES)
+
+
+def _field(data: np.ndarray, offset: np.ndarray, size: int) -> np.ndarray:
+    """
+    Gathers a big endian unsigned field of a given size at the given offsets.
+    """
+    value = data[offset].astype(np.int64)
+    for i in range(1, size):
+        value = (value << 8) | data[offset + i]
+    return value
+
+
+def _plausible(words: np.ndarray, position: np.ndarray, snap_len: int) -> np.ndarray:
+    """
+    Tells whether there are plausible record headers at the given positions: the fraction of the timestamp
+    is less than a second and the packet was captured in full or up to the snapshot length.
+    """
+    captured_len, original_len = words[position + 8], words[position + 12]
+    return (words[position + 4] < _MAX_FRACTION) & (original_len > 0) & \
+        (captured_len <= max(snap_len, _MAX_RECORD_LEN)) & \
+        ((captured_len == original_len) | ((captured_len == snap_len) & (captured_len < original_len)))
+
+
+def _synchronize(words: np.ndarray, chunks: np.ndarray, chunk_size: int, snap_len: int, last: int) -> np.ndarray:
+    """
+    Guesses the first record of every chunk: the first plausible record header in the window at the start of
+    the chunk that is followed by a plausible one or by the end of the file, or -1 if there is none.
+    """
+    guess = np.full(len(chunks), -1, dtype=np.int64)
+    rows = int(np.count_nonzero(chunks + _SYNC_WINDOW <= last))
+    if not rows:
+        return guess
+
+    def window(offset: int) -> np.ndarray:
+        # the words at an offset from every position of the windows, without copying them
+        return np.lib.stride_tricks.as_strided(words[chunks[0] + offset:], shape=(rows, _SYNC_WINDOW),
+                                               strides=(chunk_size, 1), writeable=False)
+
+    captured_len = window(8)
+    candidates = np.flatnonzero((captured_len == window(12)) | (captured_len == snap_len))
+    position = chunks[candidates // _SYNC_WINDOW] + candidates % _SYNC_WINDOW
+    plausible = _plausible(words, position, snap_len)
+    candidates, position = candidates[plausible], position[plausible]
+
+    following = position + _RECORD_HEADER_LEN + words[position + 8]
+    # the file is as long as the words and the three bytes of the last word
+    followed = following <= len(words) + 3
+    inside = following < last
+    followed[inside] = _plausible(words, following[inside], snap_len)
+    candidates, position = candidates[followed], position[followed]
+
+    rows = candidates // _SYNC_WINDOW
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    guess[rows[first]] = position[first]
+    return guess
+
+
+def _walk(words: np.ndarray, starts: np.ndarray, bounds: np.ndarray) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    Walks the record headers from every start up to its bound, all walks at once.
+
+    :return: The positions of every walk and the first position at or after its bound.
+    """
+    limit = len(words) - 9
+    position = starts
+    steps = [position]
+    while (position < bounds).any():
+        # walks past their bound go on with any length, as their positions only grow
+        position = position + _RECORD_HEADER_LEN + words[np.minimum(position, limit) + 8]
+        steps.append(position)
+    steps = np.array(steps, dtype=np.int64).T
+    lengths = np.count_nonzero(steps < bounds[:, None], axis=1)
+    return [walk[:length] for walk, length in zip(steps, lengths)], steps[np.arange(len(starts)), lengths]
+
+
+def _block_records(words: np.ndarray, start: int, stop: int, snap_len: int, last: int) -> Tuple[np.ndarray, int]:
+    """
+    Finds the records of a pcap file that start in a block, from the record at ``start`` on. The block is split
+    into chunks that are walked at once from a guess of their first record, see ``_synchronize``. A chunk is
+    walked again from where the walk of the chunk before it left that chunk, until the two agree, unless the
+    chunk before it is walked again too.
+
+    :return: The positions of the records and the position of the first record after the block.
+    """
+    chunk_size = max((stop - start) // _RECORD_WALKS, _SYNC_WINDOW)
+    bounds = np.append(np.arange(start + chunk_size, stop, chunk_size), stop)
+    starts = np.append(start, _synchronize(words, bounds[:-1], chunk_size, snap_len, last))
+    # a chunk without a guess is walked again
+    starts = np.where(starts < 0, bounds, starts)
+    records: List[np.ndarray] = [np.zeros(0, dtype=np.int64)] * len(bounds)
+    landing = np.zeros(len(bounds), dtype=np.int64)
+    walkers = np.arange(len(bounds))
+    while len(walkers):
+        walks, landing[walkers] = _walk(words, starts[walkers], bounds[walkers])
+        for walker, walk in zip(walkers, walks):
+            records[walker] = walk
+        mismatched = np.append(False, starts[1:] != landing[:-1])
+        walkers = np.flatnonzero(mismatched & ~np.append(False, mismatched[:-1]))
+        starts[walkers] = landing[walkers - 1]
+    return np.concatenate(records), int(landing[-1])
+
+
+def _record_offsets(data: np.ndarray, endian: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the records of a pcap file, a block of ``_RECORD_BLOCK`` bytes at a time, see ``_block_records``.
+
+    :return: The offsets of the packets in the file and their captured lengths.
+    """
+    # the 32 bit words at every byte of the file
+    words = np.ndarray((len(data) - 3,), dtype=endian + "u4", buffer=data, strides=(1,))
+    snap_len = int(words[16])
+    # the first position after the last complete record header
+    last = len(data) - _RECORD_HEADER_LEN + 1
+    headers = [np.zeros(0, dtype=np.int64)]
+    position = _PCAP_HEADER_LEN
+    while position < last:
+        found, position = _block_records(words, position, min(position + _RECORD_BLOCK, last), snap_len, last)
+        headers.append(found)
+
+    headers = np.concatenate(headers)
+    lengths = words[headers + 8].astype(np.int64)
+    offsets = headers + _RECORD_HEADER_LEN
+    # a truncated last record
+    complete = offsets + lengths <= len(data)
+    return offsets[complete], lengths[complete]
+
+
+def load_pcap(path: str) -> Capture:
+    """
+    Loads the IPv4 TCP segments of a pcap file, other packets, fragments and truncated headers are skipped.
+    The file is memory mapped, so only the headers are read.
+
+    :param path: The path of the pcap file, pcapng is not supported.
+
+    :return: The segments of the file.
+    """
+    with open(path, "rb") as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    data = np.frombuffer(mapping, dtype=np.uint8)
+
+    magic = data[:4].tobytes()
+    if magic not in _PCAP_MAGIC or len(data) < _PCAP_HEADER_LEN:
+        raise ValueError(f"{path} is not a pcap file")
+    endian = _PCAP_MAGIC[magic]
+    link_type = struct.unpack_from(endian + "I", data, 20)[0] & 0x0fffffff
+    if link_type not in LINK_TYPES:
+        raise ValueError(f"Unsupported link type {link_type} in {path}")
+    link_offset, ethertype_offset = LINK_TYPES[link_type]
+
+    offsets, lengths = _record_offsets(data, endian)
+    packets = len(offsets)
+    index = np.arange(packets)
+
+    def keep(mask: np.ndarray) -> None:
+        nonlocal index, offsets, lengths
+        index, offsets, lengths = index[mask], offsets[mask], lengths[mask]
+
+    keep(lengths >= link_offset + 20)
+    if ethertype_offset is not None:
+        keep(_field(data, offsets + ethertype_offset, 2) == _ETHERTYPE_IPV4)
+
+    ip = offsets + link_offset
+    version_ihl = data[ip]
+    fragmented = (_field(data, ip + 6, 2) & _FRAGMENTED) != 0
+    keep((version_ihl >> 4 == 4) & (data[ip + 9] == socket.IPPROTO_TCP) & ~fragmented)
+
+    ip = offsets + link_offset
+    ip_header_len = (data[ip] & 0x0f).astype(np.int64) * 4
+    total_len = _field(data, ip + 2, 2)
+    keep((ip_header_len >= 20) & (lengths >= link_offset + ip_header_len + 20) & (total_len >= ip_header_len + 20))
+
+    ip = offsets + link_offset
+    ip_header_len = (data[ip] & 0x0f).astype(np.int64) * 4
+    total_len = _field(data, ip + 2, 2)
+    tcp = ip + ip_header_len
+    tcp_header_len = (data[tcp + 12] >> 4).astype(np.int64) * 4
+    payload_len = total_len - ip_header_len - tcp_header_len
+    # a data offset below the minimal header would count header bytes as payload
+    valid = (tcp_header_len >= 20) & (payload_len >= 0)
+    keep(valid)
+    ip, tcp, tcp_header_len, payload_len, total_len = \
+        ip[valid], tcp[valid], tcp_header_len[valid], payload_len[valid], total_len[valid]
+
+    payload_offset = tcp + tcp_header_len
+    return Capture(
+        data=data,
+        packets=packets,
+        index=index,
+        src=_field(data, ip + 12, 4),
+        dst=_field(data, ip + 16, 4),
+        sport=_field(data, tcp, 2),
+        dport=_field(data, tcp + 2, 2),
+        seq=_field(data, tcp + 4, 4),
+        ack=_field(data, tcp + 8, 4),
+        flags=data[tcp + 13].astype(np.int64),
+        payload_offset=payload_offset,
+        payload_len=payload_len,
+        captured_len=np.clip(np.minimum(offsets + lengths, ip + total_len) - payload_offset, 0, None),
+    )
+
+
+def _follow(successor: np.ndarray, heads: np.ndarray) -> np.ndarray:
+    """
+    Marks the nodes on the paths that start at the heads and lead from every node to its successor,
+    by pointer doubling: after the k-th round, the nodes up to 2 ** k steps from a head are marked.
+
+    :param successor: The successor of every node, the number of nodes if a path ends at the node.
+    :param heads: The first node of every path, the number of nodes for an empty path.
+
+    :return: Whether every node is on a path.
+    """
+    size = len(successor)
+    jump = np.append(successor, size)
+    reached = np.zeros(size + 1, dtype=bool)
+    reached[heads] = True
+    while True:
+        targets = jump[reached]
+        if (targets == size).all():
+            return reached[:size]
+        reached[targets] = True
+        jump = jump[jump]
+
+
+def _grouped_running_max(values: np.ndarray, group: np.ndarray, starts: np.ndarray,
+                         initial: np.ndarray) -> np.ndarray:
+    """
+    Computes for every row the maximum of the values before it in the same group and the initial value of the group.
+    The rows of a group must be consecutive and the groups in ascending order.
+    """
+    previous = np.empty_like(values)
+    previous[1:] = values[:-1]
+    previous[starts] = initial
+    offset = group * _GROUP_STRIDE
+    return np.maximum.accumulate(previous + offset) - offset
+
+
+def _classify_seq(expected: np.ndarray, seq: np.ndarray, end: np.ndarray) -> np.ndarray:
+    return np.select(
+        [expected == -1, seq == expected, (seq < expected) & (end == expected), seq < expected],
+        [SEQ_FIRST, SEQ_IN_ORDER, SEQ_DUPLICATE, SEQ_PAST],
+        SEQ_FUTURE
+    )
+
+
+def _classify_ack(expected: np.ndarray, ack: np.ndarray, test_server_seq: np.ndarray) -> np.ndarray:
+    return np.select(
+        [expected == -1, test_server_seq == -1, ack == test_server_seq, ack < test_server_seq],
+        [ACK_FIRST, ACK_UNKNOWN, ACK_CURRENT, ACK_PAST],
+        ACK_FUTURE
+    )
+
+
+class _Chains:
+    """
+    The segments of one side of the connections, ordered by connection, sequence number and row, to follow
+    the segments that advance the side's sequence number, see ``follow``.
+    """
+
+    def __init__(self, connections: "_Connections", side: np.ndarray):
+        rows = np.flatnonzero(side)
+        key = connections.group[rows] * _GROUP_STRIDE + connections.seq[rows]
+        order = np.argsort(key, kind="stable")
+        self.rows = rows[order]
+        key = key[order]
+        new_key = np.ones(len(key), dtype=bool)
+        new_key[1:] = key[1:] != key[:-1]
+        keys = key[new_key]
+        # the rank of the sequence number of every segment among those of the side
+        self.rank = np.cumsum(new_key) - 1
+        self.row_rank = np.full(connections.size, -1, dtype=np.int64)
+        self.row_rank[self.rows] = self.rank
+        # the rank of the sequence number that follows every segment, -1 if no segment of the side has it
+        following = connections.group[self.rows] * _GROUP_STRIDE + connections.end[self.rows]
+        rank = np.minimum(np.searchsorted(keys, following), max(len(keys) - 1, 0))
+        self.following = np.where(keys[rank] == following, rank, -1) if len(keys) else rank
+        self.stride = connections.size + 1
+
+    def follow(self, candidates: np.ndarray, heads: np.ndarray) -> np.ndarray:
+        """
+        Follows the segments that advance the sequence number of the side: the first candidate at or after
+        the head of a connection with the sequence number of the head, then the first candidate after it with
+        the sequence number that follows it, and so on.
+
+        :param candidates: Whether every row may advance the sequence number.
+        :param heads: The head of every connection of the side.
+
+        :return: Whether every row advances the sequence number.
+        """
+        advances = np.zeros(len(candidates), dtype=bool)
+        selected = candidates[self.rows]
+        rows = self.rows[selected]
+        if not rows.size:
+            return advances
+        # ascending, by sequence number and then by row
+        order = self.rank[selected] * self.stride + rows
+
+        def find(rank: np.ndarray, after: np.ndarray) -> np.ndarray:
+            index = np.searchsorted(order, rank * self.stride + after)
+            found = np.minimum(index, len(order) - 1)
+            return np.where((rank >= 0) & (index < len(order)) & (order[found] // self.stride == rank),
+                            index, len(order))
+
+        successor = find(self.following[selected], rows + 1)
+        advances[rows[_follow(successor, find(self.row_rank[heads], heads))]] = True
+        return advances
+
+
+class _Connections:
+    """
+    The segments of a capture on the SUT's connections, grouped by connection and in capture order within
+    a connection, with the state of the abstraction as it is computed.
+    """
+
+    def __init__(self, capture: Capture, sut_ip: str, port_range: Tuple[int, int]):
+        sut = struct.unpack("!I", socket.inet_aton(sut_ip))[0]
+        min_port, max_port = port_range
+        from_sut = (capture.src == sut) & (capture.sport >= min_port) & (capture.sport <= max_port)
+        to_sut = (capture.dst == sut) & (capture.dport >= min_port) & (capture.dport <= max_port)
+        selected = np.flatnonzero(from_sut | to_sut)
+        from_sut = from_sut[selected]
+
+        test_server_ip = np.where(from_sut, capture.dst[selected], capture.src[selected])
+        test_server_port = np.where(from_sut, capture.dport[selected], capture.sport[selected])
+        sut_port = np.where(from_sut, capture.sport[selected], capture.dport[selected])
+        key = (test_server_ip << 32) | (test_server_port << 16) | sut_port
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+
+        self.rows = selected[order]
+        self.size = len(self.rows)
+        new_group = np.ones(self.size, dtype=bool)
+        new_group[1:] = key[1:] != key[:-1]
+        self.starts = np.flatnonzero(new_group)
+        self.ends = np.append(self.starts[1:], self.size)
+        self.group = np.cumsum(new_group) - 1
+
+        self.from_sut = from_sut[order]
+        self.seq = capture.seq[self.rows]
+        self.ack = capture.ack[self.rows]
+        self.length = capture.length[self.rows]
+        self.syn = (capture.flags[self.rows] & _SYN) != 0
+        self.end = self.seq + self.length
+
+        # the abstraction of the SUT's segments that are kept, i.e. that the TestServer would receive
+        self.seq_class = np.full(self.size, -1, dtype=np.int8)
+        self.ack_class = np.full(self.size, -1, dtype=np.int8)
+        self.kept = np.zeros(self.size, dtype=bool)
+        # the state before every row: the expected sequence numbers of the SUT and of the
+        # TestServer (-1 if they did not send yet) and whether the connection is open
+        self.sut_next = np.full(self.size, -1, dtype=np.int64)
+        self.test_server_next = np.full(self.size, -1, dtype=np.int64)
+        self.opened = np.zeros(self.size, dtype=bool)
+
+    def count(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Counts for every row the rows in the mask of its connection up to and including it.
+        """
+        count = np.cumsum(mask)
+        return count - (count[self.starts] - mask[self.starts])[self.group]
+
+    def settle(self) -> np.ndarray:
+        """
+        Computes the abstraction with vectorized rounds, see ``abstract``.
+
+        :return: The first row of every connection that did not settle, or the size if it did.
+        """
+        replay_from = np.full(len(self.starts), self.size, dtype=np.int64)
+        if not self.size:
+            return replay_from
+
+        # a connection is opened by the first segment of the TestServer or by a syn of the SUT
+        self.opened = self.count(~self.from_sut | self.syn) > 0
+        self.kept = self.from_sut & self.opened
+        test_server = ~self.from_sut
+        # the first segment of the TestServer sets its initial sequence number, even if it does not advance it
+        initial = test_server & (self.count(test_server) == 1)
+        advance = np.where(initial, self.seq, -1)
+        # the first segment of the SUT that is kept always advances its sequence number
+        first = self.kept & (self.count(self.kept) == 1)
+        sut_heads, test_server_heads = np.flatnonzero(first), np.flatnonzero(initial)
+        sut_chains, test_server_chains = _Chains(self, self.from_sut), _Chains(self, test_server)
+
+        # start by assuming that all acknowledgement numbers of the SUT are valid, until the
+        # segments that advance the state given the state before them are the assumed ones
+        ack_valid = np.ones(self.size, dtype=bool)
+        for _ in range(MAX_ROUNDS):
+            sut_updates = sut_chains.follow(self.kept & (ack_valid | first), sut_heads)
+            sut_next = _grouped_running_max(np.where(sut_updates, self.end, -1), self.group, self.starts, -1)
+            updates = sut_updates | test_server_chains.follow(test_server & (self.ack == np.maximum(sut_next, 0)),
+                                                              test_server_heads)
+            unsettled = self.abstract_rows(updates, advance) != updates
+            if not unsettled.any():
+                break
+            ack_valid = (self.test_server_next != -1) & (self.ack == self.test_server_next)
+
+        # the rows of a connection up to its first unsettled one are exact, so is the state before it
+        return np.minimum.reduceat(np.where(unsettled, np.arange(self.size), self.size), self.starts)
+
+    def abstract_rows(self, updates: np.ndarray, advance: np.ndarray) -> np.ndarray:
+        """
+        Abstracts the rows, assuming which of them advance the state.
+
+        :param updates: Whether a row is assumed to advance the state.
+        :param advance: The value to which the TestServer's segments that do not advance its
+                        sequence number set it, its initial sequence number or -1.
+
+        :return: Whether the rows advance the state given the state before them.
+        """
+        from_sut, seq, ack, end = self.from_sut, self.seq, self.ack, self.end
+        sut_next = _grouped_running_max(np.where(from_sut & updates, end, -1), self.group, self.starts, -1)
+        test_server_next = _grouped_running_max(np.where(from_sut, -1, np.where(updates, end, advance)),
+                                                self.group, self.starts, -1)
+        self.sut_next, self.test_server_next = sut_next, test_server_next
+        self.seq_class = _classify_seq(sut_next, seq, end).astype(np.int8)
+        self.ack_class = _classify_ack(sut_next, ack, test_server_next).astype(np.int8)
+
+        return np.where(
+            from_sut,
+            # the first and in order segments with a first or current acknowledgement number
+            self.kept & (self.seq_class <= SEQ_IN_ORDER) & (self.ack_class <= ACK_CURRENT),
+            ((test_server_next == -1) | (seq == test_server_next)) & (ack == np.maximum(sut_next, 0)))
+
+    def replay(self, first: int, stop: int) -> None:
+        """
+        Replays rows of one connection segment by segment through a ``Connection``, as the TestServer would,
+        starting from the state before the first row.
+        """
+        connection = Connection(("", 0, "", 0))
+        connection.seq = int(self.test_server_next[first])
+        connection.ack = int(self.sut_next[first])
+        opened = bool(self.opened[first])
+        self.kept[first:stop] = False
+
+        for row in range(first, stop):
+            seq, ack, length = int(self.seq[row]), int(self.ack[row]), int(self.length[row])
+            if not self.from_sut[row]:
+                if connection.seq == -1:
+                    # the initial sequence number of the TestServer
+                    connection.seq = seq
+                opened = True
+                # segments that the TestServer sent with SEQ_INVALID or ACK_INVALID do not advance its sequence
+                if seq == connection.seq and ack == max(connection.ack, 0):
+                    connection.update_sequence_num(length)
+                continue
+
+            opened = opened or self.syn[row]
+            if not opened:
+                continue
+            self.kept[row] = True
+            self.seq_class[row], self.ack_class[row] = _classify(connection, seq, ack, length)
+
+            # an unknown sequence number of the TestServer (-1) is never acknowledged
+            seq_valid = connection.validate_packet_seq(seq, length)
+            ack_valid = connection.validate_packet_ack(ack)
+            if seq_valid and ack_valid and seq >= connection.ack:
+                connection.update_ack_num(seq, length)
+
+
+def _classify(connection: Connection, seq: int, ack: int, length: int) -> Tuple[int, int]:
+    """
+    Classifies the sequence and acknowledgement numbers of one segment of the SUT.
+    """
+    if connection.ack == -1:
+        return SEQ_FIRST, ACK_FIRST
+
+    if seq == connection.ack:
+        seq_class = SEQ_IN_ORDER
+    elif seq > connection.ack:
+        seq_class = SEQ_FUTURE
+    else:
+        seq_class = SEQ_DUPLICATE if seq + length == connection.ack else SEQ_PAST
+
+    if connection.seq == -1:
+        ack_class = ACK_UNKNOWN
+    elif ack == connection.seq:
+        ack_class = ACK_CURRENT
+    else:
+        ack_class = ACK_PAST if ack < connection.seq else ACK_FUTURE
+    return seq_class, ack_class
+
+
+def abstract(capture: Capture, sut_ip: str, port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+             vectorized: bool = True) -> Abstraction:
+    """
+    Abstracts the segments that the SUT sent in a capture to valid or invalid sequence and acknowledgement
+    numbers, following the sequence state that the TestServer keeps per connection.
+
+    The state of a connection only advances on segments of the SUT that are in order and segments of the
+    TestServer with its current numbers, so the segments that advance the sequence number of one side form
+    a chain: each is the first segment after the one before it that starts where that one ends. The chains
+    of all connections are followed at once, see ``_Chains``, so that duplicate, past and future segments
+    drop out without a look at every segment, and the expected sequence numbers are the running maxima of
+    the ends in the chains. Whether an acknowledgement number is valid depends on the chain of the other
+    side, so the chains are followed again with the acknowledgement numbers that are valid given the state
+    of the last round, until the segments that advance the state given the state before them are exactly
+    those in the chains, usually after one or two rounds. Connections that did not settle after
+    ``MAX_ROUNDS`` are replayed segment by segment through ``Connection`` from their first unsettled segment on.
+    Like the TestServer, sequence number wraparound is not taken into account.
+
+    :param capture: The captured segments.
+    :param sut_ip: The address of the SUT.
+    :param port_range: The inclusive range of the ports of the SUT's connections.
+    :param vectorized: Whether to use the vectorized computation, otherwise all connections are replayed.
+
+    :return: The abstraction of the SUT's segments.
+    """
+    connections = _Connections(capture, sut_ip, port_range)
+    replay_from = connections.settle() if vectorized else connections.starts
+
+    replayed = 0
+    for first, stop in zip(replay_from, connections.ends):
+        if first < stop:
+            connections.replay(first, stop)
+            replayed += stop - first
+
+    kept = connections.kept
+    # the kept rows in capture order
+    position = np.full(len(capture), -1, dtype=np.int64)
+    position[connections.rows[kept]] = np.flatnonzero(kept)
+    sut_rows = position[position >= 0]
+    return Abstraction(
+        rows=connections.rows[sut_rows],
+        seq_class=connections.seq_class[sut_rows],
+        ack_class=connections.ack_class[sut_rows],
+        connections=len(connections.starts),
+        dropped=int(np.count_nonzero(connections.from_sut & ~kept)),
+        test_server_segments=int(np.count_nonzero(~connections.from_sut)),
+        replayed_connections=int(np.count_nonzero(replay_from < connections.ends)),
+        replayed_segments=int(replayed),
+    )
+
+
+def abstract_packets(capture: Capture, abstraction: Abstraction) -> Iterator[TCPPacket]:
+    """
+    Yields the abstract packets that the TestServer would forward to Torxakis, in capture order.
+    """
+    seq_valid = abstraction.seq_valid
+    ack_valid = abstraction.ack_valid
+    for i, row in enumerate(abstraction.rows):
+        yield TCPPacket(
+            sport=int(capture.sport[row]),
+            dport=int(capture.dport[row]),
+            seq=SEQ.SEQ_VALID if seq_valid[i] else SEQ.SEQ_INVALID,
+            ack=ACK.ACK_VALID if ack_valid[i] else ACK.ACK_INVALID,
+            flags=model_flags(int(capture.flags[row])),
+            payload=capture.payload(row)
+        )
+
+
+def statistics(capture: Capture, abstraction: Abstraction) -> Dict[str, object]:
+    """
+    Summarizes an abstraction.
+    """
+    flags = capture.flags[abstraction.rows]
+    seq_counts = np.bincount(abstraction.seq_class, minlength=len(SEQ_CLASSES))
+    ack_counts = np.bincount(abstraction.ack_class, minlength=len(ACK_CLASSES))
+    return {
+        "packets": capture.packets,
+        "tcp_segments": len(capture),
+        "connections": abstraction.connections,
+        "sut_segments": len(abstraction.rows),
+        "test_server_segments": abstraction.test_server_segments,
+        "dropped_segments": abstraction.dropped,
+        "replayed_connections": abstraction.replayed_connections,
+        "replayed_segments": abstraction.replayed_segments,
+        "seq_valid": int(np.count_nonzero(abstraction.seq_valid)),
+        "ack_valid": int(np.count_nonzero(abstraction.ack_valid)),
+        "seq": dict(zip(SEQ_CLASSES, map(int, seq_counts))),
+        "ack": dict(zip(ACK_CLASSES, map(int, ack_counts))),
+        "flags": {flag: int(np.count_nonzero(flags & bit)) for flag, bit in TCP_FLAG_BITS.items()},
+        "payload_bytes": int(capture.payload_len[abstraction.rows].sum()),
+    }
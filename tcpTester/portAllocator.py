@@ -0,0 +1,190 @@
+import errno
+import logging
+import random
+import socket
+import time
+from collections import deque
+from typing import Deque, Optional, Set, Tuple
+
+TIME_WAIT = 60.0  # in seconds, how long Linux keeps a closed connection in TIME_WAIT
+SOCKET_POOL_SIZE = 4  # sockets that are bound to a free port ahead of a CONNECT
+
+
+class PortAllocator:
+    """
+    Hands out the SUT's local ports for active opens.
+
+    Free ports are kept in a queue ordered by the time they were released, so ``acquire`` always returns the
+    port that has been closed the longest and a port only comes back while it may still be in TIME_WAIT when
+    every other port of the range is in use or was closed more recently.
+    """
+
+    def __init__(self, port_range: Tuple[int, int], time_wait: float = TIME_WAIT):
+        """
+        Initializes class variables.
+
+        :param port_range: The inclusive range of ports to hand out.
+        :param time_wait: The time a released port is assumed to stay in TIME_WAIT, in seconds.
+        """
+        self.port_range = port_range
+        ports = list(range(port_range[0], port_range[1] + 1))
+        random.shuffle(ports)
+        # (port, time of release), oldest release first
+        self.free: Deque[Tuple[int, float]] = deque((port, 0.0) for port in ports)
+        self.in_use: Set[int] = set()
+        self.time_wait = time_wait
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the PortAllocator.
+
+        :return: The logger for the PortAllocator.
+        """
+        return logging.getLogger("PortAllocator")
+
+    def acquire(self) -> int:
+        """
+        Returns the free port that has been released the longest ago and marks it as in use.
+        """
+        while self.free:
+            port, released = self.free.popleft()
+            if port in self.in_use:
+                # reserved after it was released, it is queued again when it is released
+                continue
+            early = released + self.time_wait - time.monotonic()
+            if early > 0:
+                self.logger.warning("All free ports may be in TIME_WAIT, reusing %s %.1f s early", port, early)
+            self.in_use.add(port)
+            return port
+        raise OSError(errno.EADDRNOTAVAIL, "No free port left in the SUT's port range")
+
+    def reserve(self, port: int) -> None:
+        """
+        Marks a port that is used outside of the allocator, e.g. the listening port, as in use.
+        """
+        if self.port_range[0] <= port <= self.port_range[1]:
+            self.in_use.add(port)
+
+    def release(self, port: int, connected: bool = True) -> None:
+        """
+        Returns a port after its socket was closed, it is handed out again after all older free ports.
+
+        :param connected: Whether the socket was connected, the port of a socket that was only bound cannot
+                          be in TIME_WAIT and is handed out first.
+        """
+        if port not in self.in_use:
+            return
+        self.in_use.discard(port)
+        if connected:
+            self.free.append((port, time.monotonic()))
+        else:
+            self.free.appendleft((port, 0.0))
+
+
+class SocketPool:
+    """
+    TCP sockets that are created and configured ahead of the user calls that need them: sockets bound to a
+    port of the allocator for CONNECT and an unbound socket for the next LISTEN. The pool is topped up with
+    ``refill`` between user calls; an empty pool creates the socket on demand.
+    """
+
+    def __init__(self,
+                 allocator: PortAllocator,
+                 size: int = SOCKET_POOL_SIZE,
+                 timeout: Optional[float] = None):
+        """
+        Initializes class variables.
+
+        :param allocator: The allocator of the local ports of the bound sockets.
+        :param size: The number of bound sockets that are kept ready.
+        :param timeout: The timeout of the sockets, 0.0 for non-blocking sockets.
+        """
+        self.allocator = allocator
+        self.size = size
+        self.timeout = timeout
+        self.bound: Deque[Tuple[socket.socket, int]] = deque()
+        self.unbound: Optional[socket.socket] = None
+
+    def make_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.settimeout(self.timeout)
+        return sock
+
+    def make_bound_socket(self) -> Tuple[socket.socket, int]:
+        """
+        Creates a socket bound to the next free port, skipping ports that another process uses.
+        """
+        first, last = self.allocator.port_range
+        for _ in range(last - first + 1):
+            port = self.allocator.acquire()
+            sock = self.make_socket()
+            try:
+                sock.bind(("", port))
+                return sock, port
+            except OSError as err:
+                sock.close()
+                self.allocator.release(port)
+                if err.errno != errno.EADDRINUSE:
+                    raise
+        raise OSError(errno.EADDRNOTAVAIL, "Every free port of the SUT's port range is used by another process")
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the SocketPool.
+
+        :return: The logger for the SocketPool.
+        """
+        return logging.getLogger("SocketPool")
+
+    def refill(self) -> None:
+        """
+        Creates the sockets that were taken since the last refill. Failures are left to the user call that
+        takes the socket.
+        """
+        try:
+            while len(self.bound) < self.size:
+                self.bound.append(self.make_bound_socket())
+            if not self.unbound:
+                self.unbound = self.make_socket()
+        except OSError as err:
+            self.logger.warning("Could not refill the socket pool: %s", err)
+
+    def take_bound(self) -> Tuple[socket.socket, int]:
+        """
+        Returns a socket that is bound to a free port, and the port. The port is released with the allocator.
+        """
+        if self.bound:
+            return self.bound.popleft()
+        return self.make_bound_socket()
+
+    def take_unbound(self) -> socket.socket:
+        """
+        Returns a configured socket that is not bound yet.
+        """
+        sock, self.unbound = self.unbound, None
+        return sock or self.make_socket()
+
+    def discard(self, port: int) -> None:
+        """
+        Closes the bound socket of a port that is needed otherwise, e.g. to listen on. The port stays in use.
+        """
+        for sock, bound_port in self.bound:
+            if bound_port == port:
+                sock.close()
+                self.bound.remove((sock, bound_port))
+                return
+
+    def close(self) -> None:
+        """
+        Closes the sockets that were not taken and releases their ports.
+        """
+        while self.bound:
+            sock, port = self.bound.popleft()
+            sock.close()
+            self.allocator.release(port, connected=False)
+        if self.unbound:
+            self.unbound.close()
+            self.unbound = None
@@ -0,0 +1,120 @@
+import logging
+import socket
+import struct
+import time
+from typing import Optional
+
+from tcpTester.sendEngine import SendEngine
+from tcpTester.testServer import scapy_layers
+
+PROC_ROUTE = "/proc/net/route"
+PROC_ARP = "/proc/net/arp"
+SYS_NET = "/sys/class/net"
+DISCARD_PORT = 9
+NEIGHBOUR_TIMEOUT = 1.0  # in seconds, how long to wait for the ARP resolution of the next hop
+NEIGHBOUR_POLL_INTERVAL = 0.005  # in seconds
+
+_IFF_LOOPBACK = 0x8
+_IFF_NOARP = 0x80
+
+
+def _route_address(field: str) -> int:
+    # /proc/net/route holds the addresses as hexadecimal numbers in host byte order
+    return int.from_bytes(struct.pack("=I", int(field, 16)), "big")
+
+
+def next_hop(dst_ip: str, iface: Optional[str] = None) -> str:
+    """
+    Looks up the address whose link-layer address is needed to reach ``dst_ip``: the gateway of the most
+    specific route, or ``dst_ip`` itself if it is on a directly connected network.
+
+    :param dst_ip: The destination.
+    :param iface: Only considers the routes through this interface.
+
+    :return: The next hop, ``dst_ip`` if the routing table cannot be read.
+    """
+    dst = int.from_bytes(socket.inet_aton(dst_ip), "big")
+    best, best_mask = dst_ip, -1
+    try:
+        with open(PROC_ROUTE, encoding="ascii") as routes:
+            next(routes)
+            for line in routes:
+                fields = line.split()
+                if len(fields) < 8 or (iface and fields[0] != iface):
+                    continue
+                destination, gateway, mask = (_route_address(fields[index]) for index in (1, 2, 7))
+                if dst & mask == destination & mask and mask > best_mask:
+                    best_mask = mask
+                    best = socket.inet_ntoa(gateway.to_bytes(4, "big")) if gateway else dst_ip
+    except OSError:
+        pass
+    return best
+
+
+def uses_arp(iface: str) -> bool:
+    """
+    Checks whether the interface resolves link-layer addresses, unlike the loopback device or a TUN device.
+    """
+    try:
+        with open(f"{SYS_NET}/{iface}/flags", encoding="ascii") as flags_file:
+            flags = int(flags_file.read(), 16)
+    except (OSError, ValueError):
+        return True
+    return not flags & (_IFF_LOOPBACK | _IFF_NOARP)
+
+
+def neighbour_resolved(ip: str) -> bool:
+    """
+    Checks whether the kernel's ARP table holds a complete entry for ``ip``.
+    """
+    try:
+        with open(PROC_ARP, encoding="ascii") as entries:
+            next(entries)
+            for line in entries:
+                fields = line.split()
+                # flag 0x2: complete
+                if len(fields) >= 3 and fields[0] == ip and int(fields[2], 16) & 0x2:
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+def prewarm(sut_ip: str, ts_iface: str, transport: str = "iface", decoder: str = "raw") -> float:
+    """
+    Does the slow first-time work of a session before the MBT connection is accepted, so that it does not
+    delay the first steps of the test run: resolves the route and the source address of the SUT, has the
+    kernel resolve the link-layer address of the next hop with an empty datagram to the discard port, and
+    imports scapy if the scapy decoder is used.
+
+    :param sut_ip: The SUT's address.
+    :param ts_iface: The TestServer's interface, with the tun transport the TUN device that is not created yet.
+    :param transport: The TestServer's transport.
+    :param decoder: The TestServer's decoder.
+
+    :return: The time spent, in seconds.
+    """
+    logger = logging.getLogger("Prewarm")
+    start = time.monotonic()
+
+    if decoder == "scapy":
+        scapy_layers().conf.route.route(sut_ip)
+
+    if transport == "iface":
+        try:
+            src_ip = SendEngine.source_ip(sut_ip, ts_iface)
+            hop = next_hop(sut_ip, ts_iface)
+            if uses_arp(ts_iface) and not neighbour_resolved(hop):
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as datagram:
+                    datagram.sendto(b'', (sut_ip, DISCARD_PORT))
+                deadline = time.monotonic() + NEIGHBOUR_TIMEOUT
+                while not neighbour_resolved(hop) and time.monotonic() < deadline:
+                    time.sleep(NEIGHBOUR_POLL_INTERVAL)
+                logger.info("Next hop %s %s", hop, "resolved" if neighbour_resolved(hop) else "not resolved")
+            logger.info("Route to %s from %s via %s, next hop %s", sut_ip, src_ip, ts_iface, hop)
+        except OSError as err:
+            logger.warning("Could not resolve the route to %s: %s", sut_ip, err)
+
+    elapsed = time.monotonic() - start
+    logger.info("Pre-warmed in %.1f ms", elapsed * 1000)
+    return elapsed
@@ -0,0 +1,95 @@
+import socket
+
+RECEIVE_BUFFER_SIZE = 65536  # in bytes, initial capacity of a connection's receive buffer
+
+
+class ReceiveBuffer:
+    """
+    Receive buffer of a connection on a preallocated bytearray.
+
+    The socket reads into the free tail of the buffer through a memoryview, so receiving allocates nothing;
+    only the payload that is taken out of the buffer is copied into a new bytes object. Buffered bytes that
+    are not taken stay for the next RECEIVE.
+    """
+
+    def __init__(self, capacity: int = RECEIVE_BUFFER_SIZE):
+        """
+        Initializes class variables.
+
+        :param capacity: The initial size of the buffer, it only grows to fit a larger expected message.
+        """
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    @property
+    def capacity(self) -> int:
+        return len(self.buffer)
+
+    def clear(self) -> None:
+        """
+        Drops the buffered bytes, e.g. when a new connection is established.
+        """
+        self.start = 0
+        self.end = 0
+
+    def reserve(self, size: int) -> None:
+        """
+        Makes sure that ``size`` bytes fit in the buffer.
+        """
+        if size <= self.capacity:
+            return
+        buffered = bytes(self.view[self.start:self.end])
+        self.view.release()
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.buffer[:len(buffered)] = buffered
+        self.start = 0
+        self.end = len(buffered)
+
+    def free(self) -> memoryview:
+        """
+        Returns the free tail of the buffer, moving the buffered bytes to the front if the tail is full.
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == self.capacity and self.start:
+            length = self.end - self.start
+            # The slices must not overlap, as bytearray copies a memoryview of itself without memmove.
+            data = self.view[self.start:self.end] if self.start >= length else bytes(self.view[self.start:self.end])
+            self.buffer[:length] = data
+            self.start = 0
+            self.end = length
+        return self.view[self.end:]
+
+    def commit(self, size: int) -> None:
+        """
+        Marks ``size`` bytes after the buffered ones as received, after reading into ``free()``.
+        """
+        self.end += size
+
+    def recv_from(self, sock: socket.socket) -> int:
+        """
+        Reads everything the socket has available, up to the free space of the buffer.
+
+        :return: The number of bytes read, 0 at the end of the stream or when the buffer is full.
+        """
+        free = self.free()
+        if not free:
+            return 0
+        size = sock.recv_into(free)
+        self.end += size
+        return size
+
+    def take(self, limit: int) -> bytes:
+        """
+        Removes and returns up to ``limit`` buffered bytes.
+        """
+        size = min(limit, self.end - self.start)
+        payload = bytes(self.view[self.start:self.start + size])
+        self.start += size
+        return payload
@@ -0,0 +1,16 @@
+"""
+The parts of scapy that the TestServer uses: building packets, and dissecting and sniffing frames for the
+scapy decoder.
+
+``scapy.all`` loads every layer and scans the routes and interfaces, which takes seconds on some hosts.
+The TestServer imports this module on first use only, see ``testServer.scapy_layers``, so the raw decoder
+and the other entry points never import scapy.
+"""
+# pylint: disable=unused-import
+
+from scapy.compat import raw
+from scapy.config import conf
+from scapy.layers.inet import IP, TCP
+from scapy.packet import Packet, Raw
+from scapy.sendrecv import AsyncSniffer
+from scapy.supersocket import SuperSocket
@@ -0,0 +1,122 @@
+import socket
+import struct
+from typing import NamedTuple, Optional, Union
+
+from tcpTester.bpf import ETH_HEADER_LEN
+from tcpTester.sendEngine import TCP_FLAG_BITS, TCP_OPTION_MSS
+from tcpTester.types import TCPFlag
+
+_ETHERTYPE_IPV4 = b"\x08\x00"
+_IP_VERSION_IHL = 0
+_IP_TOTAL_LEN = struct.Struct("!H")
+_IP_FRAGMENT = struct.Struct("!H")
+_IP_PROTOCOL = 9
+_IP_MIN_HEADER_LEN = 20  # in bytes
+_TCP_HEADER = struct.Struct("!HHIIBBH")
+_TCP_MIN_HEADER_LEN = 20  # in bytes
+_TCP_OPTION_END = 0
+_TCP_OPTION_NOP = 1
+_MSS = struct.Struct("!H")
+
+# More fragments flag and fragment offset.
+_FRAGMENTED = 0x3fff
+
+_FIN = TCP_FLAG_BITS["F"]
+_SYN = TCP_FLAG_BITS["S"]
+
+
+class Segment(NamedTuple):
+    """
+    The fields of a captured IPv4 TCP segment that the TestServer needs, with the flags as the flags byte.
+    """
+    src_ip: str
+    dst_ip: str
+    sport: int
+    dport: int
+    seq: int
+    ack: int
+    flags: int
+    payload: bytes
+    # the advertised receive window, unscaled
+    window: int = 0
+    # the maximum segment size option of a SYN segment, 0 if there is none
+    mss: int = 0
+
+    @property
+    def length(self) -> int:
+        """
+        The length of the segment in sequence numbers, counting the fin (F) and syn (S) flags.
+        """
+        return len(self.payload) + bool(self.flags & _FIN) + bool(self.flags & _SYN)
+
+
+def decode_frame(frame: Union[bytes, bytearray, memoryview], link_offset: int = ETH_HEADER_LEN) -> Optional[Segment]:
+    """
+    Reads an IPv4 TCP segment directly from the bytes of a captured frame.
+
+    :param frame: The captured frame.
+    :param link_offset: The size of the link layer header, 14 for Ethernet and 0 for raw IP.
+
+    :return: The segment, or None if the frame is not an unfragmented IPv4 TCP segment, is truncated or its
+             header lengths are shorter than the minimal headers.
+    """
+    if link_offset and frame[link_offset - 2:link_offset] != _ETHERTYPE_IPV4:
+        return None
+    if len(frame) < link_offset + _IP_MIN_HEADER_LEN:
+        return None
+
+    version_ihl = frame[link_offset + _IP_VERSION_IHL]
+    if version_ihl >> 4 != 4 or version_ihl & 0x0f < 5 or frame[link_offset + _IP_PROTOCOL] != socket.IPPROTO_TCP:
+        return None
+    if _IP_FRAGMENT.unpack_from(frame, link_offset + 6)[0] & _FRAGMENTED:
+        return None
+
+    tcp_offset = link_offset + (version_ihl & 0x0f) * 4
+    # Frames may be padded beyond the end of the IP packet.
+    end = min(link_offset + _IP_TOTAL_LEN.unpack_from(frame, link_offset + 2)[0], len(frame))
+    if end < tcp_offset + _TCP_MIN_HEADER_LEN:
+        return None
+
+    sport, dport, seq, ack, data_offset, flags, window = _TCP_HEADER.unpack_from(frame, tcp_offset)
+    payload_offset = tcp_offset + (data_offset >> 4) * 4
+    # The payload would start within the header, or after the end of the packet.
+    if data_offset >> 4 < 5 or payload_offset > end:
+        return None
+    return Segment(socket.inet_ntoa(frame[link_offset + 12:link_offset + 16]),
+                   socket.inet_ntoa(frame[link_offset + 16:link_offset + 20]),
+                   sport,
+                   dport,
+                   seq,
+                   ack,
+                   flags,
+                   bytes(frame[payload_offset:end]),
+                   window,
+                   find_mss(frame, tcp_offset + _TCP_MIN_HEADER_LEN, min(payload_offset, end)) if flags & _SYN else 0)
+
+
+def find_mss(frame: Union[bytes, bytearray, memoryview], start: int, end: int) -> int:
+    """
+    Reads the maximum segment size from the TCP options between ``start`` and ``end``.
+
+    :return: The maximum segment size, 0 if the options do not contain it or are malformed.
+    """
+    while start < end:
+        kind = frame[start]
+        if kind == _TCP_OPTION_END:
+            break
+        if kind == _TCP_OPTION_NOP:
+            start += 1
+            continue
+        if start + 1 >= end or frame[start + 1] < 2:
+            break
+        if kind == TCP_OPTION_MSS and frame[start + 1] == 4 and start + 4 <= end:
+            return _MSS.unpack_from(frame, start + 2)[0]
+        start += frame[start + 1]
+    return 0
+
+
+def model_flags(flags: int) -> TCPFlag:
+    """
+    Abstracts the flags byte of a segment to the flags of the model.
+    """
+    return TCPFlag.from_bits(flags)
@@ -0,0 +1,199 @@
+import logging
+import socket
+import struct
+from typing import Callable, Iterable, Optional, Union
+
+IP_HEADER_LEN = 20  # in bytes, no options
+TCP_HEADER_LEN = 20  # in bytes, no options
+HEADER_LEN = IP_HEADER_LEN + TCP_HEADER_LEN
+MAX_PACKET_SIZE = 0xffff  # in bytes, the largest IP total length
+MAX_PAYLOAD_SIZE = MAX_PACKET_SIZE - HEADER_LEN
+MAX_OPTIONS_LEN = 40  # in bytes
+
+# Same defaults as scapy's IP() and TCP() layers.
+DEFAULT_TTL = 64
+DEFAULT_WINDOW = 8192
+
+TCP_OPTION_MSS = 2
+
+TCP_FLAG_BITS = {"F": 0x01, "S": 0x02, "R": 0x04, "P": 0x08, "A": 0x10, "U": 0x20, "E": 0x40, "C": 0x80}
+
+_IP_HEADER = struct.Struct("!BBHHHBBH4s4s")
+_TCP_HEADER = struct.Struct("!HHIIBBHHH")
+_SEQ_ACK_FLAGS = struct.Struct("!IIBB")
+_TOTAL_LEN = struct.Struct("!H")
+_CHECKSUM = struct.Struct("=H")
+_MSS_OPTION = struct.Struct("!BBH")
+
+_IP_OFFSET_CHECKSUM = 10
+_TCP_OFFSET_CHECKSUM = IP_HEADER_LEN + 16
+
+
+def flags_to_bits(flags: Iterable[str]) -> int:
+    """
+    Converts TCP flag letters (as used by scapy, e.g. ``"SA"``) to the flags byte of the TCP header.
+    """
+    bits = 0
+    for flag in flags:
+        bits |= TCP_FLAG_BITS[flag]
+    return bits
+
+
+def _fold(total: int) -> int:
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return total
+
+
+def mss_option(mss: int) -> bytes:
+    """
+    Encodes the maximum segment size option of a SYN segment.
+    """
+    return _MSS_OPTION.pack(TCP_OPTION_MSS, _MSS_OPTION.size, mss)
+
+
+class SendEngine:
+    """
+    Sends TCP segments to a single host through one raw socket that stays open for the whole session.
+
+    The IP and TCP headers for the current 4-tuple are kept in a reusable buffer; per segment only the
+    seq, ack, flags, payload and TCP checksum are patched in place. On the raw socket the kernel fills in
+    the IP checksum and identification fields.
+
+    Instead of the raw socket, segments can be handed to an ``output`` function, e.g. the write of a TUN
+    device. The IP checksum is then computed here as well.
+    """
+
+    def __init__(self,
+                 dst_ip: str,
+                 iface: Optional[str] = None,
+                 src_ip: Optional[str] = None,
+                 output: Optional[Callable[[Union[bytes, memoryview]], int]] = None,
+                 window: int = DEFAULT_WINDOW):
+        """
+        Opens the raw socket and prepares the header template.
+
+        :param dst_ip: The IP address that all segments are sent to.
+        :param iface: Optional interface to bind the socket to.
+        :param src_ip: Optional source address, by default the address the kernel would use to reach ``dst_ip``.
+        :param output: Optional function that sends complete IP packets instead of the raw socket.
+        :param window: The receive window that the segments advertise, without window scaling.
+        """
+        self.dst_ip = dst_ip
+        self.window = window
+        self.src_ip = src_ip or SendEngine.source_ip(dst_ip, iface)
+        self.sport = -1
+        self.dport = -1
+        self.output = output
+
+        self.socket = None
+        if not output:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            if iface:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, iface.encode())
+
+        # One spare byte so that odd-sized payloads can be zero padded for the checksum.
+        self.buffer = bytearray(HEADER_LEN + MAX_OPTIONS_LEN + MAX_PAYLOAD_SIZE + 1)
+        self.view = memoryview(self.buffer)
+
+        src = socket.inet_aton(self.src_ip)
+        dst = socket.inet_aton(dst_ip)
+        _IP_HEADER.pack_into(self.buffer, 0, 0x45, 0, 0, 0, 0, DEFAULT_TTL, socket.IPPROTO_TCP, 0, src, dst)
+        # IP header without the total length, which changes per segment.
+        self.ip_sum = sum(self.view[:IP_HEADER_LEN].cast("H"))
+        # Source address, destination address and protocol of the TCP pseudo header.
+        self.pseudo_sum = sum(memoryview(src + dst + bytes([0, socket.IPPROTO_TCP])).cast("H"))
+
+        self.set_ports(0, 0)
+
+    @property
+    def logger(self):
+        """
+        Returns the logger used for the SendEngine.
+
+        :return: The logger for the SendEngine.
+        """
+        return logging.getLogger("SendEngine")
+
+    @staticmethod
+    def source_ip(dst_ip: str, iface: Optional[str] = None) -> str:
+        """
+        Determines the local address that the kernel would use to reach a given host.
+        """
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            if iface:
+                probe.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, iface.encode())
+            probe.connect((dst_ip, 9))
+            return probe.getsockname()[0]
+        finally:
+            probe.close()
+
+    def set_ports(self, sport: int, dport: int) -> None:
+        """
+        Fills the TCP header template for a new pair of ports.
+        """
+        self.sport = sport
+        self.dport = dport
+        _TCP_HEADER.pack_into(self.buffer, IP_HEADER_LEN, sport, dport, 0, 0, TCP_HEADER_LEN << 2, 0,
+                              self.window, 0, 0)
+
+    def send(self,
+             seq: int,
+             ack: int,
+             flags: int,
+             payload: Union[bytes, memoryview] = b'',
+             options: bytes = b'') -> int:
+        """
+        Patches the header template and sends one segment.
+
+        :param seq: The sequence number of the segment.
+        :param ack: The acknowledgement number of the segment.
+        :param flags: The flags byte of the segment, see ``flags_to_bits``.
+        :param payload: The payload of the segment.
+        :param options: The TCP options of the segment, padded to a multiple of 4 bytes, e.g. ``mss_option``.
+
+        :return: The number of bytes sent, 0 if the segment does not fit into an IP packet.
+        """
+        buffer = self.buffer
+        size = len(payload)
+        header_len = HEADER_LEN + len(options)
+        end = header_len + size
+        tcp_len = end - IP_HEADER_LEN
+        if end > MAX_PACKET_SIZE or len(options) > MAX_OPTIONS_LEN:
+            self.logger.error("Segment of %s bytes with %s bytes of options does not fit into an IP packet, "
+                              "not sent", size, len(options))
+            return 0
+
+        _TOTAL_LEN.pack_into(buffer, 2, end)
+        _SEQ_ACK_FLAGS.pack_into(buffer, IP_HEADER_LEN + 4, seq & 0xffffffff, ack & 0xffffffff,
+                                 (tcp_len - size) << 2, flags)
+        _CHECKSUM.pack_into(buffer, _TCP_OFFSET_CHECKSUM, 0)
+        if options:
+            buffer[HEADER_LEN:header_len] = options
+        buffer[header_len:end] = payload
+        buffer[end] = 0
+
+        # The one's complement sum is byte order independent, so it is computed on host order words.
+        total = self.pseudo_sum + socket.htons(tcp_len) + sum(self.view[IP_HEADER_LEN:end + (size & 1)].cast("H"))
+        _CHECKSUM.pack_into(buffer, _TCP_OFFSET_CHECKSUM, ~_fold(total) & 0xffff)
+
+        if self.output:
+            _CHECKSUM.pack_into(buffer, _IP_OFFSET_CHECKSUM, ~_fold(self.ip_sum + socket.htons(end)) & 0xffff)
+            return self.output(self.view[:end])
+        return self.socket.sendto(self.view[:end], (self.dst_ip, 0))
+
+    def send_raw(self, packet: bytes) -> int:
+        """
+        Sends a fully built IP packet through the raw socket or the output function.
+        """
+        if self.output:
+            return self.output(packet)
+        return self.socket.sendto(packet, (self.dst_ip, 0))
+
+    def close(self) -> None:
+        """
+        Closes the raw socket.
+        """
+        if self.socket:
+            self.socket.close()
@@ -1,41 +1,104 @@
+import errno
 import logging
+import selectors
 import socket
-import random
-from typing import cast
+import time
+from typing import Dict, Optional, Tuple, cast
 
+from tcpTester.metrics import Metrics
+from tcpTester.portAllocator import SOCKET_POOL_SIZE, TIME_WAIT, PortAllocator, SocketPool
+from tcpTester.receiveBuffer import RECEIVE_BUFFER_SIZE, ReceiveBuffer
 from tcpTester.types import (
+    MAX_PORT,
+    MIN_PORT,
     CommandType,
     ConnectParameters,
     ListenParameters,
+    ReceiveParameters,
     SendParameters,
     UserCall,
     UserCallResult,
     UserCallResultType
 )
 
-MAX_READ_SIZE = 4096  # in bytes
+MAX_READ_SIZE = 4096  # in bytes, default maximum payload of a RECEIVE without an expected length
 TIMEOUT = 20
 
+# Maximum duration of the user calls that wait for the other TCP endpoint, in seconds.
+DEFAULT_TIMEOUTS = {
+    CommandType.LISTEN: TIMEOUT,
+    CommandType.CONNECT: TIMEOUT,
+    CommandType.SEND: TIMEOUT,
+    CommandType.RECEIVE: TIMEOUT,
+}
+
+# Metrics stage of every user call.
+USER_CALL_STAGES = {command: f"sut.{command.name.lower()}" for command in CommandType}
+
+
+class OperationCancelled(Exception):
+    """
+    A pending user call was abandoned because the next user call arrived or Torxakis disconnected.
+    """
+
+
 class SUT:
     """
     Implementation of the System Under Test (SUT)
     """
 
-    def __init__(self, ts_ip: str):
+    def __init__(self,
+                 ts_ip: str,
+                 port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+                 metrics: Optional[Metrics] = None,
+                 receive_max: int = MAX_READ_SIZE,
+                 receive_buffer: int = RECEIVE_BUFFER_SIZE,
+                 socket_pool: int = SOCKET_POOL_SIZE,
+                 time_wait: float = TIME_WAIT,
+                 timeouts: Optional[Dict[CommandType, float]] = None,
+                 cancel_on: Optional[socket.socket] = None):
         """
         Initializes class variables.
+
+        :param ts_ip: The IP address of the test server.
+        :param port_range: The inclusive range of local ports used for active opens.
+        :param metrics: Records the latencies of the user calls.
+        :param receive_max: The maximum payload of a RECEIVE without an expected length.
+        :param receive_buffer: The initial size of the receive buffer.
+        :param socket_pool: The number of sockets that are bound ahead of a CONNECT.
+        :param time_wait: The time a closed local port is not reused for a CONNECT, in seconds.
+        :param timeouts: The maximum duration of the user calls, see ``DEFAULT_TIMEOUTS``.
+        :param cancel_on: The MBT socket: a pending user call is abandoned as soon as it becomes readable.
         """
-        self.logger.info("SUT started")
+        self.logger.info("SUT started with ports %s-%s", *port_range)
 
         self.ts_ip = ts_ip
+        self.port_range = port_range
+        self.metrics = metrics or Metrics(enabled=False)
+        self.receive_max = receive_max
+        # Bytes received on the current connection that no RECEIVE returned yet.
+        self.receive_buffer = ReceiveBuffer(receive_buffer)
 
         # Socket for communicating with another TCP endpoint.
         self.client_socket = None
+        # Local port of the client socket if it was opened by a CONNECT.
+        self.client_port = None
         # Socket for connecting with another TCP endpoint.
         self.socket = None
 
         self.listen_port = -1
 
+        self.ports = PortAllocator(port_range, time_wait)
+        # Non-blocking sockets, the user calls wait for them with the selector.
+        self.socket_pool = SocketPool(self.ports, socket_pool, 0.0)
+        self.socket_pool.refill()
+
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.selector = selectors.DefaultSelector()
+        self.cancel_on = cancel_on
+        if cancel_on:
+            self.selector.register(cancel_on, selectors.EVENT_READ)
+
     @property
     def logger(self):
         """
@@ -45,7 +108,22 @@ class SUT:
         """
         return logging.getLogger("SUT")
 
-    def handle_user_call(self, user_call: UserCall) -> UserCallResult:
+    def handle_user_call(self, user_call: UserCall) -> Optional[UserCallResult]:
+        """
+        Handles a user call.
+
+        :return: The result of the user call, None if it was abandoned and must not be answered.
+        """
+        start = time.monotonic_ns()
+        try:
+            result: Optional[UserCallResult] = self.dispatch_user_call(user_call)
+        except OperationCancelled:
+            self.logger.info("%s abandoned, the next user call arrived", user_call.command_type.name)
+            result = None
+        self.metrics.record(USER_CALL_STAGES[user_call.command_type], start)
+        return result
+
+    def dispatch_user_call(self, user_call: UserCall) -> UserCallResult:
         if user_call.command_type == CommandType["LISTEN"]:
             return self.handle_listen_call(cast(ListenParameters, user_call.command_parameters))
         if user_call.command_type == CommandType["CONNECT"]:
@@ -53,7 +131,7 @@ class SUT:
         if user_call.command_type == CommandType["SEND"]:
             return self.handle_send_call(cast(SendParameters, user_call.command_parameters))
         if user_call.command_type == CommandType["RECEIVE"]:
-            return self.handle_receive_call()
+            return self.handle_receive_call(cast(Optional[ReceiveParameters], user_call.command_parameters))
         if user_call.command_type == CommandType["CLOSE"]:
             return self.handle_close_call()
 
@@ -63,7 +141,68 @@ class SUT:
         """
         Resets the sockets used to connect to and communicate with another TCP endpoint.
         """
+        if self.client_socket:
+            self.client_socket.close()
         self.client_socket = None
+        if self.client_port:
+            self.ports.release(self.client_port)
+            self.client_port = None
+        self.receive_buffer.clear()
+
+    def start_session(self, cancel_on: Optional[socket.socket] = None) -> None:
+        """
+        Starts a new session after ``end_session``, the socket pool and the ports in TIME_WAIT are kept.
+
+        :param cancel_on: The MBT socket of the new session.
+        """
+        self.cancel_on = cancel_on
+        if cancel_on:
+            self.selector.register(cancel_on, selectors.EVENT_READ)
+
+    def end_session(self) -> None:
+        """
+        Closes the connection and the listening socket of the session.
+        """
+        self.reset()
+        self.close_listening_socket()
+        if self.cancel_on:
+            self.selector.unregister(self.cancel_on)
+            self.cancel_on = None
+
+    def wait(self, sock: socket.socket, events: int, deadline: float) -> None:
+        """
+        Waits until a socket is ready for the given selector events.
+
+        :raises TimeoutError: The deadline, from ``time.monotonic()``, passed.
+        :raises OperationCancelled: The MBT socket became readable first.
+        """
+        self.selector.register(sock, events)
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(errno.ETIMEDOUT, "The user call timed out")
+                ready = self.selector.select(remaining)
+                if any(key.fileobj is self.cancel_on for key, _ in ready):
+                    raise OperationCancelled()
+                if ready:
+                    return
+        finally:
+            self.selector.unregister(sock)
+
+    def deadline(self, command_type: CommandType) -> float:
+        return time.monotonic() + self.timeouts[command_type]
+
+    def close_listening_socket(self):
+        """
+        Closes the listening socket and releases its port.
+        """
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+        if self.listen_port != -1:
+            self.ports.release(self.listen_port)
+            self.listen_port = -1
 
     def handle_connect_call(self, parameters: ConnectParameters):
         """
@@ -71,15 +210,19 @@ class SUT:
         """
         self.logger.info("Attempting to connect to %s", parameters.dst_port)
 
+        deadline = self.deadline(CommandType.CONNECT)
+        self.reset()
         try:
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.settimeout(TIMEOUT)
-            port = random.randint(10000, 12000)
-            self.client_socket.bind(("", port))
+            self.client_socket, self.client_port = self.socket_pool.take_bound()
             self.logger.info("bind successful")
-            self.client_socket.connect((self.ts_ip, parameters.dst_port))
-
-        except Exception:
+            error = self.client_socket.connect_ex((self.ts_ip, parameters.dst_port))
+            if error == errno.EINPROGRESS:
+                self.wait(self.client_socket, selectors.EVENT_WRITE, deadline)
+                error = self.client_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                raise OSError(error, "connect failed")
+
+        except OSError:
             return UserCallResult(status=UserCallResultType.FAILURE)
 
         self.logger.info("connection successful")
@@ -91,6 +234,7 @@ class SUT:
         Passively listens for an incoming connection request from another TCP endpoint.
         """
 
+        deadline = self.deadline(CommandType.LISTEN)
         # clear any previous sockets
         self.reset()
 
@@ -98,19 +242,28 @@ class SUT:
         try:
 
             if self.listen_port != parameters.src_port or not self.socket:
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.settimeout(TIMEOUT)
-                self.socket.bind(("", parameters.src_port))
-                self.socket.listen(1)
+                self.close_listening_socket()
                 self.listen_port = parameters.src_port
+                self.ports.reserve(self.listen_port)
+                self.socket_pool.discard(self.listen_port)
+                listening = self.socket_pool.take_unbound()
+                try:
+                    listening.bind(("", self.listen_port))
+                    listening.listen(1)
+                except OSError:
+                    listening.close()
+                    raise
+                self.socket = listening
 
             self.logger.info("bind and listen successful")
 
+            self.wait(self.socket, selectors.EVENT_READ, deadline)
             (self.client_socket, _) = self.socket.accept()
+            self.client_socket.setblocking(False)
 
             self.logger.info("received client connect")
 
-        except Exception:
+        except OSError:
             return UserCallResult(status=UserCallResultType.FAILURE)
 
         return UserCallResult(status=UserCallResultType.SUCCESS)
@@ -123,28 +276,45 @@ class SUT:
         if not self.client_socket:
             return UserCallResult(status=UserCallResultType.FAILURE)
 
+        deadline = self.deadline(CommandType.SEND)
         try:
-            num_bytes = self.client_socket.send(parameters.payload)
-        except Exception:
+            payload = memoryview(parameters.payload)
+            while payload:
+                try:
+                    payload = payload[self.client_socket.send(payload):]
+                except BlockingIOError:
+                    self.wait(self.client_socket, selectors.EVENT_WRITE, deadline)
+        except OSError:
             return UserCallResult(status=UserCallResultType.FAILURE)
 
         self.logger.info("sending completed")
 
         return UserCallResult(status=UserCallResultType.SUCCESS)
 
-    def handle_receive_call(self):
+    def handle_receive_call(self, parameters: Optional[ReceiveParameters] = None):
         """
-        Receives a single packet from the TCP endpoint with which the SUT is connected.
+        Receives data from the TCP endpoint with which the SUT is connected: everything that is available,
+        up to ``receive_max`` bytes, or, if an expected length is given, exactly that many bytes.
+        A RECEIVE that ends at the end of the stream returns the bytes received until then.
         """
         self.logger.info("receiving packet from client")
         if not self.client_socket:
             return UserCallResult(status=UserCallResultType.FAILURE)
 
+        deadline = self.deadline(CommandType.RECEIVE)
+        expected = parameters.length if parameters else 0
+        self.receive_buffer.reserve(expected)
         try:
-            payload = self.client_socket.recv(MAX_READ_SIZE)
-        except Exception:
+            while len(self.receive_buffer) < (expected or 1):
+                try:
+                    if not self.receive_buffer.recv_from(self.client_socket):
+                        break
+                except BlockingIOError:
+                    self.wait(self.client_socket, selectors.EVENT_READ, deadline)
+        except OSError:
             return UserCallResult(status=UserCallResultType.FAILURE)
 
+        payload = self.receive_buffer.take(expected or self.receive_max)
         self.logger.info("receive completed")
         return UserCallResult(status=UserCallResultType.RECEIVE, payload=payload)
 
@@ -1,35 +1,145 @@
 #!/usr/bin/env python3
+from __future__ import annotations
 
+import importlib
+import logging
+import socket
+import time
 from random import randint
-from typing import Optional, List, TextIO
-
-from scapy.all import *
-from scapy.layers.inet import TCP, IP
+from threading import Condition, Event, Lock, Thread
+from types import ModuleType
+from typing import TYPE_CHECKING, Callable, Optional, List, TextIO, Tuple, Union
+
+from tcpTester.bpf import ETH_HEADER_LEN, SNAP_LEN, attach_filter, sut_tcp_filter
+from tcpTester.captureRing import DEFAULT_RING_SIZE, CaptureProcess
+from tcpTester.connection import Connection, ConnectionKey, ConnectionTable
+from tcpTester.listenProbe import READY_PROBE_INTERVAL, READY_TIMEOUT, ListenProbe
+from tcpTester.mbtWriter import MBT_QUEUE_SIZE, MbtWriter
+from tcpTester.metrics import Metrics
+from tcpTester.segmentDecoder import Segment, decode_frame, model_flags
+from tcpTester.sendEngine import DEFAULT_WINDOW, SendEngine, TCP_FLAG_BITS, flags_to_bits, mss_option
+from tcpTester.tpacketRing import TpacketRing
+from tcpTester.tunTransport import TunTransport
+from tcpTester.types import ACK, SEQ, MAX_PORT, MIN_PORT, TCPPacket, TCPFlag
+
+if TYPE_CHECKING:
+    from scapy.packet import Packet
+    from scapy.supersocket import SuperSocket
+
+# Decoders of captured segments: raw reads the headers from the captured bytes,
+# scapy dissects every frame with scapy's AsyncSniffer and is meant for debugging.
+DECODERS = ["raw", "scapy"]
+# Transports: iface sends on a raw socket and captures on the TestServer's interface, tun creates a TUN device
+# for a SUT on the same host and reads and writes its file descriptor.
+TRANSPORTS = ["iface", "tun"]
+# Captures of the raw decoder: thread reads the frames in a thread of the TestServer, process reads them in a
+# dedicated process that hands them over in a ring buffer in shared memory and keeps up with bursts while the
+# TestServer is busy, mmap reads whole blocks of frames from a TPACKET_V3 ring that the kernel shares with the
+# TestServer and hands them over in batches (only on an interface).
+CAPTURES = ["thread", "process", "mmap"]
+
+ETH_P_ALL = 0x0003
+CAPTURE_POLL_INTERVAL = 0.2  # in seconds, how often the capture thread checks whether it should stop
+DEFAULT_MSS = 1460  # in bytes, the TestServer's maximum segment size, announced in its SYN segments
+WINDOW_TIMEOUT = 5.0  # in seconds, how long a segmented payload waits for the SUT's window to open
+
+
+def scapy_layers() -> ModuleType:
+    """
+    Imports the scapy layers on first use, as only the scapy decoder and ``make_packet`` need them.
 
-from tcpTester.types import ACK, SEQ, TCPPacket, TCPFlag
+    :return: The ``tcpTester.scapyLayers`` module.
+    """
+    return importlib.import_module("tcpTester.scapyLayers")
 
 class TestServer:
     """
     Implementation of the TestServer.
     """
 
-    def __init__(self, ts_iface: str, sut_ip: str, mbt_client: TextIO):
+    def __init__(self,
+                 ts_iface: str,
+                 sut_ip: str,
+                 mbt_client: TextIO,
+                 kernel_filter: bool = True,
+                 ready_timeout: float = READY_TIMEOUT,
+                 ready_probe_interval: float = READY_PROBE_INTERVAL,
+                 port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+                 decoder: str = "raw",
+                 transport: str = "iface",
+                 tun_ip: Optional[str] = None,
+                 metrics: Optional[Metrics] = None,
+                 mbt_queue_size: int = MBT_QUEUE_SIZE,
+                 mss: int = DEFAULT_MSS,
+                 window: int = DEFAULT_WINDOW,
+                 window_timeout: float = WINDOW_TIMEOUT,
+                 capture: str = "thread",
+                 capture_ring_size: int = DEFAULT_RING_SIZE):
         """
         Initializes class variables.
+
+        :param kernel_filter: Whether captured frames are filtered by a BPF program in the kernel.
+                              Otherwise every frame is dissected and filtered in Python.
+        :param ready_timeout: The maximum time to wait for the SUT to listen before opening a new connection.
+        :param ready_probe_interval: The time between two probes of the SUT's listening port.
+        :param port_range: The inclusive range of the SUT's ports whose segments are captured.
+        :param decoder: How captured segments are decoded, see ``DECODERS``.
+        :param transport: How segments are sent and captured, see ``TRANSPORTS``. With tun, ``ts_iface`` is the
+                          name of the TUN device that is created.
+        :param tun_ip: The TestServer's address on the TUN device, the SUT uses ``sut_ip`` on its host side.
+        :param metrics: Records the latencies of the stages of sending and receiving segments.
+        :param mbt_queue_size: The maximum number of abstract packets that wait to be written to the MBT channel.
+        :param mss: The TestServer's maximum segment size. Payloads larger than it or than the SUT's maximum
+                    segment size are sent in several segments.
+        :param window: The receive window that the TestServer advertises.
+        :param window_timeout: How long a segmented payload waits for the SUT's receive window to open.
+        :param capture: Where the raw decoder captures frames, see ``CAPTURES``.
+        :param capture_ring_size: The size (in bytes) of the ring buffer of the process or the mmap capture.
         """
         self.logger.info("test server started")
 
         # Variables used for stubbing a communication partner for a TCP endpoint.
-        self.ip = IP(dst=sut_ip)
-        self.seq = -1
-        self.ack = -1
-        self.sport = -1
-        self.dport = -1
+        self.sut_ip = sut_ip
+        self.connections = ConnectionTable()
         self.ts_iface = ts_iface
         self.bg_sniffer = None
+        self.kernel_filter = kernel_filter
+        self.port_range = port_range
+        self.decoder = decoder
+        self.capture_socket = None
+        self.capture_thread = None
+        self.capture_stop = Event()
+        self.capture = capture
+        self.capture_ring_size = capture_ring_size
+        self.capture_process = None
+        self.capture_ring = None
         self.lock = Lock()
+        # Notified when the SUT acknowledges data or changes its window, under the lock.
+        self.window_update = Condition(self.lock)
+        self.metrics = metrics or Metrics(enabled=False)
+        self.mss = mss
+        self.window_timeout = window_timeout
+
+        self.tun = None
+        if transport == "tun":
+            self.tun = TunTransport(ts_iface, sut_ip, tun_ip)
+            self.logger.info("Created TUN device %s, SUT %s, test server %s", self.tun.name, sut_ip, tun_ip)
+            self.send_engine = SendEngine(sut_ip, src_ip=tun_ip, output=self.tun.write, window=window)
+            probe_engine = SendEngine(sut_ip, src_ip=tun_ip, output=self.tun.write)
+            if decoder != "raw":
+                self.logger.warning("The tun transport only supports the raw decoder")
+                self.decoder = "raw"
+            if capture == "mmap":
+                self.logger.warning("The tun transport does not support the mmap capture")
+                self.capture = "thread"
+        else:
+            # Raw socket that stays open for the whole session.
+            self.send_engine = SendEngine(sut_ip, ts_iface, window=window)
+            probe_engine = None
+        self.listen_probe = ListenProbe(sut_ip, ts_iface, ready_timeout, ready_probe_interval, engine=probe_engine)
 
         self.mbt_client = mbt_client
+        self.mbt_writer = MbtWriter(mbt_client, mbt_queue_size, self.metrics)
         self.start_bg_sniffer()
 
     @property
@@ -43,26 +153,29 @@ class TestServer:
 
     def reset(self) -> None:
         """
-        Resets the variables that the TestServer uses for TCP communication.
+        Removes all connections for which the TestServer stubs a communication partner.
 
         :return: None
         """
-        self.seq = randint(3000000, 4999999)
-        self.ack = -1
-        self.sport = -1
-        self.dport = -1
+        self.connections.clear()
 
-    def update_sequence_num(self, packet: Packet) -> None:
+    def connection_key(self, sport: int, dport: int) -> ConnectionKey:
         """
-        Updates the internal sequence number of the TestServer based on a given packet.
+        Returns the 4-tuple of a connection between a port of the TestServer and a port of the SUT.
         """
-        self.seq += TestServer.packet_length(packet)
+        return (self.send_engine.src_ip, sport, self.sut_ip, dport)
 
-    def update_ack_num(self, packet: Packet) -> None:
+    @staticmethod
+    def segment_length(payload: bytes, flags: str) -> int:
         """
-        Updates the internal acknowledgement number of the TestServer based on a given packet.
+        Determines the length of a segment that is about to be sent, counting the fin (F) and syn (S) flags.
+
+        :param payload: The payload of the segment.
+        :param flags: The flags of the segment.
+
+        :return: The length of the segment.
         """
-        self.ack = packet.seq + TestServer.packet_length(packet)
+        return len(payload) + ("F" in flags) + ("S" in flags)
 
     @staticmethod
     def packet_length(packet: Packet) -> int:
@@ -74,110 +187,433 @@ class TestServer:
 
         :return: The length of the packet.
         """
+        layers = scapy_layers()
         size = 0
-        if Raw in packet:
-            size = len(packet[Raw].load)
-        for f in ["F", "S"]:
-            if f in packet.sprintf("%TCP.flags%"):
-                size += 1
-        return size
+        if layers.Raw in packet:
+            size = len(packet[layers.Raw].load)
+        flags = int(packet[layers.TCP].flags)
+        return size + bool(flags & TCP_FLAG_BITS["F"]) + bool(flags & TCP_FLAG_BITS["S"])
 
-    def validate_packet_seq(self, packet: Packet) -> bool:
+    @staticmethod
+    def segment_from_packet(packet: Packet) -> Segment:
         """
-        Validates the sequence number of a given packet.
+        Converts a packet dissected by scapy to the fields that the raw decoder produces.
         """
-        if self.ack == -1:
-            # first packet received in a new connection
-            # thus have no previous knowledge about the other
-            # party's seq value
-            return True
+        layers = scapy_layers()
+        ip, tcp = packet[layers.IP], packet[layers.TCP]
+        return Segment(ip.src,
+                       ip.dst,
+                       tcp.sport,
+                       tcp.dport,
+                       tcp.seq,
+                       tcp.ack,
+                       int(tcp.flags),
+                       packet[layers.Raw].load if layers.Raw in packet else b'',
+                       tcp.window,
+                       dict(tcp.options).get("MSS", 0) if tcp.flags.S else 0)
 
-        if packet.seq > self.ack:
-            self.logger.info("Received future packet with seq %s != %s", packet.seq, self.ack)
-            return False
+    def start_bg_sniffer(self, timeout: Optional[int] = None) -> List[Packet]:
+        """
+        Sniffs a given number of packets.
 
-        if packet.seq < self.ack:
-            if packet.seq + TestServer.packet_length(packet) == self.ack:
-                # duplicate packet
-                self.logger.info("Got duplicate packet %s != %s", packet.seq, self.ack)
-                return True
-            self.logger.info("Received past packet with seq %s != %s", packet.seq, self.ack)
-            return False
+        """
+        self.logger.info("Starting sniffing with the %s decoder..", self.decoder)
 
-        return True
+        self.stop_bg_sniffer()
+
+        if self.decoder == "raw":
+            self.start_capture_thread(timeout)
+            return
+
+        min_port, max_port = self.port_range
+        layers = scapy_layers()
+
+        def pkt_filter(pkt: Packet) -> bool:
+            return layers.TCP in pkt and \
+                    pkt.sport >= min_port and \
+                    pkt.sport <= max_port and \
+                    pkt[layers.IP].src == self.sut_ip
+
+        sniffer_args = {}
+        if self.kernel_filter:
+            self.capture_socket = self.open_filtered_socket()
+
+        if self.capture_socket:
+            sniffer_args["opened_socket"] = self.capture_socket
+        else:
+            sniffer_args["iface"] = self.ts_iface
+            sniffer_args["lfilter"] = pkt_filter
+
+        if timeout is not None:
+            sniffer_args["timeout"] = timeout
+
+        self.bg_sniffer = layers.AsyncSniffer(
+            count=0,
+            store=False,
+            prn=lambda packet: self.handle_receive_command(TestServer.segment_from_packet(packet)),
+            **sniffer_args)
 
-    def validate_packet_ack(self, packet: Packet) -> bool:
+        self.bg_sniffer.start()
+
+    def start_capture_thread(self, timeout: Optional[int] = None) -> None:
         """
-        Validates the acknowledgement number of a given packet.
+        Captures frames on a raw socket, or packets on the TUN device, in a background thread
+        and decodes them with ``decode_frame``. With the process capture, the thread decodes the frames
+        that the capture process leaves in its ring buffer.
         """
-        if self.ack == -1:
-            # first packet received in a new connection
-            # so the other party does not know our seq
-            return True
+        self.capture_stop = Event()
+        if self.capture == "process":
+            if self.tun:
+                source = ("tun", self.tun.fd)
+                link_offset = 0
+            else:
+                source = ("iface", self.ts_iface, self.sut_ip, self.port_range, self.kernel_filter)
+                link_offset = ETH_HEADER_LEN
+            self.capture_process = CaptureProcess(source, self.capture_ring_size)
+            self.capture_thread = Thread(target=self.ring_loop,
+                                         args=(self.capture_process, link_offset, self.capture_stop, timeout),
+                                         daemon=True)
+            self.capture_thread.start()
+            return
 
-        if packet.ack > self.seq:
-            self.logger.info("Received packet with future ack %s != %s", packet.ack, self.seq)
-            return False
+        if self.capture == "mmap":
+            program = sut_tcp_filter(self.sut_ip, *self.port_range) if self.kernel_filter else None
+            self.capture_ring = TpacketRing(self.ts_iface, self.capture_ring_size, program=program)
+            self.capture_thread = Thread(target=self.block_loop,
+                                         args=(self.capture_ring, self.capture_stop, timeout),
+                                         daemon=True)
+            self.capture_thread.start()
+            return
 
-        if packet.ack < self.seq:
-            self.logger.info("Received packet with past ack %s != %s", packet.ack, self.seq)
-            return False
-        return True
+        if self.tun:
+            def read_frame(buffer: bytearray) -> int:
+                return self.tun.read_into(buffer, CAPTURE_POLL_INTERVAL)
+            link_offset = 0
+        else:
+            read_frame = self.open_capture_socket()
+            link_offset = ETH_HEADER_LEN
 
+        self.capture_thread = Thread(target=self.capture_loop,
+                                     args=(read_frame, link_offset, self.capture_stop, timeout),
+                                     daemon=True)
+        self.capture_thread.start()
 
-    def start_bg_sniffer(self, timeout: Optional[int] = None) -> List[Packet]:
+    def open_capture_socket(self) -> Callable[[bytearray], int]:
         """
-        Sniffs a given number of packets.
+        Opens a raw capture socket on the TestServer's interface, with a kernel BPF filter if enabled.
 
+        :return: A function that reads one received frame into a buffer and returns its size,
+                 or 0 if no frame arrived in time or the frame was sent by this host.
         """
-        self.logger.info("Starting sniffing..")
-
-        def pkt_filter(pkt: Packet) -> bool:
-            return TCP in pkt and \
-                    pkt.sport >= 10000 and \
-                    pkt.sport <= 12000 and \
-                    pkt[IP].src == self.ip.dst
+        capture_socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        capture_socket.bind((self.ts_iface, ETH_P_ALL))
+        if self.kernel_filter:
+            try:
+                attach_filter(capture_socket, sut_tcp_filter(self.sut_ip, *self.port_range))
+            except OSError as err:
+                self.logger.warning("Could not attach kernel filter, using the Python filter: %s", err)
+        capture_socket.settimeout(CAPTURE_POLL_INTERVAL)
+        self.capture_socket = capture_socket
+
+        def read_frame(buffer: bytearray) -> int:
+            try:
+                size, address = capture_socket.recvfrom_into(buffer)
+            except socket.timeout:
+                return 0
+            return 0 if address[2] == socket.PACKET_OUTGOING else size
+
+        return read_frame
+
+    def capture_loop(self,
+                     read_frame: Callable[[bytearray], int],
+                     link_offset: int,
+                     stop: Event,
+                     timeout: Optional[int] = None) -> None:
+        """
+        Reads frames until the capture is stopped or the timeout expires.
+        Segments of the SUT are handed to ``handle_receive_command``.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        buffer = bytearray(SNAP_LEN)
+        view = memoryview(buffer)
+
+        while not stop.is_set():
+            try:
+                size = read_frame(buffer)
+            except OSError:
+                # The socket was closed.
+                break
+
+            if not size:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                continue
+            self.handle_frame(view[:size], link_offset)
+
+    def ring_loop(self,
+                  capture_process: CaptureProcess,
+                  link_offset: int,
+                  stop: Event,
+                  timeout: Optional[int] = None) -> None:
+        """
+        Decodes the frames of the capture process in place until the capture is stopped, the timeout expires
+        or the capture process exits.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def handle(frame: memoryview) -> None:
+            self.handle_frame(frame, link_offset)
+
+        while not stop.is_set():
+            if capture_process.drain(handle, CAPTURE_POLL_INTERVAL):
+                continue
+            if not capture_process.alive():
+                self.logger.error("The capture process exited, no more segments are captured")
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+    def block_loop(self,
+                   capture_ring: TpacketRing,
+                   stop: Event,
+                   timeout: Optional[int] = None) -> None:
+        """
+        Decodes the blocks of the TPACKET_V3 ring in place until the capture is stopped or the timeout expires.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not stop.is_set():
+            try:
+                count = capture_ring.read_blocks(self.handle_block, CAPTURE_POLL_INTERVAL)
+            except OSError:
+                # The socket was closed.
+                break
+            if not count and deadline is not None and time.monotonic() >= deadline:
+                break
+
+    def handle_block(self, frames: List[memoryview]) -> None:
+        """
+        Decodes the frames of a block and hands the SUT's segments to ``handle_receive_batch``.
+        """
+        received = time.monotonic_ns()
+        min_port, max_port = self.port_range
+        sut_ip = self.sut_ip
+        segments = []
+        for frame in frames:
+            segment = decode_frame(frame, ETH_HEADER_LEN)
+            # Also checked in Python, in case the kernel filter could not be attached.
+            if segment and min_port <= segment.sport <= max_port and segment.src_ip == sut_ip:
+                segments.append(segment)
+        if segments:
+            self.metrics.record("ts.decode", received)
+            self.handle_receive_batch(segments)
+            self.metrics.record("ts.receive", received)
+
+    def handle_frame(self, frame: memoryview, link_offset: int) -> None:
+        """
+        Decodes a captured frame and hands a segment of the SUT to ``handle_receive_command``.
+        """
+        received = time.monotonic_ns()
+        segment = decode_frame(frame, link_offset)
+        min_port, max_port = self.port_range
+        # Also checked in Python, in case the kernel filter could not be attached.
+        if segment and min_port <= segment.sport <= max_port and segment.src_ip == self.sut_ip:
+            self.metrics.record("ts.decode", received)
+            self.handle_receive_command(segment)
+            self.metrics.record("ts.receive", received)
+
+    def open_filtered_socket(self) -> Optional[SuperSocket]:
+        """
+        Opens a capture socket on the TestServer's interface with a kernel BPF filter for the SUT's segments.
 
-        if self.bg_sniffer:
-            self.bg_sniffer.stop(join=True)
-            self.bg_sniffer = None
+        :return: The socket, or None if the filter cannot be attached on this platform.
+        """
+        try:
+            capture_socket = scapy_layers().conf.L2listen(iface=self.ts_iface)
+        except OSError as err:
+            self.logger.warning("Could not open capture socket, using the Python filter: %s", err)
+            return None
 
-        self.bg_sniffer = AsyncSniffer(
-            count=0,
-            store=False,
-            iface=self.ts_iface,
-            lfilter=pkt_filter,
-            prn=self.handle_receive_command,
-            timeout=timeout)
+        try:
+            attach_filter(capture_socket.ins, sut_tcp_filter(self.sut_ip, *self.port_range))
+        except (OSError, AttributeError) as err:
+            self.logger.warning("Could not attach kernel filter, using the Python filter: %s", err)
+            capture_socket.close()
+            return None
 
-        self.bg_sniffer.start()
+        return capture_socket
 
     def stop_bg_sniffer(self):
         if self.bg_sniffer:
             self.bg_sniffer.stop(join=True)
             self.bg_sniffer = None
+        if self.capture_thread:
+            self.capture_stop.set()
+            self.capture_thread.join()
+            self.capture_thread = None
+        if self.capture_process:
+            self.logger.info("Capture process: %s", self.capture_process.report())
+            self.capture_process.close()
+            self.capture_process = None
+        if self.capture_ring:
+            self.logger.info("mmap capture: %s", self.capture_ring.report())
+            self.capture_ring.close()
+            self.capture_ring = None
+        if self.capture_socket:
+            self.capture_socket.close()
+            self.capture_socket = None
+
+    def capture_report(self) -> str:
+        """
+        Summarizes the frames captured and dropped by the capture process.
+        """
+        if self.capture_process:
+            return self.capture_process.report()
+        if self.capture_ring:
+            return self.capture_ring.report()
+        return f"{self.decoder} decoder captures in a thread"
+
+    def start_session(self, mbt_client: TextIO) -> None:
+        """
+        Starts a new session on another MBT channel after ``end_session``. Capturing, the sockets, the TUN
+        device and the codec caches of the previous session are kept.
 
-    def send(self, packet: Packet, update_seq: bool = True) -> None:
+        :param mbt_client: The MBT channel of the new session.
         """
-        Sends a given packet and optionally updates the TestServer's internal sequence number afterwards.
+        self.listen_probe.delays.clear()
+        self.mbt_client = mbt_client
+        self.mbt_writer = MbtWriter(mbt_client, self.mbt_writer.queue.maxsize, self.metrics)
+
+    def end_session(self) -> None:
+        """
+        Writes the pending abstract packets of the session and forgets its connections.
+        Segments that arrive until the next session starts are not forwarded.
+        """
+        self.mbt_writer.close()
+        with self.lock:
+            self.reset()
+
+    def close(self) -> None:
+        """
+        Stops capturing and releases the sockets and the TUN device of the TestServer.
+        """
+        self.stop_bg_sniffer()
+        self.mbt_writer.close()
+        self.send_engine.close()
+        if self.listen_probe.engine:
+            self.listen_probe.engine.close()
+        if self.tun:
+            self.tun.close()
+
+    def send(self, packet: Packet, connection: Optional[Connection] = None) -> None:
+        """
+        Sends a given packet and optionally updates the sequence number of its connection afterwards.
 
         :param packet: The packet to send.
-        :param update_seq: Whether the packet's sequence number should be updated after it is send.
+        :param connection: The connection whose sequence number should be updated after the packet is send.
+
+        :return: None
+        """
+        self.send_engine.send_raw(scapy_layers().raw(packet))
+        if connection:
+            connection.update_sequence_num(TestServer.packet_length(packet))
+
+    def send_segment(self,
+                     connection: Connection,
+                     payload: Union[bytes, memoryview],
+                     seq: int,
+                     ack: int,
+                     flags: str,
+                     update_seq: bool = True) -> None:
+        """
+        Sends a segment on a connection through the send engine's header template,
+        without building a scapy packet.
+
+        :param connection: The connection to send the segment on.
+        :param payload: The payload of the segment.
+        :param seq: The sequence number of the segment.
+        :param ack: The acknowledgement number of the segment.
+        :param flags: The flags of the segment.
+        :param update_seq: Whether the connection's sequence number should be updated after it is send.
 
         :return: None
         """
-        send(packet)
+        if (connection.sport, connection.dport) != (self.send_engine.sport, self.send_engine.dport):
+            self.send_engine.set_ports(connection.sport, connection.dport)
+
+        options = mss_option(self.mss) if "S" in flags else b''
+        self.send_engine.send(seq, max(ack, 0), flags_to_bits(flags), payload, options)
         if update_seq:
-            self.update_sequence_num(packet)
+            connection.update_sequence_num(TestServer.segment_length(payload, flags))
+            if "F" in flags:
+                connection.fin_seq = connection.seq
+
+    def send_segmented(self,
+                       connection: Connection,
+                       payload: bytes,
+                       ack: int,
+                       flags: str,
+                       seq: Optional[int] = None) -> None:
+        """
+        Sends a payload that is larger than the maximum segment size in several segments from the connection's
+        sequence number on, as far as the SUT's receive window allows. Waits for the window with the lock
+        released, so that the SUT's acknowledgements can be processed. The syn (S) flag is only set on the first
+        segment and the fin (F) flag only on the last one.
+
+        :param connection: The connection to send the payload on.
+        :param payload: The payload.
+        :param ack: The acknowledgement number of the segments.
+        :param flags: The flags of the payload.
+        :param seq: The sequence number of the first segment if the payload carries invalid numbers. The segments
+                    are then sent without waiting for the window and the connection's sequence number is kept.
+        """
+        size = min(connection.peer_mss, self.mss)
+        if seq is not None:
+            view = memoryview(payload)
+            for offset in range(0, len(payload), size):
+                chunk = view[offset:offset + size]
+                segment_flags = "".join(f for f in flags if (f != "S" or not offset) and
+                                        (f != "F" or offset + size >= len(payload)))
+                self.send_segment(connection, chunk, seq, ack, segment_flags, update_seq=False)
+                seq += TestServer.segment_length(chunk, segment_flags)
+            return
+
+        start = connection.seq
+        connection.segmented = (start, start + TestServer.segment_length(payload, flags))
+        view = memoryview(payload)
+        offset = 0
+        while offset < len(payload):
+            if not self.window_update.wait_for(lambda: connection.usable_window(connection.seq) != 0 or
+                                               connection.closed,
+                                               self.window_timeout):
+                self.logger.warning("The SUT's window stayed closed for %s s, sent %s of %s bytes",
+                                    self.window_timeout, offset, len(payload))
+                connection.segmented = (start, connection.seq)
+                return
+            if connection.closed:
+                self.logger.warning("Connection %s was reset, sent %s of %s bytes", connection.key, offset,
+                                    len(payload))
+                return
+            window = connection.usable_window(connection.seq)
+            chunk = min(size, len(payload) - offset, size if window is None else max(window, 0))
+            if not chunk:
+                # acknowledged beyond what was sent, wait for a consistent window
+                self.window_update.wait(self.window_timeout)
+                continue
+            last = offset + chunk == len(payload)
+            segment_flags = "".join(f for f in flags if (f != "S" or not offset) and (f != "F" or last))
+            self.send_segment(connection, view[offset:offset + chunk], connection.seq, ack, segment_flags)
+            offset += chunk
 
     def make_packet(self,
+                    connection: Connection,
                     payload: Optional[bytes] = None,
                     seq: Optional[int] = None,
                     ack: Optional[int] = None,
                     flags: Optional[str] = None) -> Packet:
         """
-        Creates a new packet from TCP header properties and payload.
+        Creates a new packet on a connection from TCP header properties and payload.
 
+        :param connection: The connection whose ports and sequence state the packet uses.
         :param payload: Optional payload for the packet.
         :param seq: Optional sequence number for the packet.
         :param ack: Optional acknowledgement number for the packet.
@@ -185,109 +621,207 @@ class TestServer:
 
         :return: The newly created packet.
         """
-        packet_ack = self.ack if ack is None else ack
+        packet_ack = connection.ack if ack is None else ack
         packet_ack = max(packet_ack, 0)
-        pkt = self.ip / TCP(sport=self.sport,
-                            dport=self.dport,
-                            seq=(self.seq if seq is None else seq),
-                            ack=packet_ack,
-                            flags=(flags or ""))
+        layers = scapy_layers()
+        pkt = layers.IP(dst=self.sut_ip) / layers.TCP(sport=connection.sport,
+                                                      dport=connection.dport,
+                                                      seq=(connection.seq if seq is None else seq),
+                                                      ack=packet_ack,
+                                                      flags=(flags or ""))
         if payload:
-            pkt = pkt / Raw(load=payload)
+            pkt = pkt / layers.Raw(load=payload)
 
         return pkt
 
+    def retire(self, connection: Connection) -> None:
+        """
+        Marks a connection as closed after a RST or once both fins are acknowledged. It is kept, so that late
+        segments of the SUT are still abstracted, until a SYN reuses its ports or it is evicted.
+        """
+        if connection.closed:
+            return
+        self.logger.info("Connection %s ended", connection.key)
+        connection.closed = True
+        self.window_update.notify_all()
+
+    def opens_connection(self, packet: TCPPacket) -> bool:
+        """
+        Whether a packet of the model opens a new connection: a SYN as ``isSyn`` of the model accepts it,
+        on ports without a connection or with a closed one. Other SYNs are sent with the numbers of the
+        connection they belong to.
+        """
+        return packet.flags == TCPFlag.SYN and not packet.payload and \
+            packet.seq == SEQ.SEQ_VALID and packet.ack == ACK.ACK_VALID and \
+            not self.connections.is_open(self.connection_key(packet.sport, packet.dport))
+
     def handle_send_command(self, packet: TCPPacket):
+        if self.opens_connection(packet):
+            # Opening a new connection, the SUT has to listen before the SYN arrives.
+            # Waits without the lock, as the sniffer reports the SUT's answers to the probes.
+            start = time.monotonic_ns()
+            self.listen_probe.wait_until_listening(packet.dport)
+            self.metrics.record("ts.listen_wait", start)
+
+        start = time.monotonic_ns()
         with self.lock:
+            self.metrics.record("ts.send_lock", start)
             return self._handle_send_command(packet)
 
     def _handle_send_command(self, packet: TCPPacket):
         """
         Sends a given packet to the TCP endpoint for which the TestServer stubs a communication partner.
         """
+        start = time.monotonic_ns()
         self.logger.info("Sending packet: %s", packet)
 
         update_seq=True
 
-        if packet.sport != self.sport or \
-           packet.dport != self.dport:
-            self.reset()
-            self.sport = packet.sport
-            self.dport = packet.dport
-            time.sleep(2)
+        key = self.connection_key(packet.sport, packet.dport)
+        connection = self.connections.get(key)
+        # A SYN opens a new connection, also when the model reuses the ports of a closed one.
+        if not connection or self.opens_connection(packet):
+            self.logger.info("Opening connection %s", key)
+            connection = self.connections.open(key)
 
         if packet.seq == SEQ.SEQ_VALID:
-            sequenceno = self.seq
+            sequenceno = connection.seq
         else:
             sequenceno = randint(3000000, 5999999)
             update_seq = False
 
         if packet.ack == ACK.ACK_VALID:
-            ackno = self.ack
+            ackno = connection.ack
         else:
             ackno = randint(3000000, 5999999)
             update_seq = False
 
-
-        pkt = self.make_packet(
-            payload=packet.payload,
-            seq=sequenceno,
-            ack=ackno,
-            flags=list(map(lambda f: f.name[0], packet.flags))
-        )
-
-        self.send(pkt, update_seq=update_seq)
+        flags = packet.flags.letters()
+        connection.segmented = None
+        start = self.metrics.record("ts.prepare", start)
+        if len(packet.payload) > min(connection.peer_mss, self.mss):
+            # Segments with invalid numbers start at the random sequence number.
+            self.send_segmented(connection, packet.payload, ackno, flags, None if update_seq else sequenceno)
+        else:
+            self.send_segment(
+                connection,
+                payload=packet.payload,
+                seq=sequenceno,
+                ack=ackno,
+                flags=flags,
+                update_seq=update_seq
+            )
+        self.metrics.record("ts.send", start)
+
+        if packet.ack == ACK.ACK_VALID and TCPFlag.ACK in packet.flags:
+            connection.acknowledge_peer_fin(ackno)
+        if (packet.seq == SEQ.SEQ_VALID and TCPFlag.RST in packet.flags) or connection.finished:
+            self.retire(connection)
 
         self.logger.info("Packet was sent")
 
-    def handle_receive_command(self, packet: Packet):
+    def handle_receive_command(self, segment: Segment):
+        if segment.dport == self.listen_probe.port:
+            self.listen_probe.handle_reply(segment.sport, segment.ack, segment.flags)
+            return None
+
+        start = time.monotonic_ns()
         with self.lock:
-            return self._handle_receive_command(packet)
+            self.metrics.record("ts.receive_lock", start)
+            raw = self._handle_receive_command(segment)
+        # Outside of the lock, so that a slow MBT channel only holds up the capture when the queue is full.
+        if raw is not None:
+            self.mbt_writer.put(raw)
+        return None
+
+    def handle_receive_batch(self, segments: List[Segment]) -> None:
+        """
+        Handles the segments of a captured block, with one acquisition of the lock for all of them.
+        """
+        probe_port = self.listen_probe.port
+        for segment in segments:
+            if segment.dport == probe_port:
+                self.listen_probe.handle_reply(segment.sport, segment.ack, segment.flags)
 
-    def _handle_receive_command(self, packet: Packet):
+        lines = []
+        start = time.monotonic_ns()
+        with self.lock:
+            self.metrics.record("ts.receive_lock", start)
+            for segment in segments:
+                if segment.dport != probe_port:
+                    raw = self._handle_receive_command(segment)
+                    if raw is not None:
+                        lines.append(raw)
+        # Outside of the lock, as in handle_receive_command.
+        for raw in lines:
+            self.mbt_writer.put(raw)
+
+    def _handle_receive_command(self, segment: Segment) -> Optional[str]:
         """
         Receives a single packet from the TCP endpoint for which the TestServer stubs a communication partner.
+
+        :return: The abstract packet for the MBT channel, None if the packet is not intended for the TestServer.
         """
+        start = time.monotonic_ns()
 
         self.logger.info("Received a packet")
 
-        if (self.sport != packet.dport or self.dport != packet.sport) and \
-           "S" in packet.sprintf("%TCP.flags%"):
-            self.logger.info("Received syn packet %s", packet.__repr__())
-            self.reset()
-            self.sport = packet.dport
-            self.dport = packet.sport
+        key = (segment.dst_ip, segment.dport, segment.src_ip, segment.sport)
+        connection = self.connections.get(key)
 
-        if packet.dport != self.sport or \
-           packet.sport != self.dport:
-            self.logger.info("Received packet not intended for us %s", packet.__repr__())
-            return
+        # A SYN of the SUT opens a new connection, unless it repeats the SYN of the current one.
+        if (not connection and segment.flags & TCP_FLAG_BITS["S"]) or \
+           (segment.flags == TCP_FLAG_BITS["S"] and (connection.closed or connection.ack != segment.seq + 1)):
+            self.logger.info("Received syn packet %s", segment)
+            connection = self.connections.open(key)
+
+        if not connection:
+            self.logger.info("Received packet not intended for us %s", segment)
+            return None
+
+        if segment.mss:
+            connection.peer_mss = segment.mss
+        if segment.flags & TCP_FLAG_BITS["A"]:
+            connection.update_window(segment.ack, segment.window)
+            self.window_update.notify_all()
+            if segment.flags == TCP_FLAG_BITS["A"] and not segment.payload and connection.absorbs(segment.ack):
+                self.logger.info("Acknowledgement %s of part of a segmented payload", segment.ack)
+                return None
+
+        length = segment.length
 
-        if self.validate_packet_seq(packet):
+        if connection.validate_packet_seq(segment.seq, length):
             seq_status = SEQ.SEQ_VALID
         else:
             seq_status = SEQ.SEQ_INVALID
 
-        if self.validate_packet_ack(packet):
+        if connection.validate_packet_ack(segment.ack):
             ack_status = ACK.ACK_VALID
         else:
             ack_status = ACK.ACK_INVALID
 
         if ack_status == ACK.ACK_VALID and \
            seq_status == SEQ.SEQ_VALID and \
-           packet.seq >= self.ack:
-            self.update_ack_num(packet)
+           segment.seq >= connection.ack:
+            connection.update_ack_num(segment.seq, length)
+            if segment.flags & TCP_FLAG_BITS["F"]:
+                connection.peer_fin_seq = connection.ack
+        if ack_status == ACK.ACK_VALID and segment.flags & TCP_FLAG_BITS["A"]:
+            connection.acknowledge_fin(segment.ack)
+        if (seq_status == SEQ.SEQ_VALID and segment.flags & TCP_FLAG_BITS["R"]) or connection.finished:
+            self.retire(connection)
 
         abs_packet = TCPPacket(
-            sport=packet["TCP"].sport,
-            dport=packet["TCP"].dport,
+            sport=segment.sport,
+            dport=segment.dport,
             seq=seq_status,
             ack=ack_status,
-            flags=list(map(TCPFlag, filter(lambda t: t in ["S", "F", "A", "R" ], packet.sprintf("%TCP.flags%")))),
-            payload=packet[Raw].load if Raw in packet else b''
+            flags=model_flags(segment.flags),
+            payload=segment.payload
         )
+        start = self.metrics.record("ts.abstract", start)
 
         raw = abs_packet.to_torxakis()
+        self.metrics.record("ts.encode", start)
         self.logger.info("Forwarding packet: %s", raw)
-        self.mbt_client.write(raw + "\n")
-        self.mbt_client.flush()
+        return raw
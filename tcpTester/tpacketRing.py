@@ -0,0 +1,138 @@
+import mmap
+import select
+import socket
+import struct
+from typing import Callable, Dict, List, Optional
+
+from tcpTester.bpf import Instruction, attach_filter
+from tcpTester.captureRing import DEFAULT_RING_SIZE, ETH_P_ALL, PACKET_STATISTICS, SOL_PACKET
+
+# Values from linux/if_packet.h
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+DEFAULT_BLOCK_SIZE = 1 << 18  # in bytes, a multiple of the page size
+FRAME_SIZE = 1 << 11  # in bytes, only a hint for TPACKET_V3, whose frames have variable lengths
+BLOCK_TIMEOUT = 1  # in milliseconds, after which the kernel hands over a block that is not full
+
+# struct tpacket_req3
+_REQUEST = struct.Struct("=7I")
+# struct tpacket_block_desc: the status, and the number of frames and the offset of the first one
+_BLOCK_STATUS = struct.Struct("=8xI")
+_BLOCK_HEADER = struct.Struct("=12xII")
+# struct tpacket3_hdr: offset of the next frame, captured length and offset of the link layer header
+_FRAME_HEADER = struct.Struct("=I8xI8xH")
+# the sll_pkttype of the struct sockaddr_ll after the 48 bytes of the frame header
+_FRAME_PKTTYPE = 48 + 10
+# struct tpacket_stats_v3
+_STATS = struct.Struct("=III")
+
+
+class TpacketRing:
+    """
+    Captures frames on an interface through an AF_PACKET socket with a TPACKET_V3 receive ring, which the
+    kernel shares with the process: the kernel fills whole blocks of frames, and every block is read
+    in place and handed back with a single write of its status, instead of one ``recv`` per frame.
+    """
+
+    def __init__(self,
+                 iface: str,
+                 ring_size: int = DEFAULT_RING_SIZE,
+                 block_size: int = DEFAULT_BLOCK_SIZE,
+                 program: Optional[List[Instruction]] = None):
+        """
+        Opens the socket, maps its ring and starts capturing.
+
+        :param iface: The interface to capture on.
+        :param ring_size: The size of the ring, in bytes, rounded down to whole blocks.
+        :param block_size: The size of a block, a multiple of the page size.
+        :param program: A BPF program that the kernel runs on every frame before it is put in the ring.
+        """
+        self.block_size = block_size
+        self.block_count = max(ring_size // block_size, 2)
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            if program:
+                attach_filter(self.sock, program)
+            self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                                 _REQUEST.pack(block_size, self.block_count, FRAME_SIZE,
+                                               block_size // FRAME_SIZE * self.block_count, BLOCK_TIMEOUT, 0, 0))
+            self.ring = mmap.mmap(self.sock.fileno(), block_size * self.block_count,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            self.sock.bind((iface, ETH_P_ALL))
+        except OSError:
+            self.sock.close()
+            raise
+        self.view = memoryview(self.ring)
+        self.block = 0
+        self.frames = 0
+        self.blocks = 0
+        self.kernel_drops = 0
+        self.poll = select.poll()
+        self.poll.register(self.sock, select.POLLIN | select.POLLERR)
+
+    def read_blocks(self, handle: Callable[[List[memoryview]], None], timeout: float) -> int:
+        """
+        Hands the frames of every block that the kernel handed over to ``handle``, one list per block,
+        and waits up to ``timeout`` for a block if there is none. The frames are only valid during the call.
+        Frames sent by this host are skipped.
+
+        :return: The number of frames.
+        """
+        count = 0
+        waited = False
+        view = self.view
+        while True:
+            start = self.block * self.block_size
+            if not _BLOCK_STATUS.unpack_from(view, start)[0] & TP_STATUS_USER:
+                if count or waited or not self.poll.poll(timeout * 1000):
+                    return count
+                waited = True
+                continue
+
+            frames = []
+            number, offset = _BLOCK_HEADER.unpack_from(view, start)
+            offset += start
+            for _ in range(number):
+                next_offset, snap_len, mac = _FRAME_HEADER.unpack_from(view, offset)
+                if view[offset + _FRAME_PKTTYPE] != socket.PACKET_OUTGOING:
+                    frames.append(view[offset + mac:offset + mac + snap_len])
+                offset += next_offset
+            if frames:
+                handle(frames)
+            count += len(frames)
+            self.frames += len(frames)
+            self.blocks += 1
+            frames.clear()
+            _BLOCK_STATUS.pack_into(view, start, TP_STATUS_KERNEL)
+            self.block = (self.block + 1) % self.block_count
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the frames and blocks read and the frames that the kernel dropped as the ring was full.
+        """
+        # reading the statistics resets them
+        _, drops, _ = _STATS.unpack(self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, _STATS.size))
+        self.kernel_drops += drops
+        return {"captured": self.frames, "blocks": self.blocks, "kernel_drops": self.kernel_drops}
+
+    def report(self) -> str:
+        """
+        Summarizes the captured and dropped frames.
+        """
+        stats = self.stats()
+        return f"{stats['captured']} frames captured in {stats['blocks']} blocks, " \
+               f"{stats['kernel_drops']} dropped by the kernel"
+
+    def close(self) -> None:
+        """
+        Unmaps the ring and closes the socket.
+        """
+        self.poll.unregister(self.sock)
+        self.view.release()
+        self.ring.close()
+        self.sock.close()
@@ -0,0 +1,111 @@
+import fcntl
+import os
+import select
+import socket
+import struct
+from typing import Optional, Union
+
+# Values from linux/if_tun.h and linux/sockios.h
+TUNSETIFF = 0x400454ca
+IFF_TUN = 0x0001
+IFF_NO_PI = 0x1000
+SIOCGIFFLAGS = 0x8913
+SIOCSIFFLAGS = 0x8914
+SIOCSIFADDR = 0x8916
+SIOCSIFDSTADDR = 0x8918
+SIOCSIFMTU = 0x8922
+IFF_UP = 0x0001
+IFF_RUNNING = 0x0040
+
+DEFAULT_MTU = 1500  # in bytes
+TUN_DEVICE = "/dev/net/tun"
+
+# struct ifreq: interface name followed by a 24 byte union
+_IFREQ_FLAGS = struct.Struct("16sH22x")
+_IFREQ_ADDR = struct.Struct("16sHH4s16x")
+_IFREQ_INT = struct.Struct("16si20x")
+
+
+class TunTransport:
+    """
+    A point-to-point TUN device whose far end is the TestServer.
+
+    The host side of the device gets the SUT's address and the peer address is the TestServer's. Segments
+    that the SUT sends to the TestServer are routed into the device and read from its file descriptor;
+    segments written to the descriptor arrive at the SUT as if they came in from a network. As the
+    TestServer's address is not local to the host, the host's TCP stack never answers segments meant for
+    the TestServer, so the SUT and the TestServer can run on the same host.
+    """
+
+    def __init__(self, name: str, sut_ip: str, ts_ip: str, mtu: int = DEFAULT_MTU):
+        """
+        Creates and configures the TUN device, it is removed again when it is closed.
+
+        :param name: The name of the device.
+        :param sut_ip: The address of the host side of the device, used by the SUT.
+        :param ts_ip: The peer address of the device, used by the TestServer.
+        :param mtu: The MTU of the device.
+        """
+        self.name = name
+        self.sut_ip = sut_ip
+        self.ts_ip = ts_ip
+
+        self.fd = os.open(TUN_DEVICE, os.O_RDWR)
+        try:
+            ifreq = fcntl.ioctl(self.fd, TUNSETIFF, _IFREQ_FLAGS.pack(name.encode(), IFF_TUN | IFF_NO_PI))
+            self.name = ifreq[:16].rstrip(b"\0").decode()
+            self.configure(mtu)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def configure(self, mtu: int) -> None:
+        """
+        Assigns the addresses and the MTU to the device and brings it up.
+        """
+        name = self.name.encode()
+        control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            fcntl.ioctl(control, SIOCSIFADDR,
+                        _IFREQ_ADDR.pack(name, socket.AF_INET, 0, socket.inet_aton(self.sut_ip)))
+            fcntl.ioctl(control, SIOCSIFDSTADDR,
+                        _IFREQ_ADDR.pack(name, socket.AF_INET, 0, socket.inet_aton(self.ts_ip)))
+            fcntl.ioctl(control, SIOCSIFMTU, _IFREQ_INT.pack(name, mtu))
+
+            flags = _IFREQ_FLAGS.unpack(fcntl.ioctl(control, SIOCGIFFLAGS, _IFREQ_FLAGS.pack(name, 0)))[1]
+            fcntl.ioctl(control, SIOCSIFFLAGS, _IFREQ_FLAGS.pack(name, flags | IFF_UP | IFF_RUNNING))
+        finally:
+            control.close()
+
+    def write(self, packet: Union[bytes, memoryview]) -> int:
+        """
+        Injects an IP packet, which the host receives as if it came from the TestServer.
+
+        :return: The number of bytes written.
+        """
+        return os.write(self.fd, packet)
+
+    def read_into(self, buffer: bytearray, timeout: Optional[float] = None) -> int:
+        """
+        Reads one IP packet that the host sent to the TestServer.
+
+        :param buffer: The buffer that receives the packet.
+        :param timeout: The maximum time to wait for a packet, None waits indefinitely.
+
+        :return: The size of the packet, 0 if no packet arrived in time.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return 0
+        return os.readv(self.fd, [buffer])
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self) -> None:
+        """
+        Closes the file descriptor, which removes the device.
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
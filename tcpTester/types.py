@@ -1,21 +1,31 @@
 from __future__ import annotations
-from typing import Optional, Union, List
-from dataclasses import dataclass
-from enum import Enum
-from copy import deepcopy
+import re
+from typing import Dict, List, NamedTuple, Optional, Union, Tuple
+from enum import Enum, IntFlag
 
-DEFAULT_TIMEOUT = 20  # in seconds
+from tcpTester.lruCache import LruCache
 
-class WithShow:
-    def __str__(self):
-        state = deepcopy(self.__dict__)
-        for k, v in state.items():
-            if hasattr(v, '__str__'):
-                state[k] = v.__str__()
-        return str(state)
+DEFAULT_TIMEOUT = 20  # in seconds
 
-    def __repr__(self):
-        return self.__str__()
+# Range of ports (inclusive) that the model uses for the SUT's side of a connection.
+MIN_PORT = 10000
+MAX_PORT = 12000
+
+
+def _show(value: NamedTuple) -> str:
+    """
+    Represents a value of the types below for logs: enums by their name, without copying anything.
+    """
+    fields = []
+    for name, field in zip(value._fields, value):
+        if isinstance(field, TCPFlag):
+            field = "|".join(flag.name for flag in field.members()) or "NIL"
+        elif isinstance(field, Enum):
+            field = field.name
+        else:
+            field = repr(field)
+        fields.append(f"{name}={field}")
+    return f"{type(value).__name__}({', '.join(fields)})"
 
 class ParseException(Exception):
     pass
@@ -23,6 +33,53 @@ class ParseException(Exception):
 class UserException(Exception):
     pass
 
+# Quoted strings may contain commas, brackets and backslash-escaped characters.
+_STRING_RE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_OPEN_RE = re.compile(r'\s+\(')
+_UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def tokenize_torxakis(structure: str) -> List[str]:
+    """
+    Splits a Torxakis value into constructor openings (``CONS(``), atoms, commas and closing brackets.
+    Quoted strings become a single token starting with ``"`` and carrying the unescaped text.
+
+    :param structure: The Torxakis representation of the value.
+
+    :return: The list of tokens.
+    """
+    if '\\' in structure:
+        parts = _STRING_RE.split(structure)
+        if any('"' in code for code in parts[::2]):
+            raise ParseException(f"Unterminated string in: {structure}")
+    else:
+        parts = structure.split('"')
+        if not len(parts) & 1:
+            raise ParseException(f"Unterminated string in: {structure}")
+
+    tokens: List[str] = []
+    last = len(parts) - 1
+    for index in range(0, last + 1, 2):
+        code = parts[index]
+        if ' (' in code:
+            code = _OPEN_RE.sub('(', code)
+        tokens += code.replace(',', ' , ').replace('(', '( ').replace(')', ' ) ').split()
+        if index < last:
+            string = parts[index + 1]
+            tokens.append('"' + (_UNESCAPE_RE.sub(r'\1', string) if '\\' in string else string))
+    return tokens
+
+
+def quote_torxakis(payload: bytes) -> str:
+    """
+    Encodes a payload as a quoted Torxakis string.
+    """
+    text = payload.decode()
+    if '"' in text or '\\' in text:
+        text = text.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
 class CommandType(Enum):
     LISTEN = 0
     CONNECT = 1
@@ -65,150 +122,273 @@ class ACK(Enum):
     def to_torxakis(self):
         return self.name
 
-class TCPFlag(Enum):
-    ACK = "A"
-    FIN = "F"
-    RST = "R"
-    SYN = "S"
+class TCPFlag(IntFlag):
+    """
+    A set of the TCP flags of the model, with the bits of the flags byte of the TCP header.
+    """
+    FIN = 0x01
+    SYN = 0x02
+    RST = 0x04
+    ACK = 0x10
 
     @staticmethod
     def from_torxakis(structure: str):
         return TCPFlag[structure.strip()]
 
-    def to_torxakis(self):
-        return self.name
-
-    def __lt__(self, other):
-        return self.name < other.name
+    @staticmethod
+    def from_bits(bits: int) -> TCPFlag:
+        """
+        Returns the flags of the model in the flags byte of a TCP header, ignoring the others.
+        """
+        return _FLAG_SETS[bits & 0xff]
+
+    def members(self) -> List[TCPFlag]:
+        """
+        Returns the flags in the set, in the ascending alphabetical order of the model.
+        """
+        return _FLAG_MEMBERS[self]
+
+    def letters(self) -> str:
+        """
+        Returns the flags as letters, as scapy and ``flags_to_bits`` use them, e.g. ``"AS"``.
+        """
+        return _FLAG_LETTERS[self]
 
-@dataclass
-class UserCallResult(WithShow):
+    def to_torxakis(self):
+        """
+        Returns the set as a TCPFlagList of the model.
+        """
+        return _FLAG_LISTS[self]
+
+# Plain dicts for name lookups on the decoding hot path; ``Enum.__getitem__`` is comparatively slow.
+_SEQS = dict(SEQ.__members__)
+_ACKS = dict(ACK.__members__)
+_TCP_FLAG_BITS = {name: int(flag) for name, flag in TCPFlag.__members__.items()}
+
+# Every flags byte maps to a precomputed set, as combining IntFlag members goes through the enum machinery.
+_MODEL_BITS = int(TCPFlag.FIN | TCPFlag.SYN | TCPFlag.RST | TCPFlag.ACK)
+_FLAG_SETS = [TCPFlag(bits & _MODEL_BITS) for bits in range(256)]
+_ALPHABETICAL = sorted(TCPFlag.__members__.values(), key=lambda flag: flag.name)
+_FLAG_MEMBERS: Dict[TCPFlag, List[TCPFlag]] = {
+    flags: [flag for flag in _ALPHABETICAL if flags & flag] for flags in _FLAG_SETS
+}
+_FLAG_LETTERS = {flags: "".join(flag.name[0] for flag in members) for flags, members in _FLAG_MEMBERS.items()}
+_FLAG_LISTS = {
+    flags: "".join(f"CONS({flag.name}, " for flag in members) + "NIL" + ")" * len(members)
+    for flags, members in _FLAG_MEMBERS.items()
+}
+
+# The commas between the sport, dport, seq, ack and flags fields of a tokenized TCPPacket.
+_FIELD_SEPARATORS = [","] * 4
+
+# A test run exchanges the same few payload-free messages over and over (handshakes, ACKs, FINs and the
+# results and calls of the SUT adapter), so both directions of the codec remember them. Messages with a
+# payload are rarely repeated and are not cached, so that they do not evict the recurring ones.
+CODEC_CACHES: Dict[str, LruCache] = {
+    "packet_decode": LruCache(),
+    "packet_encode": LruCache(),
+    "user_call_decode": LruCache(),
+    "result_encode": LruCache(),
+}
+_PACKET_DECODE = CODEC_CACHES["packet_decode"]
+_PACKET_ENCODE = CODEC_CACHES["packet_encode"]
+_USER_CALL_DECODE = CODEC_CACHES["user_call_decode"]
+_RESULT_ENCODE = CODEC_CACHES["result_encode"]
+
+
+def codec_cache_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Returns the size, the hits, the misses, the evictions and the hit ratio of every codec cache.
+    """
+    return {name: cache.stats() for name, cache in CODEC_CACHES.items()}
+
+
+def codec_cache_report() -> str:
+    """
+    Summarizes the hits, misses and evictions of every codec cache that was used.
+    """
+    used = [f"{name}: {cache.report()}" for name, cache in CODEC_CACHES.items() if cache.hits or cache.misses]
+    return "codec caches " + "; ".join(used) if used else "codec caches unused"
+
+
+def resize_codec_caches(max_size: int) -> None:
+    """
+    Changes the maximum number of entries of every codec cache, 0 disables caching.
+    """
+    for cache in CODEC_CACHES.values():
+        cache.resize(max_size)
+
+class UserCallResult(NamedTuple):
     status: UserCallResultType
     payload: Optional[bytes] = None
 
-    def to_torxakis(self):
-        status = self.status.to_torxakis()
-        payload = '""' if not self.payload else '"' + self.payload.decode() + '"'
+    __repr__ = _show
 
-        if self.status in [UserCallResultType.SUCCESS, UserCallResultType.FAILURE]:
-            return status
+    def to_torxakis(self):
+        if self.payload:
+            return f"{self.status.to_torxakis()}({quote_torxakis(self.payload)})"
 
-        return f"{status}({payload})"
+        line = _RESULT_ENCODE.get(self)
+        if line is None:
+            status = self.status.to_torxakis()
+            line = status if self.status is not UserCallResultType.RECEIVE else f"{status}(\"\")"
+            _RESULT_ENCODE.put(self, line)
+        return line
 
-@dataclass
-class SendParameters(WithShow):
+class SendParameters(NamedTuple):
     payload: bytes
 
-@dataclass
-class ListenParameters(WithShow):
+    __repr__ = _show
+
+class ListenParameters(NamedTuple):
     src_port: int
 
-@dataclass
-class ConnectParameters(WithShow):
+    __repr__ = _show
+
+class ConnectParameters(NamedTuple):
     dst_port: int
 
+    __repr__ = _show
+
+class ReceiveParameters(NamedTuple):
+    # number of bytes to wait for, a plain RECEIVE returns what is available
+    length: int
+
+    __repr__ = _show
+
 Parameters = Union[ListenParameters,
                    ConnectParameters,
                    SendParameters,
+                   ReceiveParameters,
                    None]
 
-@dataclass
-class UserCall(WithShow):
+class UserCall(NamedTuple):
     command_type: CommandType
     command_parameters: Parameters = None
 
+    __repr__ = _show
+
     @staticmethod
     def from_torxakis(structure: str):
-        structure = structure.strip()
-        if structure.startswith("LISTEN"):
-            port = int(structure[7:-1])
-            return UserCall(CommandType["LISTEN"], ListenParameters(port))
+        call = _USER_CALL_DECODE.get(structure)
+        if call is None:
+            call = UserCall._parse(structure)
+            if call.command_type is not CommandType.SEND:
+                _USER_CALL_DECODE.put(structure, call)
+        return call
+
+    @staticmethod
+    def _parse(structure: str):
+        tokens = tokenize_torxakis(structure)
 
-        if structure.startswith("CONNECT"):
-            dst_port = int(structure[8:-1])
-            return UserCall(CommandType["CONNECT"], ConnectParameters(dst_port))
+        if tokens in (["RECEIVE"], ["CLOSE"]):
+            return UserCall(CommandType[tokens[0]])
 
-        if structure.startswith("SEND"):
-            payload = bytes(structure[5:-1].replace('"', '').encode())
-            return UserCall(CommandType["SEND"], SendParameters(payload))
+        if len(tokens) != 3 or tokens[2] != ")":
+            raise ParseException(f"UserCall has format: {structure}")
 
-        if structure.startswith("RECEIVE"):
-            return UserCall(CommandType["RECEIVE"])
+        name, argument = tokens[0], tokens[1]
+        try:
+            if name == "LISTEN(":
+                return UserCall(CommandType.LISTEN, ListenParameters(int(argument)))
 
-        if structure.startswith("CLOSE"):
-            return UserCall(CommandType["CLOSE"])
+            if name == "CONNECT(":
+                return UserCall(CommandType.CONNECT, ConnectParameters(int(argument)))
+
+            if name == "RECEIVE(" and int(argument) > 0:
+                return UserCall(CommandType.RECEIVE, ReceiveParameters(int(argument)))
+        except ValueError as exc:
+            raise ParseException(f"UserCall has format: {structure}") from exc
+
+        if name == "SEND(" and argument[0] == '"':
+            return UserCall(CommandType.SEND, SendParameters(argument[1:].encode()))
 
         raise ParseException(f"UserCall has format: {structure}")
 
-@dataclass
-class TCPPacket(WithShow):
+class TCPPacket(NamedTuple):
     sport: int
     dport: int
     seq: SEQ
     ack: ACK
-    flags: List[TCPFlag]
+    flags: TCPFlag
     payload: bytes
 
-    @staticmethod
-    def _to_tcp_flag_list(flags: List[TCPFlag]) -> str:
-        if not flags:
-            return "NIL"
-
-        x = flags[0].to_torxakis()
-        xs = TCPPacket._to_tcp_flag_list(flags[1:])
-        return f"CONS({x}, {xs})"
+    __repr__ = _show
 
     @staticmethod
-    def _from_tcp_flag_list(structure: str) -> List[TCPFlag]:
-        structure = structure.strip()
+    def _flags_from_tokens(tokens: List[str], start: int) -> Tuple[TCPFlag, int]:
+        """
+        Decodes the TCPFlagList that begins at ``tokens[start]``.
+
+        :return: The flags and the index of the first token after the list.
+        """
+        bits = 0
+        end = start
+        while tokens[end] == "CONS(":
+            if tokens[end + 2] != ",":
+                raise ParseException(f"TCPFlagList has format: {' '.join(tokens[start:])}")
+            bits |= _TCP_FLAG_BITS[tokens[end + 1]]
+            end += 3
+
+        count = (end - start) // 3
+        if tokens[end] != "NIL" or tokens[end + 1:end + 1 + count] != [")"] * count:
+            raise ParseException(f"TCPFlagList has format: {' '.join(tokens[start:])}")
+        return _FLAG_SETS[bits], end + 1 + count
 
-        if structure == "NIL":
-            return []
-
-        header = structure[0:4]
-        if header != "CONS":
+    @staticmethod
+    def _from_tcp_flag_list(structure: str) -> TCPFlag:
+        tokens = tokenize_torxakis(structure)
+        try:
+            flags, end = TCPPacket._flags_from_tokens(tokens, 0)
+        except (IndexError, KeyError) as exc:
+            raise ParseException(f"TCPFlagList has format: {structure}") from exc
+        if end != len(tokens):
             raise ParseException(f"TCPFlagList has format: {structure}")
-
-        structure = structure[5:-1]
-        x = TCPFlag.from_torxakis(structure[0:structure.find(',')])
-        xs = TCPPacket._from_tcp_flag_list(structure[structure.find(',')+1:])
-
-        xs.insert(0,x)
-        return xs
+        return flags
 
     @staticmethod
     def from_torxakis(structure: str) -> TCPPacket:
-        structure = structure.strip()
-
-        header = structure[0:9]
-        if header != "TCPPacket":
-            raise ParseException(f"TCPPacket has format: {structure}")
-
-        tokens = filter(lambda t: t, structure[10:-1].split(','))
-        sport = int(next(tokens))
-        dport = int(next(tokens))
-        seq = SEQ.from_torxakis(next(tokens))
-        ack = ACK.from_torxakis(next(tokens))
-
-        rest = ','.join(tokens).strip()
-        if rest.startswith("NIL"):
-            tokens = filter(lambda t: t, rest.split(','))
-            flags = TCPPacket._from_tcp_flag_list(next(tokens))
-            payload = bytes(next(tokens).replace('"', '').strip().encode())
-        else:
-            bracket_index = rest.rindex(')', 0, len(rest) -1)
-            raw_flags = rest[0: bracket_index +1]
-            flags = TCPPacket._from_tcp_flag_list(raw_flags)
-            raw_payload = rest[bracket_index + 2:]
-            payload = bytes(raw_payload.replace('"', '').strip().encode())
+        packet = _PACKET_DECODE.get(structure)
+        if packet is None:
+            packet = TCPPacket._parse(structure)
+            if not packet.payload:
+                _PACKET_DECODE.put(structure, packet)
+        return packet
 
-        return TCPPacket(sport, dport, seq, ack, flags, payload)
+    @staticmethod
+    def _parse(structure: str) -> TCPPacket:
+        tokens = tokenize_torxakis(structure)
+        try:
+            if tokens[0] != "TCPPacket(" or tokens[2:9:2] != _FIELD_SEPARATORS:
+                raise ParseException(f"TCPPacket has format: {structure}")
+
+            flags, end = TCPPacket._flags_from_tokens(tokens, 9)
+            if len(tokens) != end + 3 or tokens[end] != "," or \
+               tokens[end + 1][0] != '"' or tokens[end + 2] != ")":
+                raise ParseException(f"TCPPacket has format: {structure}")
+
+            return TCPPacket(int(tokens[1]),
+                             int(tokens[3]),
+                             _SEQS[tokens[5]],
+                             _ACKS[tokens[7]],
+                             flags,
+                             tokens[end + 1][1:].encode())
+        except (IndexError, KeyError, ValueError) as exc:
+            raise ParseException(f"TCPPacket has format: {structure}") from exc
 
     def to_torxakis(self):
-        self.flags.sort()
+        if self.payload:
+            return self._encode()
+
+        line = _PACKET_ENCODE.get(self)
+        if line is None:
+            line = self._encode()
+            _PACKET_ENCODE.put(self, line)
+        return line
 
+    def _encode(self) -> str:
         seq = self.seq.to_torxakis()
         ack = self.ack.to_torxakis()
-        flags = TCPPacket._to_tcp_flag_list(self.flags)
-        payload = '"' + self.payload.decode() + '"'
+        flags = _FLAG_LISTS[self.flags]
+        payload = quote_torxakis(self.payload)
         return f"TCPPacket({self.sport}, {self.dport}, {seq}, {ack}, {flags}, {payload})"
@@ -1,4 +1,5 @@
 import logging
+from typing import List, Tuple
 from datetime import datetime
 from logging import Formatter, StreamHandler, INFO, WARNING
 from logging.handlers import RotatingFileHandler
@@ -34,3 +35,21 @@ def set_up_logging(log_dir_prefix: str, console_level, enable_file_logging: bool
 
         main_logger.addHandler(exp_file_handler)
         main_logger.addHandler(exp_errors_file_handler)
+
+
+def split_port_range(min_port: int, max_port: int, count: int) -> List[Tuple[int, int]]:
+    """
+    Splits an inclusive port range into ``count`` disjoint, inclusive ranges of (almost) equal size.
+
+    :param min_port: The lowest port of the range.
+    :param max_port: The highest port of the range.
+    :param count: The number of ranges.
+
+    :return: The ranges as (min_port, max_port) tuples.
+    """
+    size = max_port - min_port + 1
+    if count < 1 or count > size:
+        raise ValueError(f"Cannot split {size} ports into {count} ranges")
+
+    bounds = [min_port + size * i // count for i in range(count + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(count)]
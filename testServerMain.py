@@ -2,41 +2,121 @@
 # pylint: disable=duplicate-code
 
 import sys
+import signal
 import socket
+import time
+from typing import Optional, TextIO, Tuple
 
 import configparser
 import logging
 from termcolor import colored
 
 from tcpTester import set_up_logging
-from tcpTester.testServer import TestServer
-from tcpTester.types import TCPPacket
+from tcpTester.listenProbe import READY_PROBE_INTERVAL, READY_TIMEOUT
+from tcpTester.mbtWriter import MBT_QUEUE_SIZE
+from tcpTester.metrics import DEFAULT_REPORT_INTERVAL, Metrics, MetricsReporter
+from tcpTester.prewarm import prewarm
+from tcpTester.sendEngine import DEFAULT_WINDOW
+from tcpTester.captureRing import DEFAULT_RING_SIZE
+from tcpTester.testServer import CAPTURES, DECODERS, DEFAULT_MSS, TRANSPORTS, WINDOW_TIMEOUT, TestServer
+from tcpTester.types import MAX_PORT, MIN_PORT, TCPPacket, codec_cache_report
 
 LOG_PREFIX = "./test_server"
 
-def runner(ts_iface: str, sut_ip: str, mbt_port: int):
+def serve_session(ts: TestServer, mbt_file_client: TextIO, metrics: Metrics) -> None:
+    """
+    Sends the segments that Torxakis asks for until it closes the MBT connection.
+    """
+    while True:
+        raw = mbt_file_client.readline()
+        start = time.monotonic_ns()
+        if not raw:
+            break
+
+        if not raw.strip():
+            continue
+
+        logging.getLogger("TestServer").info("Got input: %s", raw)
+
+        parsing = time.monotonic_ns()
+        packet = TCPPacket.from_torxakis(raw)
+        parsed = metrics.record("ts.parse", parsing)
+        ts.handle_send_command(packet)
+        metrics.record("ts.send_command", parsed)
+        metrics.record("ts.step", start)
+
+def runner(ts_iface: str,
+           sut_ip: str,
+           mbt_port: int,
+           kernel_filter: bool = True,
+           ready_timeout: float = READY_TIMEOUT,
+           ready_probe_interval: float = READY_PROBE_INTERVAL,
+           port_range: Tuple[int, int] = (MIN_PORT, MAX_PORT),
+           decoder: str = "raw",
+           transport: str = "iface",
+           tun_ip: Optional[str] = None,
+           metrics: Optional[Metrics] = None,
+           mbt_queue_size: int = MBT_QUEUE_SIZE,
+           mss: int = DEFAULT_MSS,
+           window: int = DEFAULT_WINDOW,
+           window_timeout: float = WINDOW_TIMEOUT,
+           daemon: bool = False,
+           capture: str = "thread",
+           capture_ring_size: int = DEFAULT_RING_SIZE):
+    """
+    Serves one Torxakis session, or with ``daemon`` one session after the other. The TestServer is only
+    created for the first session, the next ones reuse its capture, sockets and caches.
+    """
+    metrics = metrics or Metrics(enabled=False)
+    ts = None
     try:
         mbt_server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         mbt_server.bind(("", mbt_port))
         mbt_server.listen(1)
-
-        (mbt_client, _) = mbt_server.accept()
-        mbt_file_client = mbt_client.makefile('wr')
-
-        ts = TestServer(ts_iface=ts_iface, sut_ip=sut_ip, mbt_client=mbt_file_client)
+        prewarm(sut_ip, ts_iface, transport, decoder)
 
         while True:
-            raw = mbt_file_client.readline()
-            if not raw:
-                break
+            logging.getLogger("TestServer").info("Waiting for the MBT connection on port %s", mbt_port)
+            (mbt_client, _) = mbt_server.accept()
+            mbt_file_client = mbt_client.makefile('wr')
 
-            if not raw.strip():
-                continue
+            if ts is None:
+                ts = TestServer(ts_iface=ts_iface,
+                                sut_ip=sut_ip,
+                                mbt_client=mbt_file_client,
+                                kernel_filter=kernel_filter,
+                                ready_timeout=ready_timeout,
+                                ready_probe_interval=ready_probe_interval,
+                                port_range=port_range,
+                                decoder=decoder,
+                                transport=transport,
+                                tun_ip=tun_ip,
+                                metrics=metrics,
+                                mbt_queue_size=mbt_queue_size,
+                                mss=mss,
+                                window=window,
+                                window_timeout=window_timeout,
+                                capture=capture,
+                                capture_ring_size=capture_ring_size)
+            else:
+                ts.start_session(mbt_file_client)
 
-            logging.getLogger("TestServer").info("Got input: %s", raw)
+            try:
+                serve_session(ts, mbt_file_client, metrics)
+            except OSError as os_err:
+                if not daemon:
+                    raise
+                logging.getLogger("TestServer").warning("Connection to the wbt failed - OSError: %s",
+                                                        os_err.strerror)
+            ts.end_session()
+            logging.getLogger("TestServer").info("Session ended: %s, %s, %s, %s", ts.listen_probe.report(),
+                                                 ts.mbt_writer.report(), codec_cache_report(), ts.capture_report())
+            mbt_file_client.close()
+            mbt_client.close()
+            if not daemon:
+                break
 
-            packet = TCPPacket.from_torxakis(raw)
-            ts.handle_send_command(packet)
+        ts.close()
 
     except OSError as os_err:
         logging.getLogger("TestServer").error("Connection to the wbt failed - OSError: %s", os_err.strerror)
@@ -81,6 +161,19 @@ if __name__ == "__main__":
         print(colored("Config file does no contain mbt port setting!", "red"))
         sys.exit(-1)
 
+    try:
+        port_range = (config["mbt"].getint("min_port", fallback=MIN_PORT),
+                      config["mbt"].getint("max_port", fallback=MAX_PORT))
+    except ValueError as exc:
+        print(colored("Config file contains an invalid mbt port range setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        daemon = config["mbt"].getboolean("daemon", fallback=False)
+    except ValueError as exc:
+        print(colored("Config file contains an invalid mbt daemon setting!", "red"))
+        sys.exit(-1)
+
     try:
         test_server_iface = config["test_server"]["iface"]
     except KeyError as exc:
@@ -93,4 +186,78 @@ if __name__ == "__main__":
         print(colored("Config file does no contain sut ipsetting!", "red"))
         sys.exit(-1)
 
-    runner(test_server_iface, sut_ip, mbt_port)
+    try:
+        kernel_filter = config["test_server"].getboolean("kernel_filter", fallback=True)
+        ready_timeout = config["test_server"].getfloat("ready_timeout", fallback=READY_TIMEOUT)
+        ready_probe_interval = config["test_server"].getfloat("ready_probe_interval", fallback=READY_PROBE_INTERVAL)
+        mbt_queue_size = config["test_server"].getint("mbt_queue_size", fallback=MBT_QUEUE_SIZE)
+        mss = config["test_server"].getint("mss", fallback=DEFAULT_MSS)
+        window = config["test_server"].getint("window", fallback=DEFAULT_WINDOW)
+        window_timeout = config["test_server"].getfloat("window_timeout", fallback=WINDOW_TIMEOUT)
+        capture_ring_size = config["test_server"].getint("capture_ring_size", fallback=DEFAULT_RING_SIZE)
+    except ValueError as exc:
+        print(colored("Config file contains an invalid test server setting!", "red"))
+        sys.exit(-1)
+
+    decoder = config["test_server"].get("decoder", fallback="raw")
+    if decoder not in DECODERS:
+        print(colored(f"Config file contains an invalid test server decoder, use one of {DECODERS}!", "red"))
+        sys.exit(-1)
+
+    transport = config["test_server"].get("transport", fallback="iface")
+    if transport not in TRANSPORTS:
+        print(colored(f"Config file contains an invalid test server transport, use one of {TRANSPORTS}!", "red"))
+        sys.exit(-1)
+
+    capture = config["test_server"].get("capture", fallback="thread")
+    if capture not in CAPTURES:
+        print(colored(f"Config file contains an invalid test server capture, use one of {CAPTURES}!", "red"))
+        sys.exit(-1)
+
+    tun_ip = config["test_server"].get("tun_ip")
+    if transport == "tun" and not tun_ip:
+        print(colored("Config file does not contain the test server tun_ip setting!", "red"))
+        sys.exit(-1)
+
+    try:
+        metrics_port = config.get("metrics", "port", fallback="")
+        metrics = Metrics(enabled=config.getboolean("metrics", "enabled", fallback=False))
+        reporter = MetricsReporter(metrics,
+                                   path=config.get("metrics", "file", fallback="") or None,
+                                   interval=config.getfloat("metrics", "interval", fallback=DEFAULT_REPORT_INTERVAL),
+                                   port=int(metrics_port) if metrics_port else None)
+    except ValueError as exc:
+        print(colored("Config file contains an invalid metrics setting!", "red"))
+        sys.exit(-1)
+
+    if metrics.enabled:
+        try:
+            reporter.start()
+        except OSError as err:
+            print(colored(f"Cannot serve the metrics: {err}", "red"))
+            sys.exit(-1)
+        # Exit through SystemExit on SIGTERM, so that the final metrics are written.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        runner(test_server_iface,
+               sut_ip,
+               mbt_port,
+               kernel_filter,
+               ready_timeout,
+               ready_probe_interval,
+               port_range,
+               decoder,
+               transport,
+               tun_ip,
+               metrics,
+               mbt_queue_size,
+               mss,
+               window,
+               window_timeout,
+               daemon,
+               capture,
+               capture_ring_size)
+    finally:
+        if metrics.enabled:
+            reporter.stop()